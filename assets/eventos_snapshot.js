@@ -0,0 +1,29 @@
+// Push de snapshots nuevos: el servidor avisa por /eventos (Server-Sent Events)
+// cada versión publicada y el Store 'senal-snapshot' dispara la recarga de datos.
+// El intervalo de 30 minutos queda solo como respaldo si el stream no funciona.
+
+(function() {
+    if (!window.EventSource) {
+        return;
+    }
+    let ultima_version = null;
+
+    function avisar(version) {
+        // El renderer de Dash puede no estar listo cuando llega el primer evento
+        if (!window.dash_clientside || !window.dash_clientside.set_props || !document.getElementById('live-update-time')) {
+            setTimeout(function() { avisar(version); }, 500);
+            return;
+        }
+        window.dash_clientside.set_props('senal-snapshot', {data: version});
+    }
+
+    const fuente = new EventSource('eventos');
+    fuente.addEventListener('snapshot', function(evento) {
+        const version = JSON.parse(evento.data).version;
+        // Al reconectar el servidor repite la versión vigente: solo se recarga si cambió
+        if (version !== ultima_version) {
+            ultima_version = version;
+            avisar(version);
+        }
+    });
+})();
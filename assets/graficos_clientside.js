@@ -0,0 +1,60 @@
+// Callbacks clientside del tablero: orden (FIJO/DESC) y formato (COUNT/PERCENT)
+// de los gráficos, aplicados sobre la figura base que ya mandó el servidor.
+// Las indicaciones de cada gráfico vienen en layout.meta (ver dashboard_v1.py).
+
+// Plotly serializa los arrays numéricos como {dtype, bdata} (base64)
+const TIPOS_BDATA = {
+    i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array,
+    i4: Int32Array, u4: Uint32Array, f4: Float32Array, f8: Float64Array
+};
+
+function a_lista(valores) {
+    if (!valores || valores.bdata === undefined) {
+        return valores;
+    }
+    const binario = atob(valores.bdata);
+    const bytes = new Uint8Array(binario.length);
+    for (let i = 0; i < binario.length; i++) {
+        bytes[i] = binario.charCodeAt(i);
+    }
+    return Array.from(new TIPOS_BDATA[valores.dtype](bytes.buffer));
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    graficos: {
+        aplicar_opcion: function(opcion, base) {
+            if (!base) {
+                return window.dash_clientside.no_update;
+            }
+            // Copia: la figura base del Store no se modifica
+            const fig = JSON.parse(JSON.stringify(base));
+            const meta = (fig.layout && fig.layout.meta) || null;
+            if (!meta) {
+                return fig; // Figura vacía ("Sin Datos..."): se muestra tal cual
+            }
+
+            if (meta.titulos && meta.titulos[opcion] !== undefined) {
+                fig.layout.title = Object.assign({}, fig.layout.title, {text: meta.titulos[opcion]});
+            }
+            if (meta.textinfo && meta.textinfo[opcion] !== undefined) {
+                fig.data.forEach(function(traza) { traza.textinfo = meta.textinfo[opcion]; });
+            }
+
+            if (meta.descendente === opcion && fig.data.length > 0) {
+                const traza = fig.data[0];
+                traza.x = a_lista(traza.x);
+                traza.y = a_lista(traza.y);
+                let indices = traza.y.map(function(_, i) { return i; });
+                if (meta.quitar_ceros) {
+                    indices = indices.filter(function(i) { return traza.y[i] > 0; });
+                }
+                // sort es estable: los empates conservan el orden fijo
+                indices.sort(function(a, b) { return traza.y[b] - traza.y[a]; });
+                traza.x = indices.map(function(i) { return traza.x[i]; });
+                traza.y = indices.map(function(i) { return traza.y[i]; });
+                fig.layout.shapes = []; // Las líneas guía solo tienen sentido en el orden fijo
+            }
+            return fig;
+        }
+    }
+});
@@ -0,0 +1,167 @@
+"""
+Tiempo de arranque en frío del tablero hasta la primera respuesta útil.
+
+Cada corrida es un proceso nuevo que importa dashboard_v1 y le pide al servidor
+Flask (test client, sin red) lo mismo que un navegador al abrir el tablero:
+el índice, el layout y las dependencias, los datos (update_data_and_kpis con
+una clave de snapshot, no "Cargando datos...") y todos los gráficos de la vista
+por defecto. Se mide desde que arranca el intérprete:
+
+  - import: importar dashboard_v1
+  - fabrica: crear_app() (precarga del snapshot, figuras y Dash)
+  - indice / layout / datos / graficos: cada respuesta, acumulado
+
+Con --modo preload se imita gunicorn --preload: import + crear_app() en el
+proceso padre, fork, y las respuestas se miden en el hijo (también desde el fork).
+
+La primera corrida arranca sin snapshot en disco (modo local: lee el archivo
+sintético); las siguientes encuentran el snapshot que dejó la anterior.
+
+    python benchmarks/bench_arranque.py --filas 50k --corridas 5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DIR_BENCH = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIR_BENCH)
+HITOS = ['import', 'fabrica', 'indice', 'layout', 'datos', 'graficos']
+# Gráficos que dependen solo de la vista (la torta de tipificaciones y los tiempos de respuesta se piden aparte)
+GRAFICOS_VISTA = ['graph-diaria-mes.figure', 'base-graph-canal-torta.data', 'base-graph-dia-semana.data',
+                  'base-graph-hora-creacion.data', 'base-graph-hora-asignacion.data', 'graph-status.figure',
+                  'graph-ventas-agrupadas.figure', 'graph-ranking-pv.figure']
+
+def salida_del_callback(ids):
+    """ Formato de 'output' que manda el renderer de Dash para uno o varios Outputs. """
+    if len(ids) == 1:
+        return ids[0]
+    return '..' + '...'.join(ids) + '..'
+
+def pedir_callback(cliente, outputs, inputs, state=()):
+    cuerpo = {
+        'output': salida_del_callback(outputs),
+        'outputs': [{'id': o.split('.')[0], 'property': o.split('.')[1]} for o in outputs],
+        'inputs': [{'id': i, 'property': p, 'value': v} for i, p, v in inputs],
+        'state': [{'id': i, 'property': p, 'value': v} for i, p, v in state],
+        'changedPropIds': [f"{i}.{p}" for i, p, _ in inputs],
+    }
+    if len(outputs) == 1:
+        cuerpo['outputs'] = cuerpo['outputs'][0]
+    respuesta = cliente.post('/_dash-update-component', json=cuerpo)
+    if respuesta.status_code != 200:
+        raise RuntimeError(f"{cuerpo['output']}: HTTP {respuesta.status_code}")
+    return respuesta.get_json()['response']
+
+def primeras_respuestas(tablero, t0, marcas):
+    """ Pide lo mismo que el navegador al abrir el tablero y anota cuándo llega cada cosa. """
+    cliente = tablero.server.test_client()
+    cliente.get('/')
+    marcas['indice'] = time.time() - t0
+    cliente.get('/_dash-layout')
+    cliente.get('/_dash-dependencies')
+    marcas['layout'] = time.time() - t0
+
+    outputs = ['df-storage.data', 'meta-pv-storage.data', 'live-update-time.children',
+               'graph-conversion-wp.figure', 'simulated-date-storage.data'] + [f"{i}.children" for i in tablero.TEXTOS_KPI]
+    clave = None
+    while clave is None: # Hasta que haya datos: mientras tanto el tablero muestra "Cargando datos..."
+        respuesta = pedir_callback(cliente, outputs,
+                                   [('interval-component', 'n_intervals', 0), ('senal-snapshot', 'data', None)],
+                                   [('df-storage', 'data', None)])
+        clave = respuesta.get('df-storage', {}).get('data')
+        if clave is None:
+            time.sleep(0.05)
+    marcas['datos'] = time.time() - t0
+
+    vista = tablero.update_vista(clave, None, None)
+    for grafico in GRAFICOS_VISTA:
+        pedir_callback(cliente, [grafico], [('vista-storage', 'data', vista)])
+    pedir_callback(cliente, ['graph-tipificacion-torta.figure'],
+                   [('radio-tipificacion-display', 'value', 'FIJO'), ('vista-storage', 'data', vista),
+                    ('simulated-date-storage', 'data', respuesta['simulated-date-storage']['data'])])
+    pedir_callback(cliente, ['graph-latencias.figure'],
+                   [('radio-latencia-metrica', 'value', 'asignacion'), ('radio-latencia-dimension', 'value', 'hora'),
+                    ('vista-storage', 'data', vista)])
+    marcas['graficos'] = time.time() - t0
+
+def hijo(modo, t0):
+    """ Una corrida: imprime un JSON con los hitos en segundos desde el arranque del intérprete. """
+    sys.path.insert(0, RAIZ)
+    marcas = {}
+    import dashboard_v1 as tablero
+    marcas['import'] = time.time() - t0
+    if hasattr(tablero, 'crear_app'):
+        tablero.crear_app()
+    marcas['fabrica'] = time.time() - t0
+
+    if modo == 'preload':
+        lectura, escritura = os.pipe()
+        if os.fork() == 0:
+            os.close(lectura)
+            t_fork = time.time()
+            primeras_respuestas(tablero, t0, marcas)
+            marcas['post_fork'] = {h: marcas[h] - (t_fork - t0) for h in ('indice', 'layout', 'datos', 'graficos')}
+            os.write(escritura, json.dumps(marcas).encode())
+            os._exit(0)
+        os.close(escritura)
+        with os.fdopen(lectura) as f:
+            marcas = json.loads(f.read())
+        os.wait()
+    else:
+        primeras_respuestas(tablero, t0, marcas)
+    print('RESULTADO ' + json.dumps(marcas))
+
+def correr(modo, directorio):
+    entorno = dict(os.environ, DASHBOARD_SNAPSHOT_DIR=os.path.join(directorio, 'cache'))
+    entorno.pop('HIBOT_APP_ID', None) # Modo local: lee el archivo sintético
+    entorno.pop('HIBOT_APP_SECRET', None)
+    t0 = time.time()
+    proceso = subprocess.run([sys.executable, os.path.abspath(__file__), '--hijo', modo, '--t0', repr(t0)],
+                             cwd=directorio, env=entorno, capture_output=True, text=True)
+    for linea in proceso.stdout.splitlines():
+        if linea.startswith('RESULTADO '):
+            return json.loads(linea[len('RESULTADO '):])
+    raise RuntimeError(f"La corrida falló:\n{proceso.stderr[-2000:]}")
+
+def imprimir(titulo, corridas):
+    print(f"  {titulo} ({len(corridas)} corrida{'s' if len(corridas) > 1 else ''})")
+    for hito in HITOS:
+        print(f"    {hito:<10} {statistics.median(c[hito] for c in corridas) * 1000:8.0f} ms")
+    if 'post_fork' in corridas[0]:
+        textos = ', '.join(f"{h} {statistics.median(c['post_fork'][h] for c in corridas) * 1000:.0f} ms" for h in corridas[0]['post_fork'])
+        print(f"    en el worker, desde el fork: {textos}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Arranque en frío del tablero hasta la primera respuesta útil.")
+    parser.add_argument('--filas', default='50k', help="Conversaciones del archivo local sintético (ej.: 10k, 200k)")
+    parser.add_argument('--corridas', type=int, default=5)
+    parser.add_argument('--modo', choices=['import', 'preload'], nargs='+', default=['import', 'preload'])
+    parser.add_argument('--hijo', choices=['import', 'preload'], help=argparse.SUPPRESS)
+    parser.add_argument('--t0', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        hijo(args.hijo, args.t0)
+        sys.exit(0)
+
+    # bench_dashboard no se importa: importaría el tablero en este proceso
+    sys.path.insert(0, DIR_BENCH)
+    from generar_conversaciones import generar_conversaciones
+    filas = int(float(args.filas.lower().rstrip('km')) * {'k': 1_000, 'm': 1_000_000}.get(args.filas.lower()[-1], 1))
+
+    with tempfile.TemporaryDirectory(prefix='bench_arranque_') as directorio:
+        with open(os.path.join(directorio, 'yesterday_sample.json'), 'w', encoding='utf-8') as f:
+            json.dump(generar_conversaciones(filas), f)
+        for modo in args.modo:
+            print(f"\n=== modo {modo} ===")
+            shutil.rmtree(os.path.join(directorio, 'cache'), ignore_errors=True)
+            corridas = [correr(modo, directorio) for _ in range(args.corridas)]
+            imprimir('sin snapshot en disco', corridas[:1])
+            if len(corridas) > 1:
+                imprimir('con snapshot en disco', corridas[1:])
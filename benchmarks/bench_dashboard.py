@@ -0,0 +1,229 @@
+"""
+Benchmark del pipeline del tablero sobre conversaciones sintéticas (ver generar_conversaciones.py).
+
+Para cada tamaño mide:
+  - procesar_dataframe (JSON crudo -> DataFrame compacto)
+  - calcular_kpis (bloque de KPIs de cargar_datos_y_calcular_kpis, incluye el cubo)
+  - parse_df_from_store (clave del Store -> DataFrame del snapshot)
+  - cada Callback de gráfico, en frío (sin caché de figuras) y en caliente (caché compartida)
+  - memoria pico (tracemalloc) de procesar + KPIs, tamaño del Store y del snapshot en disco
+
+Los resultados se guardan en benchmarks/resultados/<fecha>.json; con --comparar se
+contrastan contra una corrida anterior y se marcan las etapas que empeoraron más
+que la tolerancia (el código de salida es 1 si hubo regresiones).
+
+    python benchmarks/bench_dashboard.py --tamanos 10k 100k 1M
+    python benchmarks/bench_dashboard.py --tamanos 10k 100k --comparar benchmarks/resultados/base.json
+
+5M filas necesita del orden de 10 GB de RAM solo para la lista de diccionarios crudos.
+"""
+import argparse
+import gc
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# El snapshot y el histórico del benchmark no deben pisar los del tablero real
+os.environ.setdefault("DASHBOARD_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="bench_dashboard_"))
+os.environ["DASHBOARD_REFRESCO_EN_FONDO"] = "0" # El benchmark publica sus propios snapshots
+os.environ.pop("HIBOT_APP_ID", None)
+os.environ.pop("HIBOT_APP_SECRET", None)
+
+import pandas as pd
+import numpy as np
+
+import dashboard_v1 as tablero
+from generar_conversaciones import generar_conversaciones
+
+DIR_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+TAMANOS_POR_DEFECTO = ['10k', '100k', '1M']
+
+# Callback -> argumentos de control (además de la vista) con los que se mide
+CALLBACKS_GRAFICOS = {
+    'update_graph_diaria': [()],
+    'update_graph_canal': [()],
+    'update_graph_dia_semana': [()],
+    'update_graph_hora_creacion': [()],
+    'update_graph_hora_asignacion': [()],
+    'update_graph_status': [()],
+    'update_graph_tipificacion_torta': [('HOY',), ('MES',)],
+    'update_graph_ventas_agrupadas': [()],
+    'update_graph_ranking_pv': [()],
+    'update_graph_latencias': [('asignacion', 'hora'), ('respuesta', 'pv')],
+}
+
+def parsear_tamano(texto):
+    """ '10k' -> 10000, '1M' -> 1000000. """
+    texto = texto.strip().lower()
+    multiplicador = {'k': 1_000, 'm': 1_000_000}.get(texto[-1], 1)
+    return int(float(texto.rstrip('km')) * multiplicador)
+
+def medir(funcion, repeticiones):
+    """ Ejecuta funcion() 'repeticiones' veces; devuelve (último resultado, estadísticas en segundos). """
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        gc.collect()
+        t_inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - t_inicio)
+    return resultado, {'mediana_s': statistics.median(tiempos), 'min_s': min(tiempos), 'repeticiones': repeticiones}
+
+def memoria_pico_mb(funcion):
+    """ Memoria pico (MB) asignada durante funcion(), según tracemalloc (numpy/pandas incluidos). """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return pico / (1024 * 1024)
+
+def llamar_argumentos(nombre, vista, controles, fecha_simulada):
+    # La torta de tipificaciones recibe además la fecha simulada de 'hoy'
+    if nombre == 'update_graph_tipificacion_torta':
+        return controles + (vista, fecha_simulada)
+    return controles + (vista,)
+
+def bench_tamano(filas, repeticiones, semilla):
+    print(f"\n=== {filas:,} filas ===")
+    t_inicio = time.perf_counter()
+    crudo = generar_conversaciones(filas, semilla)
+    print(f"Generadas en {time.perf_counter() - t_inicio:.1f}s")
+    desde = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    etapas = {}
+
+    df, etapas['procesar_dataframe'] = medir(lambda: tablero.procesar_dataframe(crudo, reportar=False, desde=desde), repeticiones)
+    etapas['procesar_dataframe']['filas_por_s'] = len(crudo) / etapas['procesar_dataframe']['mediana_s']
+
+    hoy_fecha = df['created'].max().date() # Igual que el modo local: 'hoy' es el último día con datos
+    kpis, etapas['calcular_kpis'] = medir(lambda: tablero.calcular_kpis(df, hoy_fecha), repeticiones)
+
+    memoria = memoria_pico_mb(lambda: tablero.calcular_kpis(tablero.procesar_dataframe(crudo, reportar=False, desde=desde), hoy_fecha))
+    del crudo
+    gc.collect()
+
+    datos = {'df': df, **kpis, 'meta_pv_acumulada': 0, 'fecha_simulada': hoy_fecha,
+             'sync_watermark': None, 'sync_completo': None, 'sync_desde': None}
+    snap = tablero.publicar_snapshot(datos)
+    clave = tablero.clave_snapshot(snap)
+    _, etapas['parse_df_from_store'] = medir(lambda: tablero.parse_df_from_store(clave), repeticiones)
+
+    vista = tablero.update_vista(clave, None, None)
+    fecha_simulada = hoy_fecha.strftime('%Y-%m-%d')
+    bytes_figuras = 0
+    for nombre, variantes in CALLBACKS_GRAFICOS.items():
+        callback = getattr(tablero, nombre)
+        sin_cache = inspect.unwrap(callback)
+        for controles in variantes:
+            args = llamar_argumentos(nombre, vista, controles, fecha_simulada)
+            etiqueta = nombre + ''.join(f"[{c}]" for c in controles)
+            fig, etapas[f'{etiqueta} (frío)'] = medir(lambda: sin_cache(*args), repeticiones)
+            callback(*args) # Carga la caché de figuras
+            _, etapas[f'{etiqueta} (caché)'] = medir(lambda: callback(*args), repeticiones)
+            bytes_figuras += len(fig.to_json())
+
+    ruta_snapshot = os.path.join(tablero.SNAPSHOT_DIR, f"snapshot-{snap['version']}.arrow")
+    resultado = {
+        'filas': filas,
+        'filas_mes': len(df),
+        'etapas': etapas,
+        'memoria_pico_mb': memoria,
+        'bytes_por_fila_df': tablero.memoria_por_fila(df),
+        'store_bytes': len(json.dumps(clave)),
+        'snapshot_disco_bytes': os.path.getsize(ruta_snapshot) if os.path.exists(ruta_snapshot) else None,
+        'figuras_json_bytes': bytes_figuras,
+    }
+    for etapa, medida in etapas.items():
+        print(f"  {etapa:<55} {medida['mediana_s'] * 1000:10.1f} ms")
+    print(f"  memoria pico: {memoria:.0f} MB | Store: {resultado['store_bytes']} B | "
+          f"snapshot en disco: {(resultado['snapshot_disco_bytes'] or 0) / 1e6:.1f} MB")
+    return resultado
+
+def comparar(actual, anterior, tolerancia, minimo_ms):
+    """
+    Imprime la relación actual/anterior por etapa y devuelve la lista de regresiones.
+    Una etapa empeora si supera la tolerancia relativa y además tarda al menos minimo_ms
+    más (las etapas de microsegundos, como las lecturas de caché, son puro ruido).
+    """
+    regresiones = []
+    print(f"\n=== Comparación (tolerancia {tolerancia:.0%}) ===")
+    for filas, res in actual['resultados'].items():
+        previo = anterior.get('resultados', {}).get(filas)
+        if previo is None:
+            continue
+        print(f"-- {int(filas):,} filas")
+        for etapa, medida in res['etapas'].items():
+            if etapa not in previo['etapas']:
+                continue
+            anterior_s = previo['etapas'][etapa]['mediana_s']
+            relacion = medida['mediana_s'] / max(anterior_s, 1e-9)
+            marca = ''
+            if relacion > 1 + tolerancia and (medida['mediana_s'] - anterior_s) * 1000 >= minimo_ms:
+                marca = '  <-- REGRESIÓN'
+                regresiones.append((filas, etapa, relacion))
+            print(f"  {etapa:<55} x{relacion:5.2f}{marca}")
+        if previo.get('memoria_pico_mb'):
+            relacion = res['memoria_pico_mb'] / previo['memoria_pico_mb']
+            marca = ''
+            if relacion > 1 + tolerancia:
+                marca = '  <-- REGRESIÓN'
+                regresiones.append((filas, 'memoria_pico_mb', relacion))
+            print(f"  {'memoria pico':<55} x{relacion:5.2f}{marca}")
+    return regresiones
+
+def version_git():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, text=True).strip()
+    except Exception:
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del tablero sobre conversaciones sintéticas.")
+    parser.add_argument('--tamanos', nargs='+', default=TAMANOS_POR_DEFECTO, help="Ej.: 10k 100k 1M 5M")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default=None, help="Archivo de resultados (por defecto, benchmarks/resultados/<fecha>.json)")
+    parser.add_argument('--comparar', default=None, help="Resultados de una corrida anterior para detectar regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.15)
+    parser.add_argument('--minimo-ms', type=float, default=1.0, help="Diferencia absoluta mínima para contar una regresión")
+    args = parser.parse_args()
+
+    resultados = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'git': version_git(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'maquina': f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPU)",
+        'resultados': {},
+    }
+    for tamano in args.tamanos:
+        filas = parsear_tamano(tamano)
+        resultados['resultados'][str(filas)] = bench_tamano(filas, args.repeticiones, args.semilla)
+
+    salida = args.salida or os.path.join(DIR_RESULTADOS, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en '{salida}'.")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia, args.minimo_ms)
+        if regresiones:
+            print(f"{len(regresiones)} regresiones por encima de la tolerancia.")
+            sys.exit(1)
@@ -0,0 +1,96 @@
+"""
+Generador de conversaciones sintéticas con la forma de la API de Hibot.
+
+Produce la misma estructura que devuelve /conversations (campos anidados
+'channel', 'agent' y 'user', fechas en milisegundos epoch, agentes "Rxx - Nombre"
+o "VD - Nombre", tipificaciones, dirección, estado y 'assigned'), distribuida
+dentro del mes en curso con más volumen en horario comercial.
+
+Uso desde línea de comandos (por ejemplo, para armar el archivo de desarrollo local):
+    python benchmarks/generar_conversaciones.py --filas 50000 --salida yesterday_sample.json
+"""
+import argparse
+import json
+from datetime import datetime
+
+import numpy as np
+
+# Como los devuelve la API: procesar_dataframe los pasa a 'WhatsApp', 'Mercado Libre', etc.
+CANALES = ['WHATSAPP', 'FACEBOOK', 'INSTAGRAM', 'MERCADOLIBRE']
+PESOS_CANALES = [0.70, 0.12, 0.12, 0.06]
+TIPIFICACIONES = ['VENTA', 'VENTA A CONFIRMAR', 'VENTA PERDIDA', 'OTRO MOTIVO', 'RECLAMO', None]
+PESOS_TIPIFICACIONES = [0.12, 0.08, 0.15, 0.30, 0.05, 0.30]
+ESTADOS = ['OPEN', 'PENDING', 'ASSIGNED', 'CLOSED']
+PESOS_ESTADOS = [0.05, 0.05, 0.10, 0.80]
+NOMBRES = ['Juan Pérez', 'María Gómez', 'Lucía Fernández', 'Carlos López', 'Sofía Martínez',
+           'Diego Romero', 'Valentina Díaz', 'Martín Sosa', 'Camila Torres', 'Federico Ruiz']
+# Peso relativo de cada hora del día: el grueso de las conversaciones cae entre 9 y 20 hs
+PESOS_HORAS = np.array([1, 1, 1, 1, 1, 1, 2, 4, 8, 12, 14, 14, 12, 11, 12, 13, 13, 12, 10, 8, 6, 4, 3, 2], dtype=float)
+
+def nombres_de_agentes(cantidad_pv=30, por_pv=4, vendedores_digitales=12):
+    """ Agentes con el formato que parsea parse_agent: 'R<n> - Nombre' por punto de venta y 'VD - Nombre'. """
+    agentes = [f"R{pv:02d} - {NOMBRES[(pv + i) % len(NOMBRES)]}" for pv in range(1, cantidad_pv + 1) for i in range(por_pv)]
+    agentes += [f"VD - {NOMBRES[i % len(NOMBRES)]} {i}" for i in range(vendedores_digitales)]
+    return agentes
+
+def generar_conversaciones(filas, semilla=0, desde=None, hasta=None):
+    """
+    Devuelve una lista de 'filas' conversaciones (diccionarios) creadas entre desde y hasta
+    (por defecto, del inicio del mes en curso hasta ahora). Con la misma semilla el resultado es el mismo.
+    """
+    rng = np.random.default_rng(semilla)
+    hasta = hasta or datetime.now()
+    desde = desde or hasta.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    dias = max(1, (hasta.date() - desde.date()).days + 1)
+
+    # Fecha de creación: día uniforme dentro del rango y hora según PESOS_HORAS
+    inicio_ms = int(desde.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000)
+    dia = rng.integers(0, dias, filas)
+    hora = rng.choice(24, filas, p=PESOS_HORAS / PESOS_HORAS.sum())
+    created = inicio_ms + dia * 86_400_000 + hora * 3_600_000 + rng.integers(0, 3_600_000, filas)
+    created = np.clip(created, int(desde.timestamp() * 1000), int(hasta.timestamp() * 1000))
+
+    # Asignación: ~80% asignadas, entre segundos y un par de horas después de creadas
+    asignada = rng.random(filas) < 0.8
+    demora_asignacion = rng.exponential(900_000, filas).astype(np.int64)
+    demora_respuesta = rng.exponential(300_000, filas).astype(np.int64)
+
+    agentes = nombres_de_agentes()
+    agente = rng.integers(0, len(agentes), filas)
+    canal = rng.choice(len(CANALES), filas, p=PESOS_CANALES)
+    tipificacion = rng.choice(len(TIPIFICACIONES), filas, p=PESOS_TIPIFICACIONES)
+    estado = rng.choice(len(ESTADOS), filas, p=PESOS_ESTADOS)
+    entrante = rng.random(filas) < 0.75
+    usuario = rng.integers(0, max(1, filas // 3), filas) # Contactos que vuelven a escribir
+    sin_canal = rng.random(filas) < 0.01
+
+    conversaciones = []
+    for i in range(filas):
+        c = int(created[i])
+        a = c + int(demora_asignacion[i]) if asignada[i] else None
+        conversaciones.append({
+            'id': f"conv-{semilla}-{i}",
+            'created': c,
+            'assigned': a,
+            'answerTime': a + int(demora_respuesta[i]) if a is not None else None,
+            'channel': None if sin_canal[i] else {'type': CANALES[canal[i]], 'id': f"canal-{canal[i]}"},
+            'agent': {'name': agentes[agente[i]], 'id': f"agente-{agente[i]}"} if a is not None else None,
+            'user': {'id': f"usuario-{usuario[i]}", 'name': f"Cliente {usuario[i]}"},
+            'typing': TIPIFICACIONES[tipificacion[i]],
+            'direction': 'IN' if entrante[i] else 'OUT',
+            'status': ESTADOS[estado[i]],
+            'attentionHour': bool(9 <= hora[i] < 20),
+        })
+    return conversaciones
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Genera conversaciones sintéticas con la forma de la API de Hibot.")
+    parser.add_argument('--filas', type=int, default=10_000)
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default='yesterday_sample.json')
+    args = parser.parse_args()
+
+    datos = generar_conversaciones(args.filas, args.semilla)
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False)
+    print(f"{len(datos)} conversaciones guardadas en '{args.salida}'.")
@@ -1,16 +1,33 @@
 import dash
+import flask
 from dash import dcc, html, dash_table
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 from datetime import datetime, timedelta
 import re 
+import random
 import requests 
 import json      
+import base64
+import codecs
 import os        
 import numpy as np 
-import io 
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import threading
+import time
+import functools
+from collections import OrderedDict
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    import fcntl # Bloqueo entre procesos (gunicorn). No existe en Windows.
+except ImportError:
+    fcntl = None
 
 # --- Constantes de Estilo y Colores ---
 COLOR_FONDO = "#222222" 
@@ -20,6 +37,7 @@ COLOR_BARRA_AZUL = "#0d1bd4" # Azul de Reino Cerámicos
 KPI_BOX_SHADOW = "0 4px 6px rgba(0, 0, 0, 0.4)" 
 KPI_BORDER_RADIUS = "8px"
 ARCHIVO_LOCAL = "yesterday_sample.json" # Archivo de respaldo para desarrollo local
+INTERVALO_REFRESCO_MS = 30*60*1000 # 30 minutos en milisegundos (respaldo: los snapshots nuevos llegan por /eventos)
 
 # Colores específicos para canales (Requisito 10)
 CANAL_COLORS = {
@@ -37,6 +55,9 @@ DIRECTION_COLORS = {
     'N/A': '#757575'
 }
 
+# Colores de los percentiles de tiempos de respuesta
+PERCENTIL_COLORS = {50: '#28a745', 90: '#ffc107', 99: '#dc3545'}
+
 # Orden fijo de días de la semana (Requisito 11)
 ORDEN_DIAS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 NOMBRES_DIAS_ES = {
@@ -58,6 +79,128 @@ OBJETIVO_SEMANAL = {
     'Monday': 500, 'Tuesday': 500, 'Wednesday': 500, 'Thursday': 500, 'Friday': 500,
     'Saturday': 275, 'Sunday': 115
 }
+# -------------------------------------------------------------------
+# MÉTRICAS (Formato de texto de Prometheus en /metrics, por worker)
+# -------------------------------------------------------------------
+# Contadores e histogramas en memoria del proceso: duración de cada etapa del
+# refresco (login, descarga, decodificación, procesamiento, KPIs, snapshot),
+# filas y bytes recibidos, errores, y duración/tamaño de respuesta de cada Callback.
+# Cada worker de gunicorn expone los suyos (Prometheus los distingue por instancia).
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+# Callbacks más lentos que esto (ms) se loguean; 0 lo desactiva
+DASHBOARD_CALLBACK_LENTO_MS = float(os.environ.get("DASHBOARD_CALLBACK_LENTO_MS", 0))
+
+AYUDA_METRICAS = {
+    'dashboard_etapa_segundos': 'Duración de cada etapa de la carga de datos.',
+    'dashboard_errores_total': 'Errores por etapa.',
+    'dashboard_filas_total': 'Filas procesadas por etapa.',
+    'dashboard_api_bytes_total': 'Bytes recibidos de la API de Hibot.',
+    'dashboard_api_respuestas_total': 'Respuestas HTTP de la API de Hibot por código.',
+    'dashboard_api_reintentos_total': 'Reintentos de descarga de ventanas.',
+    'dashboard_snapshot_bytes': 'Tamaño del último snapshot escrito en disco.',
+    'dashboard_snapshot_filas': 'Filas del último snapshot publicado.',
+    'dashboard_callback_segundos': 'Duración de los Callbacks de Dash.',
+    'dashboard_callback_respuesta_bytes': 'Tamaño de la respuesta de los Callbacks de Dash.',
+    'dashboard_callback_errores_total': 'Callbacks de Dash que terminaron en error.',
+    'dashboard_snapshot_edad_segundos': 'Antigüedad del snapshot que sirve este worker.',
+    'dashboard_refresco_ultimo_exito_timestamp': 'Epoch del último refresco sin errores.',
+    'dashboard_refresco_ultimo_error_timestamp': 'Epoch del último refresco con errores.',
+    'dashboard_sse_conexiones': 'Navegadores conectados a /eventos en este worker.',
+    'dashboard_sse_eventos_total': 'Avisos de snapshot nuevo enviados por /eventos.',
+    'dashboard_arranque_segundos': 'Duración de crear_app() (snapshot, figuras y Dash listos).',
+    'dashboard_figuras_cache_total': 'Búsquedas en la caché de figuras por gráfico y resultado (acierto/fallo).',
+    'dashboard_figuras_cache_bytes': 'Tamaño estimado de las figuras en la caché de este worker.',
+    'dashboard_figuras_cache_entradas': 'Figuras en la caché de este worker.',
+}
+
+_metricas_lock = threading.Lock()
+_contadores = {}  # (nombre, etiquetas) -> valor
+_indicadores = {} # (nombre, etiquetas) -> último valor (gauge)
+_histogramas = {} # (nombre, etiquetas) -> {'buckets', 'conteos', 'suma', 'cuenta'}
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+def contar(nombre, valor=1, **etiquetas):
+    """ Suma 'valor' al contador 'nombre' con esas etiquetas. """
+    clave = (nombre, _etiquetas(etiquetas))
+    with _metricas_lock:
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+def fijar(nombre, valor, **etiquetas):
+    """ Fija el valor actual de un indicador (gauge). """
+    with _metricas_lock:
+        _indicadores[(nombre, _etiquetas(etiquetas))] = valor
+
+def observar(nombre, valor, buckets=BUCKETS_SEGUNDOS, **etiquetas):
+    """ Registra una observación en el histograma 'nombre'. """
+    clave = (nombre, _etiquetas(etiquetas))
+    with _metricas_lock:
+        hist = _histogramas.get(clave)
+        if hist is None:
+            hist = _histogramas[clave] = {'buckets': buckets, 'conteos': [0] * len(buckets), 'suma': 0.0, 'cuenta': 0}
+        for i, limite in enumerate(hist['buckets']):
+            if valor <= limite:
+                hist['conteos'][i] += 1
+                break
+        hist['suma'] += valor
+        hist['cuenta'] += 1
+
+class medir_etapa:
+    """
+    Context manager que mide una etapa: registra su duración en dashboard_etapa_segundos
+    y, si sale por una excepción, suma en dashboard_errores_total (la excepción sigue su curso).
+    """
+    def __init__(self, etapa):
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.t_inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, error, traza):
+        observar('dashboard_etapa_segundos', time.perf_counter() - self.t_inicio, etapa=self.etapa)
+        if tipo is not None:
+            contar('dashboard_errores_total', etapa=self.etapa, tipo=tipo.__name__)
+        return False
+
+def _escapar_etiqueta(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _formatear_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares: return ''
+    return '{' + ','.join(f'{k}="{_escapar_etiqueta(v)}"' for k, v in pares) + '}'
+
+def exportar_metricas():
+    """ Todas las métricas del proceso en el formato de texto de Prometheus (versión 0.0.4). """
+    with _metricas_lock:
+        contadores = dict(_contadores)
+        indicadores = dict(_indicadores)
+        histogramas = {k: {**h, 'conteos': list(h['conteos'])} for k, h in _histogramas.items()}
+    lineas = []
+    def encabezado(nombre, tipo):
+        lineas.append(f"# HELP {nombre} {AYUDA_METRICAS.get(nombre, nombre)}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+    for tipo, series in (('counter', contadores), ('gauge', indicadores)):
+        for nombre in sorted({n for n, _ in series}):
+            encabezado(nombre, tipo)
+            for (n, etiquetas), valor in sorted(series.items()):
+                if n == nombre: lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {valor}")
+    for nombre in sorted({n for n, _ in histogramas}):
+        encabezado(nombre, 'histogram')
+        for (n, etiquetas), hist in sorted(histogramas.items(), key=lambda x: x[0]):
+            if n != nombre: continue
+            acumulado = 0
+            for limite, conteo in zip(hist['buckets'], hist['conteos']):
+                acumulado += conteo
+                lineas.append(f"{nombre}_bucket{_formatear_etiquetas(etiquetas, [('le', limite)])} {acumulado}")
+            lineas.append(f"{nombre}_bucket{_formatear_etiquetas(etiquetas, [('le', '+Inf')])} {hist['cuenta']}")
+            lineas.append(f"{nombre}_sum{_formatear_etiquetas(etiquetas)} {hist['suma']}")
+            lineas.append(f"{nombre}_count{_formatear_etiquetas(etiquetas)} {hist['cuenta']}")
+    return '\n'.join(lineas) + '\n'
+
 # -------------------------------------------------------------------
 # LÓGICA DE EXTRACCIÓN Y PROCESAMIENTO
 # -------------------------------------------------------------------
@@ -66,67 +209,281 @@ HIBOT_BASE_URL = os.environ.get("HIBOT_BASE_URL", "https://pdn.api.hibot.us/api_
 HIBOT_APP_ID = os.environ.get("HIBOT_APP_ID")
 HIBOT_APP_SECRET = os.environ.get("HIBOT_APP_SECRET")
 
-def get_auth_token():
-    """ Obtiene el token de autenticación JWT desde la API. """
-    if not HIBOT_APP_ID or not HIBOT_APP_SECRET:
-        print("Error: No se configuraron HIBOT_APP_ID/SECRET.")
-        return None
+# --- SINCRONIZACIÓN INCREMENTAL (DELTA) ---
+# Cada refresco descarga solo lo creado desde la última sincronización (watermark),
+# más las conversaciones aún activas dentro de la ventana de re-chequeo, para
+# captar cambios de 'typing'/'status'. Cada tanto se hace una descarga completa
+# del mes por seguridad (cambios fuera de la ventana, conversaciones borradas).
+ESTADOS_ACTIVOS = ['OPEN', 'PENDING', 'ASSIGNED']
+HIBOT_RECHECK_HORAS = float(os.environ.get("HIBOT_RECHECK_HORAS", 48))
+HIBOT_DELTA_SOLAPAMIENTO_MIN = float(os.environ.get("HIBOT_DELTA_SOLAPAMIENTO_MIN", 5))
+HIBOT_FULL_SYNC_HORAS = float(os.environ.get("HIBOT_FULL_SYNC_HORAS", 12))
+
+# --- DESCARGA EN VENTANAS PARALELAS ---
+HIBOT_VENTANA_HORAS = float(os.environ.get("HIBOT_VENTANA_HORAS", 12)) # Medio día por ventana
+HIBOT_MAX_CONEXIONES = int(os.environ.get("HIBOT_MAX_CONEXIONES", 4))
+HIBOT_REINTENTOS = int(os.environ.get("HIBOT_REINTENTOS", 3))
+HIBOT_BACKOFF_SEGUNDOS = float(os.environ.get("HIBOT_BACKOFF_SEGUNDOS", 1))
+_http_session = None
+_http_session_lock = threading.Lock()
+
+# --- CACHÉ DEL TOKEN JWT ---
+HIBOT_TOKEN_MARGEN_SEG = float(os.environ.get("HIBOT_TOKEN_MARGEN_SEG", 120)) # Renovar 2 min antes del 'exp'
+HIBOT_TOKEN_TTL_DEFAULT_MIN = float(os.environ.get("HIBOT_TOKEN_TTL_DEFAULT_MIN", 30)) # Si el JWT no trae 'exp'
+_token_cache = {'token': None, 'exp': 0.0}
+_token_lock = threading.Lock()
+
+def decodificar_expiracion_jwt(token):
+    """ Devuelve el claim 'exp' (epoch en segundos) del JWT, o None si no se puede leer. """
     try:
-        login_url = f"{HIBOT_BASE_URL}/login"
-        payload = {"appId": HIBOT_APP_ID, "appSecret": HIBOT_APP_SECRET}
-        print("Solicitando token a API...")
-        response = requests.post(login_url, json=payload, timeout=10)
-        response.raise_for_status() 
-        return response.json().get("token")
-    except Exception as e:
-        print(f"Error al obtener token API: {e}")
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4) # Restaurar el padding de base64url
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except Exception:
         return None
 
-def fetch_live_data(token):
-    """ Obtiene las conversaciones del MES EN CURSO desde la API. """
-    if not token: return []
+def login_api():
+    """ Hace login en la API y devuelve (token, expiracion_epoch). """
+    login_url = f"{HIBOT_BASE_URL}/login"
+    payload = {"appId": HIBOT_APP_ID, "appSecret": HIBOT_APP_SECRET}
+    print("Solicitando token a API...")
+    with medir_etapa('login'):
+        response = obtener_sesion_http().post(login_url, json=payload, timeout=10)
+        contar('dashboard_api_respuestas_total', endpoint='login', codigo=response.status_code)
+        response.raise_for_status() 
+        token = response.json().get("token")
+    expiracion = decodificar_expiracion_jwt(token) if token else None
+    if expiracion is None:
+        # Sin 'exp' legible: asumimos una vida conservadora
+        expiracion = time.time() + HIBOT_TOKEN_TTL_DEFAULT_MIN * 60
+    return token, expiracion
+
+def get_auth_token(forzar=False, token_rechazado=None):
+    """
+    Obtiene el token de autenticación JWT. Se reutiliza el token cacheado del proceso
+    hasta HIBOT_TOKEN_MARGEN_SEG antes de su 'exp'; solo entonces se vuelve a hacer login.
+    Con token_rechazado (tras un 401) solo se hace login si el cacheado sigue siendo ese.
+    """
+    if not HIBOT_APP_ID or not HIBOT_APP_SECRET:
+        print("Error: No se configuraron HIBOT_APP_ID/SECRET.")
+        return None
+    # Un solo hilo hace login a la vez; el resto espera y reutiliza su token
+    with _token_lock:
+        if token_rechazado is not None and _token_cache['token'] and _token_cache['token'] != token_rechazado:
+            return _token_cache['token'] # Otro hilo ya lo renovó mientras esperábamos el lock
+        if not forzar and _token_cache['token'] and time.time() < _token_cache['exp'] - HIBOT_TOKEN_MARGEN_SEG:
+            return _token_cache['token']
+        _token_cache['token'] = None # Si el login falla, el próximo pedido lo vuelve a intentar
+        try:
+            token, expiracion = login_api()
+        except Exception as e:
+            print(f"Error al obtener token API: {e}")
+            return None
+        _token_cache['token'] = token
+        _token_cache['exp'] = expiracion
+        return token
+
+def renovar_token(token_rechazado):
+    """ Renueva el token tras un 401. Si otro hilo ya lo renovó, devuelve ese sin volver a hacer login. """
+    # El chequeo y el login van bajo la misma toma del lock: dos 401 simultáneos hacen un solo login
+    return get_auth_token(forzar=True, token_rechazado=token_rechazado)
+
+def obtener_sesion_http():
+    """ Sesión HTTP compartida por el proceso, con pool de conexiones para las descargas en paralelo. """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=HIBOT_MAX_CONEXIONES)
+            _http_session.mount('https://', adapter)
+            _http_session.mount('http://', adapter)
+        return _http_session
+
+def dividir_en_ventanas(desde, hasta, horas=None):
+    """ Divide [desde, hasta) en ventanas consecutivas de 'horas' horas. """
+    paso = timedelta(hours=horas or HIBOT_VENTANA_HORAS)
+    ventanas = []
+    inicio = desde
+    while inicio < hasta:
+        fin = min(inicio + paso, hasta)
+        ventanas.append((inicio, fin))
+        inicio = fin
+    return ventanas
+
+def descargar_ventana(token, desde, hasta):
+    """ Descarga una ventana. Ante un 401 renueva el token una sola vez y reintenta. """
     try:
-        conversations_url = f"{HIBOT_BASE_URL}/conversations"
-        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-        
-        hoy = datetime.now()
-        inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        timestamp_from = int(inicio_mes.timestamp() * 1000)
-        timestamp_to = int(hoy.timestamp() * 1000)
-
-        filter_payload = {"from": timestamp_from, "to": timestamp_to}
-        
-        print(f"Consultando API (desde {inicio_mes.date()})...")
-        response = requests.post(conversations_url, headers=headers, json=filter_payload, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        print(f"¡Éxito API! {len(data)} conversaciones descargadas.")
-        return data
-    except Exception as e:
-        print(f"Error al obtener datos de API: {e}")
-        return []
-
-def cargar_datos_locales():
-    """ Carga datos desde el archivo JSON local (Modo Desarrollo). """
+        return descargar_ventana_con_reintentos(token, desde, hasta)
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
+        print("Token rechazado (401); renovando...")
+        nuevo_token = renovar_token(token)
+        if not nuevo_token:
+            raise
+        return descargar_ventana_con_reintentos(nuevo_token, desde, hasta)
+
+def descargar_ventana_con_reintentos(token, desde, hasta):
+    """ Descarga una ventana con reintentos y backoff exponencial (solo errores transitorios). """
+    conversations_url = f"{HIBOT_BASE_URL}/conversations"
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    filter_payload = {"from": int(desde.timestamp() * 1000), "to": int(hasta.timestamp() * 1000)}
+    session = obtener_sesion_http()
+
+    for intento in range(HIBOT_REINTENTOS + 1):
+        try:
+            with medir_etapa('descarga_ventana'):
+                response = session.post(conversations_url, headers=headers, json=filter_payload, timeout=30, stream=True)
+                with response:
+                    contar('dashboard_api_respuestas_total', endpoint='conversations', codigo=response.status_code)
+                    response.raise_for_status()
+                    # Se decodifica y procesa a medida que llega: nunca está la ventana entera como dicts
+                    chunks = contar_bytes(response.iter_content(TAM_CHUNK_LECTURA), 'dashboard_api_bytes_total')
+                    return procesar_en_lotes(iterar_conversaciones_json(chunks), desde=desde)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and status != 429 and status < 500:
+                raise # Error del cliente: reintentar no sirve
+            error = e
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, ValueError) as e:
+            error = e
+        if intento < HIBOT_REINTENTOS:
+            contar('dashboard_api_reintentos_total')
+            espera = HIBOT_BACKOFF_SEGUNDOS * (2 ** intento) + random.uniform(0, HIBOT_BACKOFF_SEGUNDOS)
+            print(f"Ventana {desde.strftime('%d/%m %H:%M')} falló ({error}); reintento en {espera:.1f}s...")
+            time.sleep(espera)
+    raise error
+
+def contar_bytes(chunks, metrica):
+    """ Deja pasar los chunks de la respuesta sumando su tamaño en el contador 'metrica'. """
+    for chunk in chunks:
+        contar(metrica, len(chunk))
+        yield chunk
+
+def consultar_conversaciones(token, desde, hasta):
+    """
+    Descarga las conversaciones creadas entre 'desde' y 'hasta' en ventanas paralelas.
+    Devuelve (df, ventanas_fallidas), con df ya procesado: una ventana caída solo degrada
+    su tramo. Si fallan todas, propaga el error.
+    """
+    ventanas = dividir_en_ventanas(desde, hasta)
+    print(f"Consultando API (desde {desde.strftime('%d/%m/%Y %H:%M')}, {len(ventanas)} ventanas)...")
+
+    lotes = []
+    fallidas = []
+    ultimo_error = None
+    t_inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=HIBOT_MAX_CONEXIONES) as pool:
+        futuros = {pool.submit(descargar_ventana, token, ini, fin): (ini, fin) for ini, fin in ventanas}
+        for futuro in as_completed(futuros):
+            ini, fin = futuros[futuro]
+            try:
+                lote = futuro.result()
+            except Exception as e:
+                print(f"Error en ventana {ini.strftime('%d/%m %H:%M')} - {fin.strftime('%d/%m %H:%M')}: {e}")
+                fallidas.append((ini, fin))
+                ultimo_error = e
+                continue
+            if not lote.empty: lotes.append(lote)
+
+    observar('dashboard_etapa_segundos', time.perf_counter() - t_inicio, etapa='descarga')
+    if fallidas:
+        contar('dashboard_errores_total', len(fallidas), etapa='descarga', tipo='VentanaFallida')
+    if ventanas and len(fallidas) == len(ventanas):
+        raise ultimo_error
+    # Deduplicación por id (las ventanas pueden compartir el borde)
+    df = deduplicar_por_id(concatenar_lotes(lotes))
+    print(f"¡Éxito API! {len(df)} conversaciones descargadas ({len(fallidas)} ventanas fallidas).")
+    return df, sorted(fallidas)
+
+def cargar_datos_locales(df_previo=None):
+    """
+    Carga y procesa en lotes los datos del archivo JSON local (Modo Desarrollo).
+    Si la lectura falla devuelve df_previo (lo ya publicado), como la sincronización con la API.
+    """
+    respaldo = df_previo if df_previo is not None else pd.DataFrame()
     print(f"Intentando cargar datos locales de '{ARCHIVO_LOCAL}'...")
     try:
-        with open(ARCHIVO_LOCAL, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        print(f"¡Éxito Local! {len(data)} conversaciones cargadas del archivo.")
-        return data
+        with open(ARCHIVO_LOCAL, 'rb') as f:
+            df = procesar_en_lotes(iterar_conversaciones_json(iter(lambda: f.read(TAM_CHUNK_LECTURA), b'')))
+        print(f"¡Éxito Local! {len(df)} conversaciones del mes cargadas del archivo.")
+        return df
     except FileNotFoundError:
         print(f"Error: No se encontró '{ARCHIVO_LOCAL}'. Ejecuta get_yesterday_sample.py primero.")
-        return []
+        registrar_error_refresco('archivo_local', f"No se encontró '{ARCHIVO_LOCAL}'")
+        return respaldo
     except Exception as e:
         print(f"Error leyendo archivo local: {e}")
-        return []
+        registrar_error_refresco('archivo_local', e)
+        return respaldo
+
+# Throughput mínimo esperado de procesar_dataframe, incluida la construcción del DataFrame
+# desde la lista de dicts. Con datos sintéticos de 1M filas: ~75k filas/s con la versión
+# fila a fila (apply), ~180k filas/s con la vectorizada + esquema compacto. Por debajo de esto se avisa en el log.
+OBJETIVO_FILAS_POR_SEGUNDO = 150_000
+
+# --- ESQUEMA COMPACTO EN MEMORIA ---
+# Cada worker guarda un mes procesado: la memoria por fila es lo que limita cuántos workers entran.
+COLUMNAS_ANIDADAS = ['channel', 'agent', 'user'] # Se descartan una vez extraídos sus campos
+COLUMNAS_CATEGORICAS = ['channelType', 'PuntoDeVenta', 'agent.name', 'typing', 'status', 'direction', 'dia_mes_str']
+# Medir memory_usage(deep=True) cuesta segundos en un mes grande: solo si se pide
+REPORTAR_MEMORIA = os.environ.get("DASHBOARD_REPORTAR_MEMORIA", "0") == "1"
+
+def memoria_por_fila(df):
+    """ Bytes por fila del DataFrame (incluye el contenido de las columnas object). """
+    if len(df) == 0: return 0.0
+    return df.memory_usage(deep=True).sum() / len(df)
+
+def compactar_dataframe(df):
+    """
+    Lleva el mes procesado al esquema compacto: sin columnas anidadas, categóricas para
+    los campos de baja cardinalidad, enteros chicos para horas/día y datetime64 para la fecha.
+    Es idempotente (se vuelve a aplicar después de fusionar deltas).
+    """
+    df = df.drop(columns=[c for c in COLUMNAS_ANIDADAS if c in df.columns])
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    if 'dia_semana' in df.columns:
+        df['dia_semana'] = pd.Categorical(df['dia_semana'], categories=ORDEN_DIAS)
+        df['dia_semana_num'] = df['dia_semana'].cat.codes.astype(np.int8) # 0 = Lunes
+    if 'hora_inicio' in df.columns:
+        df['hora_inicio'] = df['hora_inicio'].astype(np.int8)
+    if 'hora_asignacion' in df.columns:
+        df['hora_asignacion'] = df['hora_asignacion'].astype('Int8') # Nullable: hay conversaciones sin asignar
+    if 'dia_mes' in df.columns and 'created' in df.columns:
+        df['dia_mes'] = df['created'].dt.normalize()
+    return ordenar_por_fecha(df)
+
+def extraer_campo(columna, clave, por_defecto, si_no_dict):
+    """ Extrae 'clave' de una columna de diccionarios anidados en un solo pase (sin apply por fila). """
+    return [x.get(clave, por_defecto) if isinstance(x, dict) else si_no_dict for x in columna.to_numpy()]
+
+def parse_agent(name_raw):
+    """ Lógica de Parseo Rxx / VD: devuelve (PuntoDeVenta, nombre limpio del agente). """
+    if not isinstance(name_raw, str) or ' - ' not in name_raw: return 'Sin Asignar', 'Sin Agente'
+    
+    parts = name_raw.split(' - ', 1)
+    header = parts[0].strip()
+    name_clean = parts[1].strip()
 
-def procesar_dataframe(raw_data):
-    """ Convierte la lista de diccionarios en un DataFrame limpio y procesado. """
-    if not raw_data: return pd.DataFrame()
+    if "VD" in header: pos = "CANAL DIGITAL"
+    else:
+        match = re.match(r'^(R\d+)', header)
+        pos = f"Reino {match.group(1)[1:]}" if match else 'Otro'
+    return pos, name_clean
+
+def procesar_dataframe(raw_data, reportar=True, desde=None):
+    """
+    Convierte la lista de diccionarios (o un lote ya en columnas) en un DataFrame limpio y procesado.
+    Descarta lo creado antes de 'desde' (por defecto, el inicio del mes en curso).
+    """
+    if raw_data is None or len(raw_data) == 0: return pd.DataFrame()
+    t_inicio = time.perf_counter()
 
     df = pd.DataFrame(raw_data)
     if df.empty: return df
+    filas_entrada = len(df)
 
     # 1. Validación de columnas mínimas
     if 'created' not in df.columns: return pd.DataFrame()
@@ -134,11 +491,19 @@ def procesar_dataframe(raw_data):
     # 2. Parseo de Fechas
     df['created'] = pd.to_datetime(df['created'], errors='coerce', unit='ms')
     df['created'] = df['created'].dt.tz_localize(None)
+
+    # Filtro por Mes en Curso: se aplica antes de derivar columnas para no procesar filas que se descartan
+    if desde is None:
+        desde = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    df = df[df['created'] >= desde].copy()
     
     df['hora_inicio'] = df['created'].dt.hour
-    df['dia_semana'] = df['created'].dt.day_name()
-    df['dia_mes'] = df['created'].dt.date
-    df['dia_mes_str'] = df['dia_mes'].apply(lambda x: x.strftime('%d-%m')) 
+    # Campos de calendario: se calculan una vez por día distinto y se expanden con los códigos
+    codigos_dia, dias = pd.factorize(df['created'].dt.normalize())
+    dias = pd.DatetimeIndex(dias)
+    df['dia_semana'] = dias.day_name().to_numpy()[codigos_dia]
+    df['dia_mes'] = np.asarray(dias.date, dtype=object)[codigos_dia]
+    df['dia_mes_str'] = dias.strftime('%d-%m').to_numpy()[codigos_dia]
 
     if 'assigned' in df.columns:
         df['assigned_dt'] = pd.to_datetime(df['assigned'], errors='coerce', unit='ms')
@@ -151,51 +516,26 @@ def procesar_dataframe(raw_data):
 
     # 3. Extracción channelType
     if 'channel' in df.columns:
-        def get_channel_type(x):
-            if isinstance(x, dict): return x.get('type', 'N/A')
-            return 'N/A'
-        df['channelType'] = df['channel'].apply(get_channel_type)
+        df['channelType'] = extraer_campo(df['channel'], 'type', 'N/A', 'N/A')
         # Limpieza de nombres
         df['channelType'] = df['channelType'].replace({'WHATSAPP': 'WhatsApp', 'FACEBOOK': 'Facebook', 'INSTAGRAM': 'Instagram', 'MERCADOLIBRE': 'Mercado Libre'})
 
     # 4. Parseo de Agente y Punto de Venta (Lógica compleja)
     if 'agent' in df.columns:
-        def get_agent_name(x):
-            if isinstance(x, dict): 
-                return x.get('name', 'Sin Agente')
-            return 'N/A'
+        df['agent.name'] = pd.Series(extraer_campo(df['agent'], 'name', 'Sin Agente', 'N/A'), index=df.index).fillna('N/A')
         
-        df['agent.name'] = df['agent'].apply(get_agent_name).fillna('N/A')
-        
-        # Lógica de Parseo Rxx / VD
-        def parse_agent(name_raw):
-            if not isinstance(name_raw, str) or ' - ' not in name_raw: return 'Sin Asignar', 'Sin Agente'
-            
-            parts = name_raw.split(' - ', 1)
-            header = parts[0].strip()
-            name_clean = parts[1].strip()
-
-            if "VD" in header: pos = "CANAL DIGITAL"
-            else:
-                match = re.match(r'^(R\d+)', header)
-                pos = f"Reino {match.group(1)[1:]}" if match else 'Otro'
-            return pos, name_clean
-
-        # Aplicar y asignar
-        parsed = df['agent.name'].apply(parse_agent)
-        df['PuntoDeVenta'] = parsed.apply(lambda x: x[0])
+        # Parseo una vez por nombre distinto (hay decenas de agentes, no miles)
+        codigos_agente, nombres = pd.factorize(df['agent.name'], use_na_sentinel=False)
+        pos_por_nombre = np.array([parse_agent(n)[0] for n in nombres], dtype=object)
+        df['PuntoDeVenta'] = pos_por_nombre[codigos_agente]
     else:
         df['PuntoDeVenta'] = 'N/A'
         df['agent.name'] = 'N/A' # Asegura que la columna exista
 
     # 5. Extracción de ID y nombre de usuario/cliente (Corregido y Fortalecido)
     if 'user' in df.columns:
-        def get_user_data(x, key):
-            if isinstance(x, dict): return x.get(key, None)
-            return None
-        # Corregido: Extracción robusta de user id
-        df['userId'] = df['user'].apply(lambda x: get_user_data(x, 'id'))
-        df['client.name'] = df['user'].apply(lambda x: get_user_data(x, 'name'))
+        df['userId'] = extraer_campo(df['user'], 'id', None, None)
+        df['client.name'] = extraer_campo(df['user'], 'name', None, None)
     else:
         df['userId'] = None
         df['client.name'] = None
@@ -210,17 +550,791 @@ def procesar_dataframe(raw_data):
     df['note'] = df.get('note', pd.Series(dtype='object'))
     df['assigned'] = df.get('assigned', pd.Series(dtype='object')) # Raw timestamp para la tabla
 
-    # 7. Filtro por Mes en Curso
-    hoy = datetime.now()
-    inicio_mes = hoy.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    df_filtrado = df[df['created'] >= inicio_mes].copy()
-    
-    if 'typing' in df_filtrado.columns:
-        df_filtrado['typing'] = df_filtrado['typing'].fillna('N/A')
+    if 'typing' in df.columns:
+        df['typing'] = df['typing'].fillna('N/A')
+
+    # 7. Esquema compacto
+    t_medicion = time.perf_counter()
+    bytes_antes = memoria_por_fila(df) if REPORTAR_MEMORIA else None
+    t_inicio += time.perf_counter() - t_medicion # La medición no cuenta para el throughput
+    df_filtrado = compactar_dataframe(df)
+
+    duracion = time.perf_counter() - t_inicio
+    if REPORTAR_MEMORIA:
+        print(f"Memoria por fila: {bytes_antes:,.0f} B -> {memoria_por_fila(df_filtrado):,.0f} B")
+    if reportar:
+        reportar_throughput('procesar_dataframe', filas_entrada, duracion)
     
     return df_filtrado
 
+def reportar_throughput(etapa, filas, duracion):
+    """ Loguea filas/s y avisa si queda por debajo de OBJETIVO_FILAS_POR_SEGUNDO. """
+    filas_por_segundo = filas / duracion if duracion > 0 else float('inf')
+    nombre_metrica = etapa.split(' ')[0] # Sin el detalle entre paréntesis: etiqueta de baja cardinalidad
+    observar('dashboard_etapa_segundos', duracion, etapa=nombre_metrica)
+    contar('dashboard_filas_total', filas, etapa=nombre_metrica)
+    print(f"{etapa}: {filas} filas en {duracion:.3f}s ({filas_por_segundo:,.0f} filas/s)")
+    if filas >= 10_000 and filas_por_segundo < OBJETIVO_FILAS_POR_SEGUNDO:
+        print(f"Aviso: {etapa} por debajo del objetivo de {OBJETIVO_FILAS_POR_SEGUNDO:,} filas/s")
+
+# -------------------------------------------------------------------
+# INGESTA EN STREAMING (Memoria acotada por el tamaño del lote)
+# -------------------------------------------------------------------
+# El JSON de conversaciones se decodifica de a un objeto por vez y se vuelca en
+# buffers por columna de DASHBOARD_TAM_LOTE filas. Cada lote se procesa y
+# compacta antes de leer el siguiente, así que el pico de memoria depende del
+# lote y no del tamaño del mes.
+DASHBOARD_TAM_LOTE = int(os.environ.get("DASHBOARD_TAM_LOTE", 20_000))
+TAM_CHUNK_LECTURA = 64 * 1024 # Bytes por lectura del archivo / respuesta HTTP
+
+def iterar_conversaciones_json(chunks):
+    """ Genera cada objeto de un arreglo JSON top-level recibido en partes (bytes o str). """
+    decodificar = json.JSONDecoder().raw_decode
+    saltar_separadores = re.compile(r'[\s,]*').match
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    dentro_del_arreglo = False
+    for chunk in chunks:
+        buffer = buffer[pos:] + (utf8.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        pos = 0
+        while True:
+            pos = saltar_separadores(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if not dentro_del_arreglo:
+                if buffer[pos] != '[':
+                    raise ValueError("Se esperaba un arreglo JSON de conversaciones")
+                dentro_del_arreglo = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                objeto, pos_fin = decodificar(buffer, pos)
+            except json.JSONDecodeError:
+                break # Objeto incompleto: falta leer el resto
+            yield objeto
+            pos = pos_fin
+    if dentro_del_arreglo or buffer[pos:].strip():
+        raise ValueError("JSON de conversaciones truncado")
+
+def lotes_en_columnas(registros, tam_lote):
+    """ Vuelca los registros en buffers por columna y entrega un lote cada 'tam_lote' filas. """
+    columnas = {}
+    n = 0
+    for registro in registros:
+        if not isinstance(registro, dict):
+            continue
+        for clave, valor in registro.items():
+            columna = columnas.get(clave)
+            if columna is None: # Clave nueva a mitad de lote: rellenar las filas anteriores
+                columna = columnas[clave] = [None] * n
+            columna.append(valor)
+        n += 1
+        if len(registro) != len(columnas): # Al registro le faltan claves
+            for columna in columnas.values():
+                if len(columna) < n: columna.append(None)
+        if n >= tam_lote:
+            yield columnas
+            columnas = {}
+            n = 0
+    if n:
+        yield columnas
+
+def concatenar_lotes(lotes):
+    """ Une los lotes ya procesados en un solo DataFrame compacto. """
+    if not lotes: return pd.DataFrame()
+    if len(lotes) == 1: return lotes[0]
+    return compactar_dataframe(pd.concat(lotes, ignore_index=True))
+
+def procesar_en_lotes(registros, tam_lote=None, desde=None):
+    """ Procesa un flujo de conversaciones por lotes de tamaño fijo y devuelve el DataFrame compacto. """
+    lotes = []
+    filas = 0
+    t_proceso = 0.0
+    t_total = time.perf_counter()
+    for columnas in lotes_en_columnas(registros, tam_lote or DASHBOARD_TAM_LOTE):
+        t_inicio = time.perf_counter()
+        lote = procesar_dataframe(columnas, reportar=False, desde=desde)
+        t_proceso += time.perf_counter() - t_inicio
+        filas += len(next(iter(columnas.values())))
+        if not lote.empty: lotes.append(lote)
+    # El resto del tiempo es lectura + decodificación del JSON (incluye la espera de la red)
+    observar('dashboard_etapa_segundos', time.perf_counter() - t_total - t_proceso, etapa='decodificar_json')
+    df = concatenar_lotes(lotes)
+    reportar_throughput(f'procesar_en_lotes ({len(lotes)} lotes)', filas, t_proceso)
+    return df
+
+# -------------------------------------------------------------------
+# PERÍODOS (Rebanadas por fecha sobre el mes ordenado por 'created')
+# -------------------------------------------------------------------
+# El DataFrame del snapshot se mantiene ordenado por 'created' (compactar_dataframe
+# lo garantiza). Así "hoy", "ayer", "esta semana" o cualquier rango son dos
+# búsquedas binarias (searchsorted) y una rebanada por posición, sin recorrer el mes.
+
+def ordenar_por_fecha(df):
+    """ Ordena por 'created' (estable) solo si hace falta; las fechas nulas quedan al final. """
+    if 'created' not in df.columns or df['created'].is_monotonic_increasing:
+        return df
+    return df.sort_values('created', kind='stable', na_position='last', ignore_index=True)
+
+def limites_periodo(df, desde, hasta):
+    """ Posiciones [i, j) de las filas con desde <= created < hasta (df ordenado por 'created'). """
+    if df.empty or 'created' not in df.columns: return 0, 0
+    created = df['created']
+    i = created.searchsorted(pd.Timestamp(desde), side='left') if desde is not None else 0
+    j = created.searchsorted(pd.Timestamp(hasta), side='left') if hasta is not None else created.notna().sum()
+    return int(i), int(max(i, j))
+
+def cortar_periodo(df, desde, hasta):
+    """ Filas con desde <= created < hasta, como rebanada por posición (sin copiar los datos). """
+    i, j = limites_periodo(df, desde, hasta)
+    return df.iloc[i:j]
+
+def rango_de_periodo(periodo, referencia=None):
+    """ (desde, hasta) de un período con nombre ('HOY', 'AYER', 'SEMANA', 'MES') respecto de la fecha de referencia. """
+    dia = pd.Timestamp(referencia if referencia is not None else datetime.now()).normalize()
+    if periodo == 'HOY': return dia, dia + timedelta(days=1)
+    if periodo == 'AYER': return dia - timedelta(days=1), dia
+    if periodo == 'SEMANA': return dia - timedelta(days=dia.weekday()), dia + timedelta(days=1) # Lunes a hoy
+    if periodo == 'MES': return dia.replace(day=1), dia + timedelta(days=1)
+    raise ValueError(f"Período desconocido: {periodo}")
+
+def filas_del_periodo(df, periodo, referencia=None):
+    """ Rebanada del DataFrame para un período con nombre (ver rango_de_periodo). """
+    return cortar_periodo(df, *rango_de_periodo(periodo, referencia))
+
+# -------------------------------------------------------------------
+# CUBO DE AGREGACIÓN (Un solo pase por snapshot para KPIs y gráficos)
+# -------------------------------------------------------------------
+# Cada dimensión se codifica a enteros y se cuentan las combinaciones presentes
+# (cubo disperso). Cada KPI y cada gráfico es luego un np.bincount sobre las
+# celdas del cubo, que son muchas menos que las filas del mes.
+COLUMNAS_CUBO = {
+    'dia': 'created',  # Se normaliza a medianoche
+    'dia_semana': 'dia_semana',
+    'hora': 'hora_inicio',
+    'hora_asignacion': 'hora_asignacion',
+    'canal': 'channelType',
+    'direccion': 'direction',
+    'status': 'status',
+    'typing': 'typing',
+    'pv': 'PuntoDeVenta',
+}
+
+def construir_cubo(df):
+    """ Cuenta las conversaciones por día × hora × día de semana × hora de asignación × canal × dirección × status × typing × PV. """
+    etiquetas = {}
+    codigos_fila = []
+    for dim, col in COLUMNAS_CUBO.items():
+        if col not in df.columns:
+            valores = np.full(len(df), 'N/A', dtype=object)
+        elif dim == 'dia':
+            valores = df[col].dt.normalize()
+        else:
+            valores = df[col]
+        codigos, unicos = pd.factorize(valores, use_na_sentinel=False)
+        etiquetas[dim] = pd.Index(unicos)
+        codigos_fila.append(codigos)
+
+    dims = tuple(max(len(etiquetas[d]), 1) for d in COLUMNAS_CUBO)
+    if len(df) == 0:
+        return {'etiquetas': etiquetas, 'codigos': {d: np.zeros(0, dtype=np.int64) for d in COLUMNAS_CUBO}, 'conteo': np.zeros(0, dtype=np.int64)}
+
+    clave = np.ravel_multi_index(codigos_fila, dims)
+    claves, conteo = np.unique(clave, return_counts=True)
+    codigos_celda = np.unravel_index(claves, dims)
+    return {
+        'etiquetas': etiquetas,
+        'codigos': {d: c.astype(np.int32) for d, c in zip(COLUMNAS_CUBO, codigos_celda)},
+        'conteo': conteo.astype(np.int64),
+    }
+
+def codigos_de_valores(etiquetas, valores):
+    """ Códigos (posiciones en etiquetas) de los valores pedidos; VALOR_VACIO_FILTRO elige los nulos. """
+    if not isinstance(valores, (list, tuple, set)): valores = [valores]
+    elegidas = etiquetas.isin([v for v in valores if v != VALOR_VACIO_FILTRO])
+    if VALOR_VACIO_FILTRO in valores:
+        elegidas |= etiquetas.isna()
+    return np.flatnonzero(elegidas)
+
+def tabla_de_codigos(cantidad, codigos):
+    """ Tabla booleana código -> elegido, para evaluar la pertenencia con un solo acceso por posición. """
+    tabla = np.zeros(max(cantidad, 1), dtype=bool)
+    tabla[codigos] = True
+    return tabla
+
+def mascara_cubo(cubo, filtros):
+    """ Máscara sobre las celdas del cubo para filtros {dimensión: valor o lista de valores}. """
+    mascara = np.ones(len(cubo['conteo']), dtype=bool)
+    for dim, valores in (filtros or {}).items():
+        etiquetas = cubo['etiquetas'][dim]
+        mascara &= tabla_de_codigos(len(etiquetas), codigos_de_valores(etiquetas, valores))[cubo['codigos'][dim]]
+    return mascara
+
+def cubo_contar(cubo, por, filtros=None):
+    """ Conteo por una dimensión (Serie indexada por etiqueta), con filtros opcionales sobre otras. """
+    etiquetas = cubo['etiquetas'][por]
+    codigos, conteo = cubo['codigos'][por], cubo['conteo']
+    if filtros:
+        mascara = mascara_cubo(cubo, filtros)
+        codigos, conteo = codigos[mascara], conteo[mascara]
+    totales = np.bincount(codigos, weights=conteo, minlength=len(etiquetas))[:len(etiquetas)]
+    return pd.Series(totales.astype(np.int64), index=etiquetas)
+
+def cubo_total(cubo, filtros=None):
+    """ Total de conversaciones que cumplen los filtros. """
+    if not filtros: return int(cubo['conteo'].sum())
+    return int(cubo['conteo'][mascara_cubo(cubo, filtros)].sum())
+
+def filtrar_cubo(cubo, filtros):
+    """ Cubo con solo las celdas que cumplen los filtros (las dimensiones filtrables son dimensiones del cubo). """
+    mascara = mascara_cubo(cubo, filtros)
+    return {'etiquetas': cubo['etiquetas'],
+            'codigos': {d: c[mascara] for d, c in cubo['codigos'].items()},
+            'conteo': cubo['conteo'][mascara]}
+
+# -------------------------------------------------------------------
+# FILTROS GLOBALES (Índices por valor, uno por snapshot/rango)
+# -------------------------------------------------------------------
+# Canal, PV, tipificación, dirección y estado filtran todos los gráficos a la vez.
+# Para no recorrer el mes con máscaras en cada callback, cada vista arma una sola vez
+# (al primer filtro) un índice invertido por dimensión: las posiciones de las filas de
+# cada valor, contiguas y en orden. Una combinación de filtros parte de la dimensión
+# más selectiva (la unión de sus listas) y descarta con las demás por código, de modo
+# que el costo depende de las filas que quedan, no del mes. El resultado (DataFrame,
+# cubo y ranking filtrados) se cachea con la vista y lo comparten todos los gráficos.
+DIMENSIONES_FILTRO = ['canal', 'pv', 'typing', 'direccion', 'status'] # Columnas en COLUMNAS_CUBO
+VALOR_VACIO_FILTRO = '(Sin dato)'
+
+def construir_indice(df):
+    """ {dimensión: etiquetas, código por fila, filas agrupadas por código y límites de cada grupo}. """
+    indice = {}
+    for dim in DIMENSIONES_FILTRO:
+        col = COLUMNAS_CUBO[dim]
+        valores = df[col] if col in df.columns else np.full(len(df), None, dtype=object)
+        codigos, etiquetas = pd.factorize(valores, use_na_sentinel=False)
+        codigos = codigos.astype(np.int16 if len(etiquetas) < np.iinfo(np.int16).max else np.int32)
+        indice[dim] = {
+            'etiquetas': pd.Index(etiquetas),
+            'codigos': codigos,
+            'filas': np.argsort(codigos, kind='stable').astype(np.int32), # Estable: ascendentes dentro de cada valor
+            'limites': np.concatenate([[0], np.cumsum(np.bincount(codigos, minlength=len(etiquetas)))]),
+        }
+    return indice
+
+def filas_filtradas(indice, filtros):
+    """ Posiciones (ascendentes) de las filas que cumplen todos los filtros {dimensión: [valores]}. """
+    elegidos = {}
+    for dim, valores in filtros.items():
+        entrada = indice[dim]
+        codigos = codigos_de_valores(entrada['etiquetas'], valores)
+        filas = int((entrada['limites'][codigos + 1] - entrada['limites'][codigos]).sum())
+        elegidos[dim] = (filas, codigos)
+    base = min(elegidos, key=lambda d: elegidos[d][0])
+    entrada = indice[base]
+    tramos = [entrada['filas'][entrada['limites'][c]:entrada['limites'][c + 1]] for c in elegidos[base][1]]
+    if not tramos:
+        return np.zeros(0, dtype=np.int32)
+    filas = tramos[0] if len(tramos) == 1 else np.sort(np.concatenate(tramos))
+    for dim, (_, codigos) in elegidos.items():
+        if dim != base:
+            filas = filas[tabla_de_codigos(len(indice[dim]['etiquetas']), codigos)[indice[dim]['codigos'][filas]]]
+    return filas
+
+def filtrar_vista(vista_base, indice, filtros):
+    """ Vista ({'df', 'cubo', 'ranking', ...}) restringida a los filtros. """
+    df = vista_base['df'].take(filas_filtradas(indice, filtros))
+    df.reset_index(drop=True, inplace=True)
+    vista = {**vista_base, 'df': df, 'cubo': filtrar_cubo(vista_base['cubo'], filtros), 'ranking': construir_ranking(df)}
+    vista.pop('latencias', None) # Se arman al pedirlas (ver latencias_de_vista)
+    return vista
+
+def opciones_filtro(cubo, dim, elegidos=()):
+    """
+    Opciones del selector de una dimensión: los valores con conversaciones en el cubo, ordenados, y los
+    vacíos al final. Los ya elegidos se conservan aunque el rango nuevo no los tenga.
+    """
+    conteo = cubo_contar(cubo, dim)
+    presentes = conteo.index[conteo.to_numpy() > 0]
+    valores = {str(e) for e in presentes if not pd.isna(e)} | {str(v) for v in elegidos if v != VALOR_VACIO_FILTRO}
+    opciones = [{'label': v, 'value': v} for v in sorted(valores)]
+    if presentes.isna().any() or VALOR_VACIO_FILTRO in elegidos:
+        opciones.append({'label': VALOR_VACIO_FILTRO, 'value': VALOR_VACIO_FILTRO})
+    return opciones
+
+def filtros_de_vista(vista):
+    """ Filtros elegidos en la vista como tupla normalizada ((dimensión, valores), ...); vacía si no hay. """
+    filtros = (vista or {}).get('filtros') or {}
+    return tuple((dim, tuple(sorted(str(v) for v in filtros[dim]))) for dim in DIMENSIONES_FILTRO if filtros.get(dim))
+
+# -------------------------------------------------------------------
+# RANKING POR PUNTO DE VENTA Y AGENTE (Rollups por snapshot)
+# -------------------------------------------------------------------
+# Conversaciones, ventas, contactos únicos y conversión por agente y por PV,
+# con bincount sobre los códigos de 'agent.name': el nombre se parsea
+# (parse_agent) una vez por agente distinto, no por fila. Se calcula al armar
+# el snapshot (o una vista con rango) y los Callbacks solo lo muestran; sumar
+# locales agrega filas al ranking, no trabajo por conversación.
+PV_SIN_ASIGNAR = 'Sin Asignar' # parse_agent de las conversaciones sin agente: no entran al ranking
+COLUMNAS_RANKING = ['conversaciones', 'ventas', 'contactos', 'conversion']
+
+def resumir_grupos(codigos, cantidad, es_venta, codigos_usuario):
+    """ Métricas del ranking por código de grupo. La conversión es ventas / contactos únicos (%), como la de WhatsApp. """
+    conversaciones = np.bincount(codigos, minlength=cantidad)
+    ventas = np.bincount(codigos, weights=es_venta, minlength=cantidad).astype(np.int64)
+    # Contactos únicos: pares (grupo, usuario) distintos, codificados en un solo entero.
+    # Ordenar y comparar vecinos es bastante más rápido que np.unique sobre un millón de enteros.
+    con_usuario = codigos_usuario >= 0
+    base = int(codigos_usuario.max()) + 1 if len(codigos_usuario) else 1
+    pares = np.sort(codigos[con_usuario].astype(np.int64) * base + codigos_usuario[con_usuario])
+    if len(pares):
+        pares = pares[np.concatenate(([True], pares[1:] != pares[:-1]))]
+    contactos = np.bincount(pares // base, minlength=cantidad)
+    conversion = np.divide(ventas * 100.0, contactos, out=np.zeros(cantidad), where=contactos > 0)
+    return pd.DataFrame({'conversaciones': conversaciones, 'ventas': ventas, 'contactos': contactos, 'conversion': conversion})
+
+def ordenar_ranking(df):
+    df = df[df['PuntoDeVenta'] != PV_SIN_ASIGNAR]
+    return df.sort_values(['conversaciones', 'ventas'], ascending=False, kind='stable').reset_index(drop=True)
+
+def construir_ranking(df):
+    """ {'pv': una fila por punto de venta, 'agentes': una fila por agente}, de más a menos conversaciones. """
+    if df.empty or 'agent.name' not in df.columns:
+        vacio = pd.DataFrame(columns=['PuntoDeVenta'] + COLUMNAS_RANKING)
+        return {'pv': vacio, 'agentes': vacio.assign(agente=pd.Series(dtype=object))}
+
+    codigos_agente, nombres = pd.factorize(df['agent.name'], use_na_sentinel=False)
+    parseados = [parse_agent(n) for n in nombres] # Una vez por agente distinto
+    pv_por_agente = np.array([pv for pv, _ in parseados], dtype=object)
+    codigos_pv, pvs = pd.factorize(pv_por_agente)
+
+    es_venta = (df['typing'] == 'VENTA').to_numpy() if 'typing' in df.columns else np.zeros(len(df), dtype=bool)
+    # Sin userId cada conversación cuenta como un contacto (igual que la conversión de WhatsApp)
+    codigos_usuario = pd.factorize(df['userId'])[0] if 'userId' in df.columns else np.arange(len(df))
+
+    agentes = resumir_grupos(codigos_agente, len(nombres), es_venta, codigos_usuario)
+    agentes.insert(0, 'PuntoDeVenta', pv_por_agente)
+    agentes.insert(0, 'agente', [nombre for _, nombre in parseados])
+    por_pv = resumir_grupos(codigos_pv[codigos_agente], len(pvs), es_venta, codigos_usuario)
+    por_pv.insert(0, 'PuntoDeVenta', np.asarray(pvs, dtype=object))
+    return {'pv': ordenar_ranking(por_pv), 'agentes': ordenar_ranking(agentes)}
+
+# -------------------------------------------------------------------
+# TIEMPOS DE RESPUESTA (Percentiles con sketches mergeables por día)
+# -------------------------------------------------------------------
+# Tiempo hasta la asignación (assigned - created) y hasta la primera respuesta
+# (answerTime - created). En lugar de ordenar el mes en cada render, cada día guarda
+# un histograma en buckets logarítmicos por dimensión (sketch al estilo DDSketch:
+# cada bucket cubre un factor GAMMA_LATENCIA, así cualquier percentil sale con error
+# relativo acotado por LATENCIA_ERROR_RELATIVO). Los sketches se suman: un rango es la
+# suma de sus días y cada refresco solo rehace los días que el delta pudo cambiar.
+LATENCIA_ERROR_RELATIVO = 0.02
+GAMMA_LATENCIA = (1 + LATENCIA_ERROR_RELATIVO) / (1 - LATENCIA_ERROR_RELATIVO)
+LATENCIA_MAX_SEG = 60 * 24 * 3600 # Lo que supere 60 días cae en el último bucket
+BUCKETS_LATENCIA = int(np.ceil(np.log(LATENCIA_MAX_SEG) / np.log(GAMMA_LATENCIA))) + 1 # El bucket 0 es "hasta 1 segundo"
+METRICAS_LATENCIA = {'asignacion': 'assigned', 'respuesta': 'answerTime'} # Se miden desde 'created'
+DIMENSIONES_LATENCIA = ['hora', 'dia_semana', 'canal', 'pv'] # Columnas en COLUMNAS_CUBO
+PERCENTILES_LATENCIA = [50, 90, 99]
+
+def buckets_latencia(df, metrica):
+    """ Bucket logarítmico de la latencia de cada fila; -1 si no tiene (sin asignar/responder o negativa). """
+    creada = df['created'].to_numpy(dtype='datetime64[ms]')
+    fin = pd.to_numeric(columna_detalle(df, METRICAS_LATENCIA[metrica]), errors='coerce').to_numpy(dtype=float)
+    segundos = (fin - creada.astype(np.int64)) / 1000.0
+    validas = np.isfinite(segundos) & (segundos >= 0) & ~np.isnat(creada)
+    buckets = np.full(len(df), -1, dtype=np.int64)
+    buckets[validas] = np.clip(np.ceil(np.log(np.maximum(segundos[validas], 1.0)) / np.log(GAMMA_LATENCIA)), 0, BUCKETS_LATENCIA - 1)
+    return buckets
+
+def construir_sketches(df):
+    """
+    Sketches por día: {día: {métrica: {dimensión: (etiquetas, conteos int32 [valores × buckets])}}}.
+    Un bincount por métrica y dimensión para todos los días juntos; solo se guardan los valores con datos.
+    """
+    if df.empty or 'created' not in df.columns: return {}
+    codigos_dia, dias = pd.factorize(df['created'].dt.normalize())
+    dimensiones = {}
+    for dim in DIMENSIONES_LATENCIA:
+        col = COLUMNAS_CUBO[dim]
+        codigos, etiquetas = pd.factorize(df[col] if col in df.columns else np.full(len(df), 'N/A', dtype=object))
+        dimensiones[dim] = (codigos, pd.Index(np.asarray(etiquetas, dtype=object)))
+
+    sketches = {dia.date(): {metrica: {} for metrica in METRICAS_LATENCIA} for dia in dias}
+    for metrica in METRICAS_LATENCIA:
+        buckets = buckets_latencia(df, metrica)
+        validas = (buckets >= 0) & (codigos_dia >= 0)
+        for dim, (codigos, etiquetas) in dimensiones.items():
+            filas = validas & (codigos >= 0)
+            clave = (codigos_dia[filas].astype(np.int64) * len(etiquetas) + codigos[filas]) * BUCKETS_LATENCIA + buckets[filas]
+            conteos = np.bincount(clave, minlength=len(dias) * len(etiquetas) * BUCKETS_LATENCIA)
+            conteos = conteos.reshape(len(dias), len(etiquetas), BUCKETS_LATENCIA)
+            for i, dia in enumerate(dias):
+                presentes = conteos[i].any(axis=1)
+                sketches[dia.date()][metrica][dim] = (etiquetas[presentes], conteos[i][presentes].astype(np.int32))
+    return sketches
+
+def actualizar_sketches(previos, df, desde_cambios=None):
+    """
+    Sketches del mes reutilizando los de los días anteriores a desde_cambios (el delta no pudo
+    cambiarlos) y rehaciendo el resto. Sin previos o sin desde_cambios se arman todos.
+    """
+    if not previos or desde_cambios is None or df.empty:
+        return construir_sketches(df)
+    primer_dia, dia_corte = df['created'].iloc[0].date(), desde_cambios.date()
+    sketches = {dia: s for dia, s in previos.items() if primer_dia <= dia < dia_corte}
+    sketches.update(construir_sketches(cortar_periodo(df, pd.Timestamp(dia_corte), None)))
+    return sketches
+
+def combinar_sketches(sketches, metrica, dim):
+    """ Suma los sketches de varios días para una métrica y dimensión: (etiquetas, conteos int64). """
+    partes = [s[metrica][dim] for s in sketches]
+    if not partes:
+        return pd.Index([], dtype=object), np.zeros((0, BUCKETS_LATENCIA), dtype=np.int64)
+    etiquetas = partes[0][0]
+    for otras, _ in partes[1:]:
+        etiquetas = etiquetas.append(otras[~otras.isin(etiquetas)])
+    total = np.zeros((len(etiquetas), BUCKETS_LATENCIA), dtype=np.int64)
+    for otras, conteos in partes:
+        total[etiquetas.get_indexer(otras)] += conteos
+    return etiquetas, total
+
+def latencias_de_vista(vista):
+    """ Sketches de una vista resuelta: el snapshot los trae; las vistas con rango o filtros los arman (y guardan) al primer uso. """
+    if 'latencias' not in vista:
+        vista['latencias'] = construir_sketches(vista['df'])
+    return vista['latencias']
+
+def percentiles_sketch(conteos, percentiles=PERCENTILES_LATENCIA):
+    """ ({percentil: segundos por fila}, conversaciones por fila); NaN en las filas sin datos. """
+    acumulado = np.cumsum(conteos, axis=1)
+    total = acumulado[:, -1] if len(acumulado) else np.zeros(0, dtype=np.int64)
+    resultado = {}
+    for p in percentiles:
+        bucket = (acumulado <= (p / 100 * (total - 1))[:, None]).sum(axis=1)
+        # Valor representativo del bucket (γ^(b-1), γ^b]: error relativo <= LATENCIA_ERROR_RELATIVO
+        valor = np.where(bucket == 0, 1.0, 2 * GAMMA_LATENCIA ** bucket / (GAMMA_LATENCIA + 1))
+        resultado[p] = np.where(total > 0, valor, np.nan)
+    return resultado, total
+
+# -------------------------------------------------------------------
+# TABLA DETALLE (Paginado, orden y filtros en el servidor)
+# -------------------------------------------------------------------
+# El mes completo no viaja al navegador: la DataTable pide página, orden y filtro
+# y se responde solo con las filas visibles. El orden de cada columna se calcula
+# una vez por snapshot/rango (argsort estable) y el resultado de cada combinación
+# filtro + orden queda en caché: pasar de página es cortar un array de posiciones.
+# (id en la tabla, columna del DataFrame, título, tipo)
+COLUMNAS_DETALLE = [
+    ('created', 'created', 'Fecha', 'fecha'),
+    ('id', 'id', 'ID', 'texto'),
+    ('canal', 'channelType', 'Canal', 'texto'),
+    ('pv', 'PuntoDeVenta', 'Punto de Venta', 'texto'),
+    ('agente', 'agent.name', 'Agente', 'texto'),
+    ('cliente', 'client.name', 'Cliente', 'texto'),
+    ('typing', 'typing', 'Tipificación', 'texto'),
+    ('status', 'status', 'Estado', 'texto'),
+    ('direccion', 'direction', 'Dirección', 'texto'),
+    ('horario', 'attentionHour', 'En Horario', 'texto'),
+    ('asignada', 'assigned', 'Asignada', 'fecha'),
+    ('respuesta', 'answerTime', 'Respuesta', 'fecha'),
+    ('nota', 'note', 'Nota', 'texto'),
+]
+DETALLE_POR_ID = {id_col: (col_df, tipo) for id_col, col_df, _, tipo in COLUMNAS_DETALLE}
+TAMANO_PAGINA_DETALLE = 25
+FORMATO_FECHA_DETALLE = '%Y-%m-%d %H:%M' # ISO: el filtro 'datestartswith' de la DataTable compara contra esto
+# Cada entrada es un array int32 de posiciones (4 MB por millón de filas)
+TABLA_CACHE_MAX = int(os.environ.get("DASHBOARD_TABLA_CACHE_MAX", 16))
+_tabla_cache = OrderedDict() # (vista, columna) -> orden | (vista, filtro, orden) -> posiciones
+_tabla_lock = threading.Lock()
+# Operadores del filter_query de la DataTable (los de palabra pueden venir con prefijo i/s de mayúsculas)
+OPERADORES_FILTRO = {'=': 'eq', '!=': 'ne', '<': 'lt', '<=': 'le', '>': 'gt', '>=': 'ge'}
+PATRON_CONDICION = re.compile(r'^\{(?P<columna>[^}]+)\}\s+(?P<operador>\S+)\s+(?P<valor>.+)$')
+
+def en_cache_tabla(clave, calcular):
+    """ Devuelve la entrada de la caché de la tabla o la calcula (LRU por cantidad). """
+    with _tabla_lock:
+        if clave in _tabla_cache:
+            _tabla_cache.move_to_end(clave)
+            return _tabla_cache[clave]
+    valor = calcular()
+    with _tabla_lock:
+        _tabla_cache[clave] = valor
+        while len(_tabla_cache) > TABLA_CACHE_MAX:
+            _tabla_cache.popitem(last=False)
+    return valor
+
+def valores_fecha(serie):
+    """ Columna de fechas como datetime64: 'created' ya lo es; 'assigned'/'answerTime' vienen en ms epoch. """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return pd.to_datetime(pd.to_numeric(serie, errors='coerce'), unit='ms', errors='coerce')
+
+def formatear_detalle(serie, columna, tipo):
+    """ Texto que muestra la tabla (y contra el que se filtran las columnas de texto). """
+    if tipo == 'fecha':
+        return valores_fecha(serie).dt.strftime(FORMATO_FECHA_DETALLE).fillna('')
+    if columna == 'attentionHour':
+        return serie.map({True: 'Sí', False: 'No'}).astype(object).fillna('')
+    serie = serie.astype(object)
+    return serie.where(serie.notna(), '').astype(str)
+
+def columna_detalle(df, columna):
+    return df[columna] if columna in df.columns else pd.Series([None] * len(df), index=df.index, dtype=object)
+
+def diccionario_detalle(serie, columna, tipo):
+    """
+    (códigos por fila, textos distintos) de una columna de texto, con el texto vacío al final
+    (los nulos usan ese código). Orden y filtros trabajan sobre los distintos, no sobre cada fila:
+    en las categóricas son unas decenas.
+    """
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos, unicos = serie.cat.codes.to_numpy(), pd.Series(serie.cat.categories)
+    else:
+        codigos, unicos = pd.factorize(serie)
+        unicos = pd.Series(unicos)
+    textos = np.append(formatear_detalle(unicos, columna, tipo).to_numpy(dtype=object), '')
+    codigos = np.where(codigos < 0, len(textos) - 1, codigos)
+    return codigos, textos
+
+def orden_columna(df, id_col):
+    """ Posiciones que ordenan el DataFrame por la columna, ascendente y estable, con los vacíos al final. """
+    columna, tipo = DETALLE_POR_ID[id_col]
+    serie = columna_detalle(df, columna)
+    if columna == 'created' and serie.is_monotonic_increasing:
+        return np.arange(len(df), dtype=np.int32) # El snapshot ya está ordenado por fecha (ordenar_por_fecha)
+    if tipo == 'fecha':
+        fechas = valores_fecha(serie).to_numpy(dtype='datetime64[ns]')
+        clave = fechas.view(np.int64).copy()
+        clave[np.isnat(fechas)] = np.iinfo(np.int64).max # Vacíos al final
+    else:
+        # Se ordenan los textos distintos y se expande con los códigos; los vacíos van al final
+        codigos, textos = diccionario_detalle(serie, columna, tipo)
+        rango = np.empty(len(textos), dtype=np.int64)
+        rango[np.argsort(textos.astype(str), kind='stable')] = np.arange(len(textos))
+        rango[textos == ''] = len(textos)
+        clave = rango[codigos]
+    return np.argsort(clave, kind='stable').astype(np.int32)
+
+def rango_de_prefijo(texto):
+    """ '2026-10' -> [1/10/2026, 1/11/2026): el intervalo que cubre un prefijo de fecha ISO. """
+    inicio = pd.Timestamp(texto)
+    pasos = {4: pd.DateOffset(years=1), 7: pd.DateOffset(months=1), 10: pd.Timedelta(days=1), 16: pd.Timedelta(minutes=1)}
+    return inicio, inicio + pasos.get(len(texto), pd.Timedelta(seconds=1))
+
+def mascara_condicion(df, id_col, operador, valor):
+    """ Máscara de una condición del filter_query; None si no se puede aplicar (se ignora). """
+    if id_col not in DETALLE_POR_ID: return None
+    columna, tipo = DETALLE_POR_ID[id_col]
+    serie = columna_detalle(df, columna)
+    sensible = not operador.startswith('i')
+    operador = OPERADORES_FILTRO.get(operador, operador)
+    if operador[:1] in ('i', 's') and operador[1:] in ('eq', 'ne', 'lt', 'le', 'gt', 'ge', 'contains'):
+        operador = operador[1:]
+
+    if tipo == 'fecha':
+        fechas = valores_fecha(serie)
+        try:
+            inicio, fin = rango_de_prefijo(valor)
+        except ValueError:
+            return None
+        if operador in ('eq', 'contains', 'datestartswith'): mascara = (fechas >= inicio) & (fechas < fin)
+        elif operador == 'ne': mascara = ~((fechas >= inicio) & (fechas < fin))
+        elif operador == 'lt': mascara = fechas < inicio
+        elif operador == 'le': mascara = fechas < fin
+        elif operador == 'gt': mascara = fechas >= fin
+        elif operador == 'ge': mascara = fechas >= inicio
+        else: return None
+        return mascara.to_numpy(dtype=bool, na_value=False)
+
+    codigos, distintos = diccionario_detalle(serie, columna, tipo)
+    textos = pd.Series(distintos, dtype=object).astype(str)
+    if not sensible:
+        textos, valor = textos.str.lower(), valor.lower()
+    if operador == 'contains': mascara = textos.str.contains(valor, regex=False)
+    elif operador == 'eq': mascara = textos == valor
+    elif operador == 'ne': mascara = textos != valor
+    elif operador == 'lt': mascara = textos < valor
+    elif operador == 'le': mascara = textos <= valor
+    elif operador == 'gt': mascara = textos > valor
+    elif operador == 'ge': mascara = textos >= valor
+    else: return None
+    return mascara.to_numpy(dtype=bool, na_value=False)[codigos]
+
+def mascara_filtro(df, filter_query):
+    """ Máscara del filter_query completo ('{col} op valor && ...'); None si no filtra nada. """
+    mascara = None
+    for parte in (filter_query or '').split(' && '):
+        coincidencia = PATRON_CONDICION.match(parte.strip())
+        if not coincidencia: continue
+        valor = coincidencia.group('valor').strip()
+        if len(valor) >= 2 and valor[0] == valor[-1] and valor[0] in ('"', "'", '`'):
+            valor = valor[1:-1].replace('\\' + valor[0], valor[0])
+        condicion = mascara_condicion(df, coincidencia.group('columna'), coincidencia.group('operador'), valor)
+        if condicion is not None:
+            mascara = condicion if mascara is None else mascara & condicion
+    return mascara
+
+def posiciones_detalle(vista, df, sort_by, filter_query):
+    """ Posiciones de las filas a mostrar, filtradas y en orden (por defecto, las más recientes primero). """
+    orden_pedido = sort_by[0] if sort_by else {'column_id': 'created', 'direction': 'desc'}
+    id_col = orden_pedido['column_id'] if orden_pedido['column_id'] in DETALLE_POR_ID else 'created'
+    descendente = orden_pedido.get('direction') == 'desc'
+
+    def calcular():
+        orden = en_cache_tabla((clave_vista(vista), id_col), lambda: orden_columna(df, id_col))
+        if descendente:
+            orden = orden[::-1]
+        mascara = mascara_filtro(df, filter_query)
+        return orden if mascara is None else orden[mascara[orden]]
+    return en_cache_tabla((clave_vista(vista), filter_query or '', id_col, descendente), calcular)
+
+def pagina_detalle(df, posiciones, pagina, tam_pagina):
+    """ Registros (ya formateados) de una página de la tabla. """
+    filas = df.iloc[posiciones[pagina * tam_pagina:(pagina + 1) * tam_pagina]]
+    columnas = {id_col: formatear_detalle(columna_detalle(filas, col_df), col_df, tipo).to_numpy()
+                for id_col, col_df, _, tipo in COLUMNAS_DETALLE}
+    return [{id_col: valores[i] for id_col, valores in columnas.items()} for i in range(len(filas))]
+
+# -------------------------------------------------------------------
+# EXPORTACIÓN (CSV / Parquet en streaming desde /exportar)
+# -------------------------------------------------------------------
+# Las filas salen del snapshot en memoria (y, para días anteriores al mes en curso,
+# de las particiones Arrow del histórico, de a un día) en bloques: cada bloque se
+# filtra, se convierte y se envía antes de armar el siguiente, así la memoria no
+# depende del tamaño del archivo. La descarga ocupa un hilo del worker fuera de los
+# callbacks de Dash, y hay un tope de exportaciones simultáneas por worker para que
+# no acaparen los hilos. Las columnas son las de la tabla de detalle (COLUMNAS_DETALLE).
+FILAS_POR_BLOQUE_EXPORTAR = 50_000
+EXPORTAR_MAX_SIMULTANEAS = int(os.environ.get("DASHBOARD_EXPORTAR_MAX", 2))
+_exportaciones = threading.BoundedSemaphore(EXPORTAR_MAX_SIMULTANEAS)
+# Parámetro de /exportar -> columna del DataFrame (se puede repetir: ?canal=WhatsApp&canal=Facebook)
+FILTROS_EXPORTAR = {dim: COLUMNAS_CUBO[dim] for dim in DIMENSIONES_FILTRO}
+FORMATOS_EXPORTAR = {'csv': 'text/csv; charset=utf-8', 'parquet': 'application/vnd.apache.parquet'}
+ESQUEMA_EXPORTAR = pa.schema([(id_col, pa.timestamp('ms') if tipo == 'fecha' else pa.bool_() if col_df == 'attentionHour' else pa.string())
+                              for id_col, col_df, _, tipo in COLUMNAS_DETALLE])
+
+class salida_en_bloques:
+    """
+    Destino de solo escritura para ParquetWriter: guarda lo escrito hasta que el stream lo
+    retira. tell() sigue contando el total, porque el pie del Parquet guarda posiciones absolutas.
+    """
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def retirar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+def tramos_exportar(df_mes, desde, hasta):
+    """
+    DataFrames a exportar en orden de fecha. Sin rango, el snapshot completo; con rango, un día
+    del histórico por vez (los días sin partición se omiten) y después el tramo del snapshot.
+    """
+    if desde is None:
+        yield df_mes
+        return
+    inicio_mes = datetime.now().date().replace(day=1)
+    if desde < inicio_mes:
+        for dia in dias_en_rango(desde, min(hasta, inicio_mes - timedelta(days=1))):
+            ruta = archivo_particion(dia)
+            if os.path.exists(ruta):
+                yield feather.read_table(ruta, memory_map=True).to_pandas()
+    if hasta >= inicio_mes:
+        yield cortar_periodo(df_mes, max(desde, inicio_mes), hasta + timedelta(days=1))
+
+def bloques_exportar(tramos, filtros):
+    """ Tablas Arrow (ESQUEMA_EXPORTAR) de hasta FILAS_POR_BLOQUE_EXPORTAR filas filtradas. """
+    for df in tramos:
+        posiciones = None
+        if filtros:
+            mascara = np.ones(len(df), dtype=bool)
+            for parametro, valores in filtros.items():
+                serie = columna_detalle(df, FILTROS_EXPORTAR[parametro])
+                elegidas = serie.isin([v for v in valores if v != VALOR_VACIO_FILTRO])
+                if VALOR_VACIO_FILTRO in valores:
+                    elegidas |= serie.isna()
+                mascara &= elegidas.to_numpy(dtype=bool)
+            posiciones = np.flatnonzero(mascara)
+        total = len(df) if posiciones is None else len(posiciones)
+        for inicio in range(0, total, FILAS_POR_BLOQUE_EXPORTAR):
+            tramo = slice(inicio, inicio + FILAS_POR_BLOQUE_EXPORTAR)
+            filas = df.iloc[tramo] if posiciones is None else df.iloc[posiciones[tramo]]
+            bloque = pd.DataFrame({id_col: (valores_fecha(columna_detalle(filas, col_df)) if tipo == 'fecha' else columna_detalle(filas, col_df)).to_numpy()
+                                   for id_col, col_df, _, tipo in COLUMNAS_DETALLE})
+            yield pa.Table.from_pandas(bloque, schema=ESQUEMA_EXPORTAR, preserve_index=False)
+
+def exportar_csv(bloques):
+    """ CSV en UTF-8 con BOM (Excel lo abre con los acentos bien); las fechas van al segundo. """
+    salida = salida_en_bloques()
+    salida.write('\ufeff'.encode('utf-8'))
+    esquema = pa.schema([pa.field(c.name, pa.timestamp('s')) if pa.types.is_timestamp(c.type) else c for c in ESQUEMA_EXPORTAR])
+    with pacsv.CSVWriter(salida, esquema) as escritor:
+        for bloque in bloques:
+            escritor.write_table(bloque.cast(esquema, safe=False)) # safe=False: descarta los milisegundos
+            yield salida.retirar()
+    yield salida.retirar()
+
+def exportar_parquet(bloques):
+    """ Parquet con un row group por bloque; cada row group se envía apenas se escribe. """
+    salida = salida_en_bloques()
+    with pq.ParquetWriter(salida, ESQUEMA_EXPORTAR) as escritor:
+        for bloque in bloques:
+            escritor.write_table(bloque)
+            yield salida.retirar()
+    yield salida.retirar() # Pie del archivo
+
+def stream_exportacion(snap, formato, desde, hasta, filtros):
+    """ Bytes del archivo exportado; cuenta filas y bytes en las métricas al terminar. """
+    filas = enviados = 0
+    def contados(bloques):
+        nonlocal filas
+        for bloque in bloques:
+            filas += bloque.num_rows
+            yield bloque
+    bloques = contados(bloques_exportar(tramos_exportar(snap['datos']['df'], desde, hasta), filtros))
+    try:
+        for parte in (exportar_parquet(bloques) if formato == 'parquet' else exportar_csv(bloques)):
+            if parte:
+                enviados += len(parte)
+                yield parte
+    finally:
+        contar('dashboard_exportacion_filas_total', filas, formato=formato)
+        contar('dashboard_exportacion_bytes_total', enviados, formato=formato)
+
+def enlace_exportar(vista, formato):
+    """ URL relativa de /exportar con el rango de fechas y los filtros elegidos en el tablero. """
+    parametros = [('formato', formato)]
+    if vista and (vista.get('desde') or vista.get('hasta')):
+        desde, hasta = parsear_rango(vista.get('desde'), vista.get('hasta'))
+        parametros += [('desde', desde.isoformat()), ('hasta', hasta.isoformat())]
+    parametros += [(dim, valor) for dim, valores in filtros_de_vista(vista) for valor in valores]
+    return f"exportar?{urlencode(parametros)}"
+
 # --- BLOQUE PRINCIPAL DE CARGA DE DATOS ---
+def objetivo_pv_en_rango(desde, hasta):
+    """ Objetivo acumulado de un Punto de Venta entre desde y hasta (date), sin contar días futuros. """
+    dias = pd.date_range(desde, min(hasta, datetime.now().date()), freq='D')
+    return int(sum(OBJETIVO_DIARIO_POR_PV.get(dia, 0) for dia in dias.day_name()))
+
 def calcular_objetivo_pos_venta_acumulado(hoy):
     """ Calcula el objetivo acumulado para un Punto de Venta hasta la fecha actual. """
     inicio_mes = hoy.replace(day=1).date()
@@ -234,22 +1348,114 @@ def calcular_objetivo_pos_venta_acumulado(hoy):
         
     return objetivo_acumulado
 
-def cargar_datos_y_calcular_kpis():
+def fusionar_por_id(df_base, df_delta):
+    """ Fusiona el delta sobre el mes ya procesado: por 'id', gana la versión más reciente. """
+    if df_base is None or df_base.empty: return df_delta
+    if df_delta.empty or delta_sin_cambios(df_base, df_delta): return df_base
+    df = pd.concat([df_base, df_delta], ignore_index=True)
+    # concat de categóricas con categorías distintas las vuelve object: se recompacta
+    return compactar_dataframe(deduplicar_por_id(df))
+
+def delta_sin_cambios(df_base, df_delta):
+    """
+    True si todas las filas del delta ya están, iguales, en df_base (la ventana se solapa con la
+    anterior y suele traer de nuevo conversaciones que no cambiaron). Compara hashes por fila,
+    que no dependen de si la columna es categórica o texto, solo sobre las filas del delta.
+    """
+    if list(df_base.columns) != list(df_delta.columns) or 'id' not in df_delta.columns or df_delta['id'].isna().any():
+        return False
+    previas = df_base[df_base['id'].isin(df_delta['id']).to_numpy()]
+    if len(previas) != len(df_delta): return False
+    hash_previas = pd.util.hash_pandas_object(previas.sort_values('id'), index=False).to_numpy()
+    hash_delta = pd.util.hash_pandas_object(df_delta.sort_values('id'), index=False).to_numpy()
+    return bool((hash_previas == hash_delta).all())
+
+def deduplicar_por_id(df):
+    """ Deja una fila por 'id' (la última). Las filas sin id no se pueden deduplicar: se conservan todas. """
+    if df.empty or 'id' not in df.columns: return df
+    duplicadas = df['id'].notna() & df.duplicated(subset='id', keep='last')
+    if not duplicadas.any(): return df
+    return df[~duplicadas].reset_index(drop=True)
+
+def calcular_desde_delta(df_previo, watermark, ahora):
+    """ Inicio de la ventana incremental: watermark (con solapamiento) o la activa más antigua a re-chequear. """
+    inicio_mes = ahora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    desde = watermark - timedelta(minutes=HIBOT_DELTA_SOLAPAMIENTO_MIN)
+
+    limite_recheck = ahora - timedelta(hours=HIBOT_RECHECK_HORAS)
+    activas = df_previo['status'].isin(ESTADOS_ACTIVOS) & (df_previo['created'] >= limite_recheck)
+    if activas.any():
+        desde = min(desde, df_previo.loc[activas, 'created'].min().to_pydatetime())
+    return max(desde, inicio_mes)
+
+def sincronizar_conversaciones(datos_previos=None):
+    """
+    Trae las conversaciones del mes desde la API. Con un snapshot previo del mismo mes
+    solo descarga el delta y lo fusiona por 'id'; si la descarga falla, conserva lo anterior.
+    Devuelve (df_mes_en_curso, estado_sync).
+    """
+    ahora = datetime.now()
+    inicio_mes = ahora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    datos_previos = datos_previos or {}
+    df_previo = datos_previos.get('df')
+    watermark = datos_previos.get('sync_watermark')
+    ultimo_completo = datos_previos.get('sync_completo')
+    estado_previo = {'sync_watermark': watermark, 'sync_completo': ultimo_completo, 'sync_desde': None}
+
+    sync_completo = (
+        df_previo is None or df_previo.empty or watermark is None or ultimo_completo is None
+        or watermark < inicio_mes
+        or ahora - ultimo_completo > timedelta(hours=HIBOT_FULL_SYNC_HORAS)
+    )
+    desde = inicio_mes if sync_completo else calcular_desde_delta(df_previo, watermark, ahora)
+    print(f"Sincronización {'COMPLETA' if sync_completo else 'INCREMENTAL'} desde {desde.strftime('%d/%m/%Y %H:%M')}")
+
+    token = get_auth_token()
+    if not token:
+        registrar_error_refresco('login', "No se pudo obtener el token de la API")
+        return (df_previo if df_previo is not None else pd.DataFrame()), estado_previo
+    try:
+        df_delta, ventanas_fallidas = consultar_conversaciones(token, desde, ahora)
+    except Exception as e:
+        print(f"Error al obtener datos de API: {e}")
+        registrar_error_refresco('descarga', e)
+        return (df_previo if df_previo is not None else pd.DataFrame()), estado_previo
+    if ventanas_fallidas:
+        registrar_error_refresco('descarga', f"{len(ventanas_fallidas)} ventanas fallidas (se reintentan en el próximo refresco)")
+
+    if sync_completo:
+        df_mes_en_curso = df_delta
+        if ventanas_fallidas and df_previo is not None and not df_previo.empty:
+            # Para los tramos que fallaron seguimos mostrando lo que ya teníamos
+            previas = concatenar_lotes([cortar_periodo(df_previo, ini, fin) for ini, fin in ventanas_fallidas])
+            df_mes_en_curso = fusionar_por_id(previas, df_delta)
+    else:
+        df_mes_en_curso = fusionar_por_id(df_previo, df_delta)
+        print(f"Delta: {len(df_delta)} conversaciones fusionadas sobre {len(df_previo)}.")
+
+    # Con ventanas fallidas, el watermark no avanza más allá de la primera: el próximo delta las reintenta
+    nuevo_watermark = ventanas_fallidas[0][0] if ventanas_fallidas else ahora
+    return df_mes_en_curso, {
+        'sync_watermark': nuevo_watermark,
+        'sync_completo': ahora if sync_completo else ultimo_completo,
+        'sync_desde': desde, # Desde dónde pudo cambiar el mes: lo que hay que reescribir en el histórico
+    }
+
+def cargar_datos_y_calcular_kpis(datos_previos=None):
     """ Función que encapsula la carga de datos y el cálculo de KPIs, para ser llamada por el intervalo. """
     print("--- INICIANDO CARGA DE DATOS ---")
     
     # Bandera para saber si estamos en modo local
     is_local_mode = not (HIBOT_APP_ID and HIBOT_APP_SECRET)
+    estado_sync = {'sync_watermark': None, 'sync_completo': None, 'sync_desde': None}
 
     if is_local_mode:
         print("Modo detectado: DESARROLLO LOCAL (Archivo JSON)")
-        raw_data = cargar_datos_locales()
+        df_mes_en_curso = cargar_datos_locales((datos_previos or {}).get('df'))
     else:
         print("Modo detectado: PRODUCCIÓN (API)")
-        token = get_auth_token()
-        raw_data = fetch_live_data(token)
+        df_mes_en_curso, estado_sync = sincronizar_conversaciones(datos_previos)
 
-    df_mes_en_curso = procesar_dataframe(raw_data)
     print(f"Conversaciones procesadas para el mes: {len(df_mes_en_curso)}")
     print("--------------------------------")
     
@@ -269,58 +1475,62 @@ def cargar_datos_y_calcular_kpis():
     OBJETIVO_POS_VENTA_ACUMULADO = calcular_objetivo_pos_venta_acumulado(datetime.now())
 
 
-    # --- CÁLCULO DE KPIS ---
-    total_conversaciones_mes = 0
-    total_conversaciones_hoy = 0
+    with medir_etapa('kpis'):
+        kpis = calcular_kpis(df_mes_en_curso, hoy_fecha)
+    with medir_etapa('latencias'):
+        # Solo se rehacen los días desde donde pudo cambiar el mes (sync_desde)
+        latencias = actualizar_sketches((datos_previos or {}).get('latencias'), df_mes_en_curso, estado_sync.get('sync_desde'))
+
+    return {
+        'df': df_mes_en_curso,
+        **kpis,
+        'latencias': latencias,
+        'meta_pv_acumulada': OBJETIVO_POS_VENTA_ACUMULADO,
+        'fecha_simulada': hoy_fecha,
+        **estado_sync
+    }
+
+def calcular_kpis(df_mes_en_curso, hoy_fecha):
+    """ KPIs del mes y de 'hoy' (hoy_fecha) a partir del DataFrame procesado; incluye el cubo que usan los gráficos. """
+    # --- CÁLCULO DE KPIS (todas son rebanadas del cubo, salvo los contactos únicos) ---
+    cubo = construir_cubo(df_mes_en_curso)
+    hoy_ts = pd.Timestamp(hoy_fecha)
+    filtro_hoy = {'dia': hoy_ts}
+
+    total_conversaciones_mes = cubo_total(cubo)
+    total_conversaciones_hoy = cubo_total(cubo, filtro_hoy)
     total_contactos_unicos_hoy = 0 
     total_contactos_unicos_mes = 0 
-    total_venta = 0
-    total_venta_a_confirmar = 0
-    total_venta_perdida = 0
-    total_otro_motivo = 0
-    total_reclamo = 0
     conversion_whatsapp = 0.0
-    
-    # NUEVOS KPIS DE DIRECCIÓN (Punto 1)
-    in_hoy = 0
-    out_hoy = 0
-    in_mes = 0
-    out_mes = 0
-    
+
+    # Conteo IN/OUT (Punto 1)
+    direccion_mes = cubo_contar(cubo, 'direccion')
+    direccion_hoy = cubo_contar(cubo, 'direccion', filtro_hoy)
+    in_hoy = int(direccion_hoy.get('IN', 0))
+    out_hoy = int(direccion_hoy.get('OUT', 0))
+    in_mes = int(direccion_mes.get('IN', 0))
+    out_mes = int(direccion_mes.get('OUT', 0))
+
+    # Typing metrics
+    typing_mes = cubo_contar(cubo, 'typing')
+    total_venta = int(typing_mes.get('VENTA', 0))
+    total_venta_a_confirmar = int(typing_mes.get('VENTA A CONFIRMAR', 0))
+    total_venta_perdida = int(typing_mes.get('VENTA PERDIDA', 0))
+    total_otro_motivo = int(typing_mes.get('OTRO MOTIVO', 0))
+    total_reclamo = int(typing_mes.get('RECLAMO', 0))
+
     if not df_mes_en_curso.empty:
-        
-        # Conversaciones (Total rows)
-        total_conversaciones_mes = len(df_mes_en_curso)
-        # Usamos la HOY_FECHA simulada o real para el filtro 'HOY'
-        df_hoy = df_mes_en_curso[df_mes_en_curso['created'].dt.date == hoy_fecha]
-        total_conversaciones_hoy = len(df_hoy)
-        
-        # Conteo IN/OUT (Punto 1)
-        in_hoy = len(df_hoy[df_hoy['direction'] == 'IN'])
-        out_hoy = len(df_hoy[df_hoy['direction'] == 'OUT'])
-        in_mes = len(df_mes_en_curso[df_mes_en_curso['direction'] == 'IN'])
-        out_mes = len(df_mes_en_curso[df_mes_en_curso['direction'] == 'OUT'])
-        
-        # Contactos Únicos (Unique user IDs)
+        # Contactos Únicos (Unique user IDs): no se pueden sumar desde el cubo
         if 'userId' in df_mes_en_curso.columns and df_mes_en_curso['userId'].notna().any():
             total_contactos_unicos_mes = df_mes_en_curso['userId'].nunique()
-            total_contactos_unicos_hoy = df_hoy['userId'].nunique()
+            total_contactos_unicos_hoy = filas_del_periodo(df_mes_en_curso, 'HOY', hoy_ts)['userId'].nunique()
         
-        # Typing metrics
-        if 'typing' in df_mes_en_curso.columns:
-            total_venta = len(df_mes_en_curso[df_mes_en_curso['typing'] == 'VENTA'])
-            total_venta_a_confirmar = len(df_mes_en_curso[df_mes_en_curso['typing'] == 'VENTA A CONFIRMAR'])
-            total_venta_perdida = len(df_mes_en_curso[df_mes_en_curso['typing'] == 'VENTA PERDIDA'])
-            total_otro_motivo = len(df_mes_en_curso[df_mes_en_curso['typing'] == 'OTRO MOTIVO'])
-            total_reclamo = len(df_mes_en_curso[df_mes_en_curso['typing'] == 'RECLAMO'])
-
         # WhatsApp Conversion (CÁLCULO AJUSTADO a Contactos Únicos)
         if 'channelType' in df_mes_en_curso.columns:
-            df_wp = df_mes_en_curso[df_mes_en_curso['channelType'] == 'WhatsApp']
-            
-            ventas_wp = len(df_wp[df_wp['typing'] == 'VENTA'])
+            ventas_wp = cubo_total(cubo, {'canal': 'WhatsApp', 'typing': 'VENTA'})
+            es_wp = (df_mes_en_curso['channelType'] == 'WhatsApp').to_numpy()
             # Usar contactos únicos no nulos de WhatsApp
-            contactos_unicos_wp = df_wp['userId'].dropna().nunique() if 'userId' in df_wp.columns else len(df_wp)
+            contactos_unicos_wp = df_mes_en_curso['userId'][es_wp].dropna().nunique() if 'userId' in df_mes_en_curso.columns else int(es_wp.sum())
             
             if contactos_unicos_wp > 0:
                 conversion_whatsapp = (ventas_wp / contactos_unicos_wp) * 100
@@ -328,7 +1538,8 @@ def cargar_datos_y_calcular_kpis():
                 conversion_whatsapp = 0.0
     
     return {
-        'df': df_mes_en_curso,
+        'cubo': cubo,
+        'ranking': construir_ranking(df_mes_en_curso),
         'conv_mes': total_conversaciones_mes,
         'conv_hoy': total_conversaciones_hoy,
         'contactos_mes': total_contactos_unicos_mes,
@@ -339,14 +1550,573 @@ def cargar_datos_y_calcular_kpis():
         'otro_motivo': total_otro_motivo,
         'reclamo': total_reclamo,
         'conv_wp': conversion_whatsapp,
-        'meta_pv_acumulada': OBJETIVO_POS_VENTA_ACUMULADO,
-        'fecha_simulada': hoy_fecha,
         'in_hoy': in_hoy,    # NUEVO
         'out_hoy': out_hoy,  # NUEVO
         'in_mes': in_mes,    # NUEVO
-        'out_mes': out_mes   # NUEVO
+        'out_mes': out_mes,  # NUEVO
     }
 
+# -------------------------------------------------------------------
+# SNAPSHOT COMPARTIDO (Una sola descarga por refresco para todas las sesiones)
+# -------------------------------------------------------------------
+# Cada pestaña abierta tiene su propio dcc.Interval. En lugar de que cada una
+# descargue el mes completo, todas leen el mismo snapshot versionado (DataFrame
+# procesado + KPIs). El snapshot se publica en disco para que lo compartan
+# todos los workers de gunicorn, y un lock de archivo garantiza que un solo
+# proceso a la vez consulte la API.
+#
+# En disco el DataFrame se guarda en Arrow IPC (Feather sin comprimir, se puede
+# mapear en memoria) y los KPIs + watermark de sincronización en un JSON que
+# apunta a ese archivo. Así un worker nuevo o un deploy arranca sirviendo el
+# último snapshot en milisegundos y solo descarga el delta.
+SNAPSHOT_DIR = os.environ.get("DASHBOARD_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_dashboard"))
+# Cada cuánto se refresca el snapshot (delta contra la API). Los navegadores se enteran por push (/eventos)
+SNAPSHOT_TTL_SEGUNDOS = int(os.environ.get("DASHBOARD_SNAPSHOT_TTL", 5 * 60))
+ARCHIVO_SNAPSHOT = os.path.join(SNAPSHOT_DIR, "snapshot.json") # Metadatos; el DataFrame va en snapshot-<version>.arrow
+ARCHIVO_LOCK_REFRESCO = os.path.join(SNAPSHOT_DIR, "refresco.lock")
+
+_snapshot_lock = threading.Lock() # Protege el snapshot en memoria de este worker
+_refresco_lock = threading.Lock() # Respaldo cuando no hay fcntl (Windows)
+_snapshot_publicado = threading.Condition() # Avisa a /eventos que este worker publicó una versión nueva
+_snapshot_actual = None # {'version': int, 'creado': float, 'datos': dict}
+_snapshot_mtime = None  # mtime del archivo del que se cargó _snapshot_actual
+# Últimas versiones en memoria, para que un cliente con la clave anterior aún la resuelva
+SNAPSHOTS_EN_MEMORIA = 3
+_snapshots_por_version = OrderedDict()
+
+def clave_snapshot(snap):
+    """ Clave que viaja al navegador. Es texto: la versión en ns no cabe en un número de JavaScript. """
+    return str(snap['version'])
+
+def registrar_snapshot(snap):
+    """ Guarda el snapshot entre las versiones recientes (llamar con _snapshot_lock tomado). """
+    _snapshots_por_version[clave_snapshot(snap)] = snap
+    while len(_snapshots_por_version) > SNAPSHOTS_EN_MEMORIA:
+        _snapshots_por_version.popitem(last=False)
+
+def resolver_snapshot(clave):
+    """
+    Devuelve el snapshot de esa versión, o None si ya no está en memoria (se desalojó o
+    nunca pasó por este worker). Nunca cae al más reciente: quien cachea por la clave
+    guardaría como de esa versión algo calculado con otro DataFrame.
+    """
+    with _snapshot_lock:
+        snap = _snapshots_por_version.get(clave)
+    if snap is None:
+        snap = obtener_snapshot() # Puede ser la versión que otro worker acaba de publicar
+        if snap is not None and clave_snapshot(snap) != clave:
+            return None
+    return snap
+
+def vista_vigente(vista):
+    """
+    Si la clave de la vista ya no se puede resolver, la misma vista sobre el snapshot vigente
+    (sin 'anterior': el navegador no tiene nada de esa versión contra qué parchear).
+    """
+    if not isinstance(vista, dict) or vista.get('clave') is None:
+        return vista
+    if resolver_snapshot(str(vista['clave'])) is not None:
+        return vista
+    snap = obtener_snapshot()
+    if snap is None:
+        return vista
+    return {**{k: v for k, v in vista.items() if k != 'anterior'}, 'clave': clave_snapshot(snap)}
+
+CAMPOS_FECHA_SNAPSHOT = ['sync_watermark', 'sync_completo', 'sync_desde']
+
+def escribir_snapshot_en_disco(snap):
+    """ Escribe el DataFrame en Arrow IPC y luego, de forma atómica, el JSON que lo referencia. """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    datos = snap['datos']
+    archivo_df = f"snapshot-{snap['version']}.arrow"
+    tmp_df = os.path.join(SNAPSHOT_DIR, f"{archivo_df}.{os.getpid()}.tmp")
+    # Sin compresión: el archivo se puede mapear en memoria al leerlo
+    with medir_etapa('escribir_snapshot'):
+        feather.write_feather(datos['df'], tmp_df, compression='uncompressed')
+    fijar('dashboard_snapshot_bytes', os.path.getsize(tmp_df))
+    os.replace(tmp_df, os.path.join(SNAPSHOT_DIR, archivo_df))
+    escribir_metadatos_snapshot(snap)
+
+    # Se conserva el archivo anterior por si otro worker lo está leyendo en este momento
+    archivos = sorted(a for a in os.listdir(SNAPSHOT_DIR) if a.startswith('snapshot-') and a.endswith('.arrow'))
+    for viejo in archivos[:-2]:
+        try: os.remove(os.path.join(SNAPSHOT_DIR, viejo))
+        except OSError: pass
+
+# Lo que no va al JSON: el DataFrame (en Arrow) y lo que se reconstruye a partir de él
+CAMPOS_NO_PERSISTIDOS = ('df', 'cubo', 'ranking', 'indice', 'latencias')
+
+def escribir_metadatos_snapshot(snap):
+    """ Escribe, de forma atómica, el JSON con los KPIs y el estado de sincronización que apunta al Arrow de la versión. """
+    datos = snap['datos']
+    archivo_df = f"snapshot-{snap['version']}.arrow"
+    metadatos = {k: v for k, v in datos.items() if k not in CAMPOS_NO_PERSISTIDOS}
+    metadatos['fecha_simulada'] = datos['fecha_simulada'].isoformat()
+    for campo in CAMPOS_FECHA_SNAPSHOT:
+        if metadatos.get(campo) is not None:
+            metadatos[campo] = metadatos[campo].isoformat()
+    contenido = {'version': snap['version'], 'creado': snap['creado'], 'archivo_df': archivo_df, 'datos': metadatos}
+
+    tmp_json = f"{ARCHIVO_SNAPSHOT}.{os.getpid()}.tmp"
+    with open(tmp_json, 'w', encoding='utf-8') as f:
+        json.dump(contenido, f, default=lambda o: o.item() if hasattr(o, 'item') else str(o)) # Escalares numpy
+    os.replace(tmp_json, ARCHIVO_SNAPSHOT)
+
+def leer_snapshot_de_disco(previo=None):
+    """
+    Lee el snapshot publicado: JSON de metadatos + DataFrame Arrow mapeado en memoria.
+    Si es la misma versión que previo (solo se reescribió el JSON, ver guardar_sincronizacion)
+    se reutiliza su DataFrame y lo derivado en lugar de volver a leerlo.
+    """
+    with open(ARCHIVO_SNAPSHOT, 'r', encoding='utf-8') as f:
+        contenido = json.load(f)
+    datos = contenido['datos']
+    datos['fecha_simulada'] = datetime.fromisoformat(datos['fecha_simulada']).date()
+    for campo in CAMPOS_FECHA_SNAPSHOT:
+        if datos.get(campo) is not None:
+            datos[campo] = datetime.fromisoformat(datos[campo])
+    if previo is not None and previo['version'] == contenido['version']:
+        datos.update({k: v for k, v in previo['datos'].items() if k in CAMPOS_NO_PERSISTIDOS})
+        return {'version': contenido['version'], 'creado': contenido['creado'], 'datos': datos}
+    tabla = feather.read_table(os.path.join(SNAPSHOT_DIR, contenido['archivo_df']), memory_map=True)
+    datos['df'] = tabla.to_pandas()
+    # El cubo, el ranking y los sketches de latencias no se persisten: se reconstruyen con un pase sobre el DataFrame
+    datos['cubo'] = construir_cubo(datos['df'])
+    datos['ranking'] = construir_ranking(datos['df'])
+    datos['latencias'] = construir_sketches(datos['df'])
+    return {'version': contenido['version'], 'creado': contenido['creado'], 'datos': datos}
+
+def obtener_snapshot():
+    """ Devuelve el último snapshot publicado por cualquier worker. Nunca consulta la API. """
+    global _snapshot_actual, _snapshot_mtime
+    try:
+        mtime = os.stat(ARCHIVO_SNAPSHOT).st_mtime_ns
+    except OSError:
+        return _snapshot_actual # Aún no hay nada publicado en disco
+
+    with _snapshot_lock:
+        if mtime != _snapshot_mtime:
+            try:
+                snap = leer_snapshot_de_disco(_snapshot_actual)
+                if _snapshot_actual is None or snap['version'] >= _snapshot_actual['version']:
+                    _snapshot_actual = snap
+                    registrar_snapshot(snap)
+                _snapshot_mtime = mtime
+            except Exception as e:
+                print(f"Error al leer snapshot compartido: {e}")
+        return _snapshot_actual
+
+def publicar_snapshot(datos):
+    """ Publica un nuevo snapshot en memoria y en disco (escritura atómica). """
+    global _snapshot_actual, _snapshot_mtime
+    snap = {'version': time.time_ns(), 'creado': time.time(), 'datos': datos}
+    with _snapshot_lock:
+        _snapshot_actual = snap
+        registrar_snapshot(snap)
+        try:
+            escribir_snapshot_en_disco(snap)
+            _snapshot_mtime = os.stat(ARCHIVO_SNAPSHOT).st_mtime_ns
+        except Exception as e:
+            contar('dashboard_errores_total', etapa='escribir_snapshot', tipo=type(e).__name__)
+            print(f"Error al publicar snapshot compartido: {e}")
+    with _snapshot_publicado:
+        _snapshot_publicado.notify_all() # Despierta las conexiones de /eventos de este worker
+    print(f"Snapshot publicado (versión {snap['version']}).")
+    fijar('dashboard_snapshot_filas', len(datos['df']))
+    try:
+        with medir_etapa('historico'):
+            persistir_historico(datos)
+    except Exception as e:
+        print(f"Error al guardar el histórico: {e}")
+    return snap
+
+def guardar_sincronizacion(snap, datos):
+    """
+    Refresco sin cambios: la misma versión (mismo DataFrame y KPIs) con el watermark nuevo, en memoria
+    y en el JSON del disco, para que el próximo delta de cualquier worker arranque desde ahí.
+    No se avisa a /eventos. Devuelve un snapshot nuevo: el publicado no se modifica.
+    """
+    global _snapshot_actual, _snapshot_mtime
+    nuevo = {**snap, 'datos': {**snap['datos'], 'sync_watermark': datos['sync_watermark']}}
+    with _snapshot_lock:
+        if _snapshot_actual is not None and _snapshot_actual['version'] != snap['version']:
+            return _snapshot_actual # Otro worker publicó mientras tanto
+        _snapshot_actual = nuevo
+        registrar_snapshot(nuevo)
+        try:
+            escribir_metadatos_snapshot(nuevo)
+            _snapshot_mtime = os.stat(ARCHIVO_SNAPSHOT).st_mtime_ns
+        except Exception as e:
+            contar('dashboard_errores_total', etapa='escribir_snapshot', tipo=type(e).__name__)
+            print(f"Error al guardar el watermark del snapshot: {e}")
+    return nuevo
+
+# -------------------------------------------------------------------
+# HISTÓRICO PARTICIONADO POR DÍA (Consultas por rango de fechas)
+# -------------------------------------------------------------------
+# Cada día procesado se guarda en su propio archivo Arrow (AAAA-MM-DD.arrow).
+# Nunca se borra historia: el refresco solo agrega días nuevos o reescribe los
+# que el delta pudo haber cambiado. Una consulta por rango lee únicamente las
+# particiones que se solapan con él. Los días anteriores al mes en curso que
+# falten se descargan de la API en segundo plano (solo en producción).
+HISTORICO_DIR = os.environ.get("DASHBOARD_HISTORICO_DIR", os.path.join(SNAPSHOT_DIR, "historico"))
+VISTAS_EN_CACHE = 8
+# Mientras falte histórico del rango elegido, el navegador revisa cada HISTORICO_CHEQUEO_MS si ya llegó
+HISTORICO_CHEQUEO_MS = 5000
+HISTORICO_CHEQUEOS_MAX = 120 # 10 minutos: los días de ventanas fallidas pueden no llegar nunca
+
+_historico_lock = threading.Lock()
+_backfill_lock = threading.Lock()
+_vistas_cache = OrderedDict() # (clave, desde, hasta, generación del histórico[, filtros]) -> vista
+_vistas_lock = threading.Lock()
+
+def archivo_particion(dia):
+    return os.path.join(HISTORICO_DIR, f"{dia.strftime('%Y-%m-%d')}.arrow")
+
+def dias_en_rango(desde, hasta):
+    """ Lista de fechas (date) entre desde y hasta, ambos incluidos. """
+    return [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+
+def guardar_particion(dia, df_dia):
+    """ Escribe (o reemplaza de forma atómica) la partición de un día. """
+    os.makedirs(HISTORICO_DIR, exist_ok=True)
+    destino = archivo_particion(dia)
+    tmp = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    feather.write_feather(df_dia.reset_index(drop=True), tmp, compression='uncompressed')
+    os.replace(tmp, destino)
+
+def guardar_particiones(df, dias=None):
+    """ Guarda una partición por cada día de 'dias' (o por cada día presente en df). Un día sin filas queda vacío. """
+    if df.empty and not dias: return
+    if dias is None:
+        dias = [d.date() for d in df['created'].dt.normalize().dropna().unique()]
+    for dia in dias:
+        guardar_particion(dia, cortar_periodo(df, dia, dia + timedelta(days=1)))
+
+def persistir_historico(datos):
+    """ Vuelca al histórico los días del snapshot que faltan o que el último delta pudo cambiar. """
+    df = datos['df']
+    if df.empty: return
+    desde_cambios = datos.get('sync_desde')
+    with _historico_lock:
+        dias = [d.date() for d in df['created'].dt.normalize().dropna().unique()]
+        pendientes = [d for d in dias
+                      if (desde_cambios is None and datos.get('sync_watermark') is None) # Modo local: todo
+                      or (desde_cambios is not None and d >= desde_cambios.date())
+                      or not os.path.exists(archivo_particion(d))]
+        guardar_particiones(df, pendientes)
+    if pendientes:
+        print(f"Histórico: {len(pendientes)} particiones diarias actualizadas.")
+
+def consultar_historico(desde, hasta, columnas=None):
+    """
+    Conversaciones guardadas entre desde y hasta (fechas, ambos incluidos).
+    Solo abre las particiones de esos días; las que faltan se omiten.
+    """
+    lotes = []
+    for dia in dias_en_rango(desde, hasta):
+        ruta = archivo_particion(dia)
+        if not os.path.exists(ruta):
+            continue
+        lote = feather.read_table(ruta, columns=columnas, memory_map=True).to_pandas()
+        if not lote.empty: lotes.append(lote)
+    return concatenar_lotes(lotes)
+
+def dias_faltantes_historico(desde, hasta):
+    return [d for d in dias_en_rango(desde, hasta) if not os.path.exists(archivo_particion(d))]
+
+def completar_historico(desde, hasta):
+    """ Descarga de la API los días sin partición entre desde y hasta y los guarda (incluso vacíos). """
+    faltantes = dias_faltantes_historico(desde, hasta)
+    if not faltantes: return
+    token = get_auth_token()
+    if not token: return
+    # Agrupar días consecutivos para pedir tramos continuos
+    tramos = []
+    for dia in faltantes:
+        if tramos and dia == tramos[-1][1] + timedelta(days=1): tramos[-1][1] = dia
+        else: tramos.append([dia, dia])
+    for ini, fin in tramos:
+        desde_dt = datetime.combine(ini, datetime.min.time())
+        hasta_dt = datetime.combine(fin + timedelta(days=1), datetime.min.time())
+        try:
+            df, fallidas = consultar_conversaciones(token, desde_dt, hasta_dt)
+        except Exception as e:
+            print(f"Error al completar histórico {ini} - {fin}: {e}")
+            continue
+        df = df[df['created'] < hasta_dt] if not df.empty else df
+        # Los días de ventanas fallidas no se marcan como guardados: se reintentan en otra consulta
+        dias_ok = [d for d in dias_en_rango(ini, fin)
+                   if not any(f_ini.date() <= d <= f_fin.date() for f_ini, f_fin in fallidas)]
+        with _historico_lock:
+            guardar_particiones(df if not df.empty else pd.DataFrame({'created': pd.Series(dtype='datetime64[ms]')}), dias_ok)
+            avanzar_generacion_historico()
+        print(f"Histórico completado: {ini} - {fin} ({len(df)} conversaciones).")
+
+def lanzar_completar_historico(desde, hasta):
+    """ Completa el histórico en un hilo de fondo (uno a la vez por proceso). """
+    if not (HIBOT_APP_ID and HIBOT_APP_SECRET): return
+    if not _backfill_lock.acquire(blocking=False): return
+    def tarea():
+        try: completar_historico(desde, hasta)
+        finally: _backfill_lock.release()
+    threading.Thread(target=tarea, name='completar-historico', daemon=True).start()
+
+def historico_faltante(desde, hasta):
+    """ Cantidad de días del rango, anteriores al mes en curso, que todavía no tienen partición (0 si no hay API). """
+    inicio_mes = datetime.now().date().replace(day=1)
+    if not (HIBOT_APP_ID and HIBOT_APP_SECRET) or desde >= inicio_mes: return 0
+    return len(dias_faltantes_historico(desde, min(hasta, inicio_mes - timedelta(days=1))))
+
+def generacion_historico():
+    """ Cambia cada vez que se agrega o reemplaza una partición (mtime del directorio). """
+    try: return os.stat(HISTORICO_DIR).st_mtime_ns
+    except OSError: return 0
+
+def avanzar_generacion_historico():
+    """ Garantiza una generación nueva tras una descarga, aunque el mtime del directorio no haya cambiado. """
+    try:
+        ahora = max(time.time_ns(), generacion_historico() + 1)
+        os.utime(HISTORICO_DIR, ns=(ahora, ahora))
+    except OSError as e:
+        print(f"No se pudo marcar el histórico como actualizado: {e}")
+
+def parsear_rango(desde, hasta):
+    """ Fechas del selector (ISO, pueden venir vacías) -> (desde, hasta) como date. Por defecto, el mes en curso. """
+    hoy = datetime.now().date()
+    desde = datetime.fromisoformat(desde[:10]).date() if desde else hoy.replace(day=1)
+    hasta = datetime.fromisoformat(hasta[:10]).date() if hasta else hoy
+    return (desde, hasta) if desde <= hasta else (hasta, desde)
+
+def construir_df_rango(df_mes, desde, hasta):
+    """ Une el histórico (días anteriores al mes en curso) con el tramo del snapshot que cae en el rango. """
+    inicio_mes = datetime.now().date().replace(day=1)
+    partes = []
+    if desde < inicio_mes:
+        fin_historico = min(hasta, inicio_mes - timedelta(days=1))
+        if dias_faltantes_historico(desde, fin_historico):
+            lanzar_completar_historico(desde, fin_historico)
+        partes.append(consultar_historico(desde, fin_historico))
+    if hasta >= inicio_mes and not df_mes.empty:
+        partes.append(cortar_periodo(df_mes, max(desde, inicio_mes), hasta + timedelta(days=1)))
+    return concatenar_lotes([p for p in partes if not p.empty])
+
+def resolver_vista(vista):
+    """
+    Resuelve el Store 'vista-storage' ({'clave', 'desde', 'hasta', 'filtros'}) a {'df', 'cubo', 'ranking', 'desde', 'hasta'}
+    (y 'latencias' en el mes sin filtros; las demás vistas las arman al pedirlas, ver latencias_de_vista).
+    Sin rango elegido es el snapshot tal cual; con rango se arma (y cachea) desde el histórico.
+    Con filtros se restringe esa vista con su índice por valor (ver FILTROS GLOBALES) y también se cachea.
+    """
+    if vista is None: return None
+    snap = resolver_snapshot(str(vista_vigente(vista)['clave']))
+    if snap is None: return None
+    datos = snap['datos']
+    if not vista.get('desde') and not vista.get('hasta'):
+        if 'cubo' not in datos: # Snapshot publicado antes de existir el cubo
+            datos['cubo'] = construir_cubo(datos['df'])
+        if 'ranking' not in datos:
+            datos['ranking'] = construir_ranking(datos['df'])
+        if 'latencias' not in datos:
+            datos['latencias'] = construir_sketches(datos['df'])
+        desde, hasta = parsear_rango(None, None)
+        base = {'df': datos['df'], 'cubo': datos['cubo'], 'ranking': datos['ranking'], 'latencias': datos['latencias'],
+                'desde': desde, 'hasta': hasta, 'rango_elegido': False}
+        contenedor = datos # El índice del mes vive con el snapshot
+        clave_base = (clave_snapshot(snap),)
+    else:
+        desde, hasta = parsear_rango(vista.get('desde'), vista.get('hasta'))
+        clave_base = (clave_snapshot(snap), desde, hasta, generacion_historico())
+        base = en_cache_vistas(clave_base, lambda: construir_vista_rango(datos['df'], desde, hasta))
+        contenedor = base
+
+    filtros = filtros_de_vista(vista)
+    if not filtros:
+        return base
+    def calcular():
+        if 'indice' not in contenedor:
+            contenedor['indice'] = construir_indice(contenedor['df'])
+        return filtrar_vista(base, contenedor['indice'], dict(filtros))
+    return en_cache_vistas(clave_base + (filtros,), calcular)
+
+def construir_vista_rango(df_mes, desde, hasta):
+    df = construir_df_rango(df_mes, desde, hasta)
+    return {'df': df, 'cubo': construir_cubo(df), 'ranking': construir_ranking(df), 'desde': desde, 'hasta': hasta, 'rango_elegido': True}
+
+def en_cache_vistas(clave, calcular):
+    """ Devuelve la vista cacheada o la calcula (LRU de VISTAS_EN_CACHE entradas). """
+    with _vistas_lock:
+        if clave in _vistas_cache:
+            _vistas_cache.move_to_end(clave)
+            return _vistas_cache[clave]
+    resultado = calcular()
+    with _vistas_lock:
+        _vistas_cache[clave] = resultado
+        while len(_vistas_cache) > VISTAS_EN_CACHE:
+            _vistas_cache.popitem(last=False)
+    return resultado
+
+def snapshot_vigente(snap):
+    """ Vigente si se publicó, o algún worker lo comprobó sin cambios (último refresco exitoso), hace menos del TTL. """
+    if snap is None: return False
+    comprobado = max(snap['creado'], leer_estado_refresco().get('ultimo_exito') or 0)
+    return (time.time() - comprobado) < SNAPSHOT_TTL_SEGUNDOS
+
+# KPIs escalares del snapshot: si el DataFrame no cambió solo pueden cambiar con el día o la meta
+CAMPOS_KPI = ['conv_mes', 'conv_hoy', 'contactos_mes', 'contactos_hoy', 'venta', 'venta_conf', 'venta_perdida',
+              'otro_motivo', 'reclamo', 'conv_wp', 'in_hoy', 'out_hoy', 'in_mes', 'out_mes',
+              'meta_pv_acumulada', 'fecha_simulada']
+
+def datos_sin_cambios(previos, nuevos):
+    """ True si el refresco devolvió el mismo DataFrame (delta vacío o ya conocido) y los mismos KPIs. """
+    return nuevos['df'] is previos['df'] and all(nuevos.get(c) == previos.get(c) for c in CAMPOS_KPI)
+
+def recargar_y_publicar(snap):
+    """ Carga el mes (delta sobre el snapshot previo, si lo hay), publica el resultado y deja registrado cómo salió. """
+    inicio = time.time()
+    _errores_refresco.clear()
+    try:
+        with medir_etapa('refresco'):
+            datos = cargar_datos_y_calcular_kpis(snap['datos'] if snap else None)
+            if snap is not None and _errores_refresco and datos['df'] is snap['datos']['df']:
+                # La API falló y no hay nada nuevo: se sigue sirviendo el snapshot anterior (con su edad
+                # real) y, como sigue vencido, el próximo chequeo vuelve a intentar.
+                nuevo = snap
+            elif snap is not None and datos_sin_cambios(snap['datos'], datos):
+                # Nada nuevo: no se publica versión ni se avisa a /eventos (los navegadores no recargan).
+                # Solo se guarda el watermark y el refresco exitoso deja al snapshot vigente otro TTL.
+                print("Sin cambios en el mes: se conserva el snapshot vigente.")
+                nuevo = guardar_sincronizacion(snap, datos)
+            else:
+                nuevo = publicar_snapshot(datos)
+    except Exception as e:
+        registrar_error_refresco('refresco', e)
+        guardar_estado_refresco(inicio)
+        raise
+    guardar_estado_refresco(inicio)
+    return nuevo
+
+def refrescar_snapshot_compartido():
+    """
+    Refresca el snapshot solo si está vencido y solo desde un proceso a la vez.
+    Quien no obtiene el lock no espera: devuelve el snapshot vigente.
+    """
+    snap = obtener_snapshot()
+    if snapshot_vigente(snap):
+        return snap
+
+    if fcntl is None:
+        if not _refresco_lock.acquire(blocking=False):
+            return snap
+        try:
+            snap = obtener_snapshot()
+            return snap if snapshot_vigente(snap) else recargar_y_publicar(snap)
+        finally:
+            _refresco_lock.release()
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(ARCHIVO_LOCK_REFRESCO, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return snap # Otro worker/hilo ya está refrescando
+        try:
+            # Otro worker pudo haber publicado mientras esperábamos el lock
+            snap = obtener_snapshot()
+            if snapshot_vigente(snap):
+                return snap
+            return recargar_y_publicar(snap)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# -------------------------------------------------------------------
+# REFRESCO EN SEGUNDO PLANO (stale-while-revalidate)
+# -------------------------------------------------------------------
+# Un hilo por worker revisa cada DASHBOARD_REFRESCO_CHEQUEO_SEG si el snapshot
+# venció. Solo el que obtiene el lock de archivo consulta la API; los demás
+# recogen del disco el snapshot que publicó. Los Callbacks nunca esperan a
+# Hibot: siempre leen el último snapshot completo (publicar_snapshot lo
+# reemplaza de forma atómica). El resultado de cada intento queda en
+# estado_refresco.json para que cualquier worker lo exponga en /estado y /metrics.
+DASHBOARD_REFRESCO_EN_FONDO = os.environ.get("DASHBOARD_REFRESCO_EN_FONDO", "1") == "1"
+DASHBOARD_REFRESCO_CHEQUEO_SEG = float(os.environ.get("DASHBOARD_REFRESCO_CHEQUEO_SEG", 30))
+ARCHIVO_ESTADO_REFRESCO = os.path.join(SNAPSHOT_DIR, "estado_refresco.json")
+
+_errores_refresco = [] # Errores del refresco en curso (uno a la vez por proceso)
+_estado_refresco = {'ultimo_intento': None, 'ultimo_exito': None, 'ultimo_error': None, 'ultimo_error_ts': None}
+_refrescador = {'pid': None, 'hilo': None}
+_refrescador_lock = threading.Lock()
+
+def registrar_error_refresco(etapa, error):
+    """ Anota un error del refresco en curso (se publica al terminar, en guardar_estado_refresco). """
+    _errores_refresco.append(f"{etapa}: {error}")
+
+def guardar_estado_refresco(inicio):
+    """ Registra el resultado del último intento de refresco en memoria y en disco (escritura atómica). """
+    ahora = time.time()
+    estado = dict(leer_estado_refresco())
+    estado['ultimo_intento'] = ahora
+    estado['duracion_seg'] = ahora - inicio
+    if _errores_refresco:
+        estado['ultimo_error'] = ' | '.join(_errores_refresco)
+        estado['ultimo_error_ts'] = ahora
+    else:
+        estado['ultimo_exito'] = ahora
+    _estado_refresco.update(estado)
+    try:
+        tmp = f"{ARCHIVO_ESTADO_REFRESCO}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(estado, f)
+        os.replace(tmp, ARCHIVO_ESTADO_REFRESCO)
+    except OSError as e:
+        print(f"No se pudo guardar el estado del refresco: {e}")
+
+def leer_estado_refresco():
+    """ Estado del último refresco hecho por cualquier worker (el del disco; si no hay, el del proceso). """
+    try:
+        with open(ARCHIVO_ESTADO_REFRESCO, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict(_estado_refresco)
+
+def estado_del_tablero():
+    """ Edad del snapshot vigente y resultado del último refresco, para /estado y /metrics. """
+    snap = obtener_snapshot()
+    refresco = leer_estado_refresco()
+    return {
+        'snapshot_version': snap['version'] if snap else None,
+        'snapshot_creado': snap['creado'] if snap else None,
+        'snapshot_edad_seg': time.time() - snap['creado'] if snap else None,
+        'snapshot_filas': len(snap['datos']['df']) if snap else 0,
+        'snapshot_ttl_seg': SNAPSHOT_TTL_SEGUNDOS,
+        'refresco_en_fondo': DASHBOARD_REFRESCO_EN_FONDO,
+        'refrescador_activo': bool(_refrescador['hilo'] and _refrescador['hilo'].is_alive() and _refrescador['pid'] == os.getpid()),
+        **refresco,
+    }
+
+def bucle_refresco():
+    """ Cuerpo del hilo de refresco: nunca termina por un error, lo registra y sigue. """
+    while True:
+        try:
+            refrescar_snapshot_compartido()
+        except Exception as e:
+            print(f"Error en el refresco en segundo plano: {e}")
+        time.sleep(DASHBOARD_REFRESCO_CHEQUEO_SEG)
+
+def iniciar_refresco_en_fondo():
+    """
+    Arranca el hilo de refresco de este proceso si no está corriendo. Se puede llamar
+    muchas veces: tras un fork (los hilos no se heredan) vuelve a arrancarlo en el hijo.
+    """
+    if not DASHBOARD_REFRESCO_EN_FONDO: return
+    with _refrescador_lock:
+        hilo = _refrescador['hilo']
+        if _refrescador['pid'] == os.getpid() and hilo is not None and hilo.is_alive():
+            return
+        hilo = threading.Thread(target=bucle_refresco, name='refresco-snapshot', daemon=True)
+        _refrescador.update(pid=os.getpid(), hilo=hilo)
+        hilo.start()
+
 # Variables globales iniciales vacías para el layout (se llenarán con el primer callback)
 df_mes_en_curso = pd.DataFrame()
 OBJETIVO_POS_VENTA_ACUMULADO = 0
@@ -425,26 +2195,28 @@ def create_horizontal_bar(value):
     
     return fig
 
-# Reemplazamos la llamada a create_gauge por la nueva función de barra horizontal.
-fig_horizontal_bar = create_horizontal_bar(conversion_whatsapp)
-
 # Componente para las tarjetas KPI
-def tarjeta_kpi(titulo, valor, color_valor, ancho='23%'):
+def tarjeta_kpi(titulo, valor, color_valor, ancho='23%', id_valor=None):
+    # id_valor identifica el nodo del número: el refresco actualiza solo ese texto
     return html.Div(style={
         'backgroundColor': COLOR_KPI, 'padding': '15px', 'borderRadius': KPI_BORDER_RADIUS,
         'boxShadow': KPI_BOX_SHADOW, 'width': ancho, 'textAlign': 'center', 'margin': '1%'
     }, children=[
         html.H3(titulo, style={'color': COLOR_TEXTO, 'margin': '0', 'fontSize': '14px', 'fontFamily': 'Open Sans', 'fontWeight': 'bold'}),
-        html.H2(str(valor), style={'color': color_valor, 'fontSize': '28px', 'margin': '5px 0 0 0', 'fontFamily': 'Arial'})
+        html.H2(str(valor), id=id_valor or f'{titulo}-valor', style={'color': color_valor, 'fontSize': '28px', 'margin': '5px 0 0 0', 'fontFamily': 'Arial'})
     ])
 
 # NUEVA Tarjeta KPI con detalle de IN/OUT (Punto 1)
-def tarjeta_conversacion_detalle(titulo, total, in_count, out_count, color_total, ancho='23%'):
-    
+def texto_detalle_direccion(direccion, cantidad, total):
+    """ Texto 'IN: n (p%)' / 'OUT: n (p%)' de la tarjeta con detalle. """
     total = max(1, total) # Evitar división por cero
+    return f"{direccion}: {cantidad} ({round((cantidad / total) * 100, 1)}%)"
+
+def tarjeta_conversacion_detalle(titulo, total, in_count, out_count, color_total, ancho='23%', id_valor=None):
+    # Los ids del total y del detalle IN/OUT permiten refrescar solo esos textos
+    id_valor = id_valor or f'{titulo}-valor'
     
-    p_in = round((in_count / total) * 100, 1)
-    p_out = round((out_count / total) * 100, 1)
+    total = max(1, total) # Evitar división por cero
 
     return html.Div(style={
         'backgroundColor': COLOR_KPI, 'padding': '15px', 'borderRadius': KPI_BORDER_RADIUS,
@@ -452,41 +2224,75 @@ def tarjeta_conversacion_detalle(titulo, total, in_count, out_count, color_total
         'height': '120px' # Aumentar la altura para el detalle
     }, children=[
         html.H3(titulo, style={'color': COLOR_TEXTO, 'margin': '0', 'fontSize': '14px', 'fontFamily': 'Open Sans', 'fontWeight': 'bold'}),
-        html.H2(str(total), style={'color': color_total, 'fontSize': '28px', 'margin': '5px 0 0 0', 'fontFamily': 'Arial'}),
+        html.H2(str(total), id=id_valor, style={'color': color_total, 'fontSize': '28px', 'margin': '5px 0 0 0', 'fontFamily': 'Arial'}),
         
         # Detalle de IN/OUT en la parte inferior
         html.Div(style={'display': 'flex', 'justifyContent': 'center', 'marginTop': '5px', 'fontSize': '11px'}, children=[
-            html.Div(f"IN: {in_count} ({p_in}%)", 
+            html.Div(texto_detalle_direccion('IN', in_count, total), id=f'{id_valor}-in',
                      style={'color': DIRECTION_COLORS['IN'], 'marginRight': '10px'}),
-            html.Div(f"OUT: {out_count} ({p_out}%)", 
+            html.Div(texto_detalle_direccion('OUT', out_count, total), id=f'{id_valor}-out',
                      style={'color': DIRECTION_COLORS['OUT']}),
         ])
     ])
 
 # Controles de Orden
-def control_orden(id_sufix, titulo, opciones):
+def control_orden(id_sufix, titulo, opciones, valor='FIJO'):
     return html.Div([
         html.H4(titulo, style={'color': COLOR_TEXTO, 'fontSize': '16px', 'fontFamily': 'Open Sans', 'marginTop': '10px'}),
         dcc.RadioItems(
             id=f'radio-{id_sufix}',
             options=[{'label': opt, 'value': val} for opt, val in opciones.items()],
-            value='FIJO', # Valor por defecto
+            value=valor, # Valor por defecto
             labelStyle={'display': 'inline-block', 'marginRight': '20px', 'color': COLOR_TEXTO}
         )
     ], style={'padding': '10px', 'backgroundColor': COLOR_KPI, 'borderRadius': KPI_BORDER_RADIUS, 'boxShadow': KPI_BOX_SHADOW, 'marginBottom': '20px'})
 
 
+# Controles del gráfico de tiempos de respuesta (ver TIEMPOS DE RESPUESTA)
+OPCIONES_METRICA_LATENCIA = {'Asignación': 'asignacion', 'Primera Respuesta': 'respuesta'}
+OPCIONES_DIMENSION_LATENCIA = {'Hora': 'hora', 'Día de Semana': 'dia_semana', 'Canal': 'canal', 'Punto de Venta': 'pv'}
+
+# Filtros globales (ver FILTROS GLOBALES): dimensión -> título del selector
+TITULOS_FILTRO = {'canal': 'Canal', 'pv': 'Punto de Venta', 'typing': 'Tipificación', 'direccion': 'Dirección', 'status': 'Estado'}
+
+def control_filtro(dim, titulo):
+    return html.Div([
+        html.H4(titulo, style={'color': COLOR_TEXTO, 'fontSize': '16px', 'fontFamily': 'Open Sans', 'marginTop': '10px'}),
+        dcc.Dropdown(id=f'filtro-{dim}', options=[], value=[], multi=True, placeholder='Todos', style={'color': '#000000'})
+    ], style={'padding': '10px', 'backgroundColor': COLOR_KPI, 'borderRadius': KPI_BORDER_RADIUS, 'boxShadow': KPI_BOX_SHADOW,
+              'width': '17%', 'minWidth': '180px', 'margin': '0.5%'})
+
+
+# Columnas de la tabla de Ranking de Agentes (los datos salen de construir_ranking)
+COLUMNAS_TABLA_AGENTES = [
+    {'name': 'Agente', 'id': 'agente'},
+    {'name': 'Punto de Venta', 'id': 'PuntoDeVenta'},
+    {'name': 'Conversaciones', 'id': 'conversaciones', 'type': 'numeric'},
+    {'name': 'Ventas', 'id': 'ventas', 'type': 'numeric'},
+    {'name': 'Contactos Únicos', 'id': 'contactos', 'type': 'numeric'},
+    {'name': 'Conversión (%)', 'id': 'conversion', 'type': 'numeric'},
+]
+
 # --- Layout de la Página Principal (Dashboard) ---
 layout_dashboard = html.Div(style={'backgroundColor': COLOR_FONDO, 'fontFamily': 'Arial', 'padding': '20px', 'minHeight': '100vh'}, children=[
     
     dcc.Interval(
         id='interval-component',
-        interval=30*60*1000, # 30 minutos en milisegundos
+        interval=INTERVALO_REFRESCO_MS,
         n_intervals=0
     ),
-    dcc.Store(id='df-storage', data=None), 
+    # Mientras se descarga el histórico del rango elegido, revisa si ya llegó (ver update_vista_historico)
+    dcc.Interval(id='interval-historico', interval=HISTORICO_CHEQUEO_MS, max_intervals=HISTORICO_CHEQUEOS_MAX, disabled=True),
+    dcc.Store(id='df-storage', data=None), # Clave del snapshot (el DataFrame queda en el servidor)
     dcc.Store(id='meta-pv-storage', data=OBJETIVO_POS_VENTA_ACUMULADO),
     dcc.Store(id='simulated-date-storage', data=None), # NUEVO: Para guardar la fecha simulada.
+    dcc.Store(id='vista-storage', data=None), # Clave del snapshot + rango de fechas elegido para los gráficos
+    dcc.Store(id='senal-snapshot', data=None), # Versión avisada por /eventos (assets/eventos_snapshot.js)
+    # Figuras base de los gráficos que se ordenan/formatean en el navegador
+    dcc.Store(id='base-graph-canal-torta', data=None),
+    dcc.Store(id='base-graph-dia-semana', data=None),
+    dcc.Store(id='base-graph-hora-creacion', data=None),
+    dcc.Store(id='base-graph-hora-asignacion', data=None),
 
     html.H1('Tablero de control Digital - Reino Cerámicos', 
             style={'textAlign': 'center', 'color': COLOR_TEXTO, 'fontFamily': 'Open Sans', 'fontWeight': 'bold', 'marginBottom': '5px'}),
@@ -496,22 +2302,22 @@ layout_dashboard = html.Div(style={'backgroundColor': COLOR_FONDO, 'fontFamily':
     # Fila 1 de KPIs: Conversaciones y Contactos Únicos (4 tarjetas)
     html.Div(id='kpi-row-1', style={'display': 'flex', 'justifyContent': 'center', 'flexWrap': 'wrap'}, children=[
         # 1. Conversaciones Hoy (DETALLE IN/OUT)
-        tarjeta_conversacion_detalle('Conversaciones Hoy', 0, 0, 0, '#17a2b8', ancho='20%'),
+        tarjeta_conversacion_detalle('Conversaciones Hoy', 0, 0, 0, '#17a2b8', ancho='20%', id_valor='kpi-conv-hoy'),
         # 2. Conversaciones Acumuladas (DETALLE IN/OUT)
-        tarjeta_conversacion_detalle('Conversaciones Acumuladas', 0, 0, 0, '#007bff', ancho='20%'),
+        tarjeta_conversacion_detalle('Conversaciones Acumuladas', 0, 0, 0, '#007bff', ancho='20%', id_valor='kpi-conv-mes'),
         # 3. Contactos Únicos Hoy
-        tarjeta_kpi('Contactos Únicos Hoy', 0, '#00C4CC', ancho='20%'),
+        tarjeta_kpi('Contactos Únicos Hoy', 0, '#00C4CC', ancho='20%', id_valor='kpi-contactos-hoy'),
         # 4. Contactos Únicos Acumulados
-        tarjeta_kpi('Contactos Únicos Acumulados', 0, '#8000FF', ancho='20%'),
+        tarjeta_kpi('Contactos Únicos Acumulados', 0, '#8000FF', ancho='20%', id_valor='kpi-contactos-mes'),
     ]),    
     
     # Fila 2 de KPIs: Ventas y Clasificaciones (5 tarjetas)
     html.Div(id='kpi-row-2', style={'display': 'flex', 'justifyContent': 'center', 'flexWrap': 'wrap'}, children=[
-        tarjeta_kpi('Ventas', 0, '#28a745', ancho='15%'),
-        tarjeta_kpi('Ventas a Confirmar', 0, '#ffc107', ancho='15%'),
-        tarjeta_kpi('Ventas Perdidas', 0, '#dc3545', ancho='15%'),
-        tarjeta_kpi('Otro Motivo', 0, '#adb5bd', ancho='15%'),
-        tarjeta_kpi('Reclamos', 0, '#fd7e14', ancho='15%'),
+        tarjeta_kpi('Ventas', 0, '#28a745', ancho='15%', id_valor='kpi-venta'),
+        tarjeta_kpi('Ventas a Confirmar', 0, '#ffc107', ancho='15%', id_valor='kpi-venta-conf'),
+        tarjeta_kpi('Ventas Perdidas', 0, '#dc3545', ancho='15%', id_valor='kpi-venta-perdida'),
+        tarjeta_kpi('Otro Motivo', 0, '#adb5bd', ancho='15%', id_valor='kpi-otro-motivo'),
+        tarjeta_kpi('Reclamos', 0, '#fd7e14', ancho='15%', id_valor='kpi-reclamo'),
     ]),
 
     # Fila 3: Barra horizontal de Conversión de WhatsApp
@@ -519,15 +2325,35 @@ layout_dashboard = html.Div(style={'backgroundColor': COLOR_FONDO, 'fontFamily':
         html.Div(dcc.Graph(id='graph-conversion-wp', figure=create_horizontal_bar(0), config={'displayModeBar': False}), 
                  style={'width': '90%', 'height': '100px', 'margin': '1%', 'backgroundColor': COLOR_KPI, 'borderRadius': KPI_BORDER_RADIUS, 'boxShadow': KPI_BOX_SHADOW, 'padding': '5px'}),
     ]),
+    html.P(id='nota-kpis-filtros', style={'textAlign': 'center', 'color': '#aaaaaa', 'margin': '0'}),
 
     # Controles Interactivos
     html.Div(style={'display': 'flex', 'justifyContent': 'space-around', 'flexWrap': 'wrap', 'margin': '20px 0'}, children=[
-        control_orden('canal-display', 'Participación por Canal', {'Cantidad': 'COUNT', 'Porcentaje': 'PERCENT'}),
+        control_orden('canal-display', 'Participación por Canal', {'Cantidad': 'COUNT', 'Porcentaje': 'PERCENT'}, valor='PERCENT'),
         control_orden('dia-semana-order', 'Visualizar Conversaciones por día de:', {'Lunes - Domingo': 'FIJO', 'Mayor a Menor': 'DESC'}),
         control_orden('hora-creacion-order', 'Visualizar hora de creación de:', {'00 - 23hs': 'FIJO', 'Mayor a Menor': 'DESC'}),
         control_orden('hora-asignacion-order', 'Visualizar hora de asignación de:', {'9 - 18hs': 'FIJO', 'Mayor a Menor': 'DESC'}),
     ]),
     
+    # Selector de rango de fechas para los gráficos (vacío = mes en curso)
+    html.Div(style={'display': 'flex', 'justifyContent': 'center', 'margin': '10px 0'}, children=[
+        html.Div([
+            html.H4('Rango de fechas de los gráficos', style={'color': COLOR_TEXTO, 'fontSize': '16px', 'fontFamily': 'Open Sans', 'marginTop': '10px'}),
+            dcc.DatePickerRange(
+                id='rango-fechas',
+                display_format='DD/MM/YYYY',
+                start_date_placeholder_text='Inicio de mes',
+                end_date_placeholder_text='Hoy',
+                clearable=True
+            ),
+            html.P(id='estado-historico', style={'color': '#ffc107', 'margin': '8px 0 0 0'})
+        ], style={'padding': '10px', 'backgroundColor': COLOR_KPI, 'borderRadius': KPI_BORDER_RADIUS, 'boxShadow': KPI_BOX_SHADOW})
+    ]),
+
+    # Filtros globales: restringen todos los gráficos y tablas (vacío = todos)
+    html.Div(style={'display': 'flex', 'justifyContent': 'center', 'flexWrap': 'wrap', 'margin': '10px 0'},
+             children=[control_filtro(dim, titulo) for dim, titulo in TITULOS_FILTRO.items()]),
+
     # NUEVOS CONTROLES para Gráficos de abajo
     html.Div(style={'display': 'flex', 'justifyContent': 'center', 'flexWrap': 'wrap', 'margin': '10px 0'}, children=[
         # Control para Torta Tipificaciones (Punto 3)
@@ -549,6 +2375,61 @@ layout_dashboard = html.Div(style={'backgroundColor': COLOR_FONDO, 'fontFamily':
         dcc.Graph(id='graph-status', style={'width': '48%', 'margin': '10px'}), # Estatus (ACTIVO/FINALIZADO)
         dcc.Graph(id='graph-tipificacion-torta', style={'width': '48%', 'margin': '10px'}), # Tipificaciones (Torta)
         dcc.Graph(id='graph-ventas-agrupadas', style={'width': '97%', 'margin': '10px'}), # Venta/Conf/Perdida (Barras)
+
+        # Tiempos de asignación y de primera respuesta (percentiles)
+        html.Div(style={'width': '97%', 'display': 'flex', 'justifyContent': 'center', 'flexWrap': 'wrap', 'gap': '20px'}, children=[
+            control_orden('latencia-metrica', 'Tiempo hasta la:', OPCIONES_METRICA_LATENCIA, valor='asignacion'),
+            control_orden('latencia-dimension', 'Percentiles por:', OPCIONES_DIMENSION_LATENCIA, valor='hora'),
+        ]),
+        dcc.Graph(id='graph-latencias', style={'width': '97%', 'margin': '10px'}),
+
+        # Ranking por Punto de Venta (vs. objetivo acumulado) y por Agente
+        dcc.Graph(id='graph-ranking-pv', style={'width': '97%', 'margin': '10px'}),
+        html.Div(style={'width': '97%', 'margin': '10px', 'padding': '10px', 'backgroundColor': COLOR_KPI, 'borderRadius': KPI_BORDER_RADIUS, 'boxShadow': KPI_BOX_SHADOW}, children=[
+            html.H4(id='titulo-ranking-agentes', children='Ranking de Agentes', style={'color': COLOR_TEXTO, 'fontSize': '16px', 'fontFamily': 'Open Sans', 'marginTop': '5px'}),
+            dash_table.DataTable(
+                id='tabla-ranking-agentes',
+                columns=COLUMNAS_TABLA_AGENTES,
+                data=[],
+                sort_action='native',
+                page_size=15,
+                style_header={'backgroundColor': COLOR_FONDO, 'color': COLOR_TEXTO, 'fontWeight': 'bold', 'border': f'1px solid {COLOR_FONDO}'},
+                style_cell={'backgroundColor': COLOR_KPI, 'color': COLOR_TEXTO, 'fontFamily': 'Arial', 'border': f'1px solid {COLOR_FONDO}', 'padding': '5px'},
+                style_cell_conditional=[{'if': {'column_id': c}, 'textAlign': 'left'} for c in ('agente', 'PuntoDeVenta')],
+            ),
+        ]),
+
+        # Detalle de conversaciones: página, orden y filtro se resuelven en el servidor
+        html.Div(style={'width': '97%', 'margin': '10px', 'padding': '10px', 'backgroundColor': COLOR_KPI, 'borderRadius': KPI_BORDER_RADIUS, 'boxShadow': KPI_BOX_SHADOW}, children=[
+            html.Div(style={'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center'}, children=[
+                html.H4(id='titulo-tabla-detalle', children='Detalle de Conversaciones', style={'color': COLOR_TEXTO, 'fontSize': '16px', 'fontFamily': 'Open Sans', 'marginTop': '5px'}),
+                # Descarga de las conversaciones del rango elegido (/exportar)
+                html.Div([
+                    html.A('Exportar CSV', id='enlace-exportar-csv', href='exportar?formato=csv', style={'color': COLOR_TEXTO, 'marginRight': '15px'}),
+                    html.A('Exportar Parquet', id='enlace-exportar-parquet', href='exportar?formato=parquet', style={'color': COLOR_TEXTO}),
+                ]),
+            ]),
+            dash_table.DataTable(
+                id='tabla-detalle',
+                columns=[{'name': titulo, 'id': id_col, 'type': 'datetime' if tipo == 'fecha' else 'text'}
+                         for id_col, _, titulo, tipo in COLUMNAS_DETALLE],
+                data=[],
+                page_action='custom',
+                page_current=0,
+                page_size=TAMANO_PAGINA_DETALLE,
+                sort_action='custom',
+                sort_mode='single',
+                sort_by=[],
+                filter_action='custom',
+                filter_query='',
+                filter_options={'case': 'insensitive'},
+                style_table={'overflowX': 'auto'},
+                style_header={'backgroundColor': COLOR_FONDO, 'color': COLOR_TEXTO, 'fontWeight': 'bold', 'border': f'1px solid {COLOR_FONDO}'},
+                style_filter={'backgroundColor': COLOR_FONDO, 'color': COLOR_TEXTO},
+                style_cell={'backgroundColor': COLOR_KPI, 'color': COLOR_TEXTO, 'fontFamily': 'Arial', 'border': f'1px solid {COLOR_FONDO}',
+                            'padding': '5px', 'textAlign': 'left', 'maxWidth': '250px', 'overflow': 'hidden', 'textOverflow': 'ellipsis'},
+            ),
+        ]),
     ])
 ])
 
@@ -558,6 +2439,135 @@ external_stylesheets = ['https://fonts.googleapis.com/css2?family=Open+Sans:wght
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets, suppress_callback_exceptions=True) 
 server = app.server
 
+# --- Instrumentación de los Callbacks y endpoint de métricas ---
+@server.before_request
+def iniciar_medicion_callback():
+    flask.g.t_inicio_request = time.perf_counter()
+
+@server.after_request
+def registrar_medicion_callback(response):
+    if not flask.request.path.endswith('/_dash-update-component'):
+        return response
+    duracion = time.perf_counter() - flask.g.get('t_inicio_request', time.perf_counter())
+    cuerpo = flask.request.get_json(silent=True) or {}
+    callback = cuerpo.get('output', 'desconocido')
+    tam = response.content_length if response.content_length is not None else len(response.get_data())
+    observar('dashboard_callback_segundos', duracion, callback=callback)
+    observar('dashboard_callback_respuesta_bytes', tam, buckets=BUCKETS_BYTES, callback=callback)
+    if response.status_code >= 500:
+        contar('dashboard_callback_errores_total', callback=callback)
+    if DASHBOARD_CALLBACK_LENTO_MS and duracion * 1000 >= DASHBOARD_CALLBACK_LENTO_MS:
+        print(f"Callback lento: {callback} tardó {duracion * 1000:.0f} ms ({tam} bytes de respuesta)")
+    return response
+
+@server.route('/estado')
+def estado():
+    return flask.jsonify(estado_del_tablero())
+
+@server.route('/metrics')
+def metricas():
+    estado_actual = estado_del_tablero()
+    fijar('dashboard_snapshot_edad_segundos', estado_actual['snapshot_edad_seg'] if estado_actual['snapshot_edad_seg'] is not None else float('nan'))
+    fijar('dashboard_refresco_ultimo_exito_timestamp', estado_actual.get('ultimo_exito') or 0)
+    fijar('dashboard_refresco_ultimo_error_timestamp', estado_actual.get('ultimo_error_ts') or 0)
+    return flask.Response(exportar_metricas(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --- PUSH DE SNAPSHOTS NUEVOS (Server-Sent Events en /eventos) ---
+# Cada navegador mantiene una conexión abierta y vuelve a pedir los datos solo cuando
+# hay una versión nueva, en lugar de consultar cada 30 minutos. Las publicaciones de
+# este worker despiertan la conexión al instante; las de otros workers se detectan
+# mirando el snapshot en disco cada SSE_CHEQUEO_SEG. Cada conexión ocupa un hilo:
+# con gunicorn hacen falta workers con hilos (gthread), y como mucho SSE_MAX_CONEXIONES
+# por worker quedan tomadas por streams para que los Callbacks siempre tengan hilos libres.
+# Con el cupo lleno se responde la versión vigente y se cierra: el navegador vuelve a
+# preguntar cada SSE_REINTENTO_LLENO_MS (sondeo) hasta conseguir lugar.
+SSE_CHEQUEO_SEG = float(os.environ.get("DASHBOARD_SSE_CHEQUEO_SEG", 5))
+SSE_LATIDO_SEG = 15 # Comentario vacío para que proxies y balanceadores no corten la conexión
+# Se cierra periódicamente para liberar el hilo; EventSource reconecta solo
+SSE_DURACION_MAX_SEG = float(os.environ.get("DASHBOARD_SSE_DURACION_MAX_SEG", 300))
+SSE_REINTENTO_MS = 5000
+# Por defecto la mitad de los hilos del worker (GUNICORN_THREADS, ver gunicorn.conf.py)
+SSE_MAX_CONEXIONES = int(os.environ.get("DASHBOARD_SSE_MAX_CONEXIONES", max(1, int(os.environ.get("GUNICORN_THREADS", 16)) // 2)))
+SSE_REINTENTO_LLENO_MS = int(os.environ.get("DASHBOARD_SSE_REINTENTO_LLENO_MS", 60_000))
+_conexiones_sse = 0
+
+def eventos_snapshot(duracion_max=SSE_DURACION_MAX_SEG, reintento_ms=SSE_REINTENTO_MS):
+    """ Generador del stream: avisa la versión vigente al conectar y luego cada versión nueva. """
+    yield f"retry: {reintento_ms}\n\n"
+    clave_enviada = None
+    inicio = ultimo_envio = time.monotonic()
+    while True:
+        snap = obtener_snapshot()
+        clave = clave_snapshot(snap) if snap is not None else None
+        if clave is not None and clave != clave_enviada:
+            clave_enviada = clave
+            ultimo_envio = time.monotonic()
+            contar('dashboard_sse_eventos_total')
+            yield f"event: snapshot\ndata: {json.dumps({'version': clave})}\n\n"
+        elif time.monotonic() - ultimo_envio >= SSE_LATIDO_SEG:
+            ultimo_envio = time.monotonic()
+            yield ": ping\n\n"
+        if time.monotonic() - inicio >= duracion_max:
+            break
+        with _snapshot_publicado:
+            _snapshot_publicado.wait(timeout=SSE_CHEQUEO_SEG)
+
+def liberar_conexion_sse():
+    global _conexiones_sse
+    with _snapshot_publicado:
+        _conexiones_sse -= 1
+        fijar('dashboard_sse_conexiones', _conexiones_sse)
+
+@server.route('/eventos')
+def eventos():
+    global _conexiones_sse
+    with _snapshot_publicado:
+        hay_lugar = _conexiones_sse < SSE_MAX_CONEXIONES
+        if hay_lugar:
+            _conexiones_sse += 1
+            fijar('dashboard_sse_conexiones', _conexiones_sse)
+    if hay_lugar:
+        respuesta = flask.Response(eventos_snapshot(), mimetype='text/event-stream')
+        respuesta.call_on_close(liberar_conexion_sse) # También si el navegador corta antes de empezar
+    else:
+        contar('dashboard_sse_rechazadas_total')
+        respuesta = flask.Response(eventos_snapshot(duracion_max=0, reintento_ms=SSE_REINTENTO_LLENO_MS), mimetype='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['X-Accel-Buffering'] = 'no' # nginx: no acumular el stream
+    return respuesta
+
+# --- EXPORTACIÓN DE CONVERSACIONES (/exportar, ver EXPORTACIÓN) ---
+# /exportar?formato=csv|parquet&desde=AAAA-MM-DD&hasta=AAAA-MM-DD&canal=...&pv=...&typing=...&direccion=...&status=...
+@server.route('/exportar')
+def exportar():
+    argumentos = flask.request.args
+    formato = argumentos.get('formato', 'csv').lower()
+    if formato not in FORMATOS_EXPORTAR:
+        return flask.jsonify({'error': f"Formato desconocido: {formato} (csv o parquet)"}), 400
+    desde = hasta = None
+    if argumentos.get('desde') or argumentos.get('hasta'):
+        try:
+            desde, hasta = parsear_rango(argumentos.get('desde'), argumentos.get('hasta'))
+        except ValueError:
+            return flask.jsonify({'error': "Fechas inválidas (formato AAAA-MM-DD)"}), 400
+    filtros = {p: [v for v in argumentos.getlist(p) if v] for p in FILTROS_EXPORTAR}
+    filtros = {p: valores for p, valores in filtros.items() if valores}
+
+    snap = obtener_snapshot()
+    if snap is None:
+        return flask.jsonify({'error': "Todavía no hay datos cargados"}), 503
+    if not _exportaciones.acquire(blocking=False):
+        respuesta = flask.jsonify({'error': "Hay demasiadas exportaciones en curso, reintentar en unos segundos"})
+        respuesta.headers['Retry-After'] = '10'
+        return respuesta, 429
+    contar('dashboard_exportaciones_total', formato=formato)
+    nombre = f"conversaciones_{desde or 'mes'}_{hasta or snap['datos']['fecha_simulada']}.{formato}"
+    respuesta = flask.Response(stream_exportacion(snap, formato, desde, hasta, filtros), content_type=FORMATOS_EXPORTAR[formato])
+    respuesta.headers['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    respuesta.call_on_close(_exportaciones.release) # También si el navegador corta la descarga
+    return respuesta
+
 # ASIGNACIÓN DEL LAYOUT DESPUÉS DE LA CREACIÓN DE 'APP'
 app.layout = layout_dashboard 
 
@@ -567,34 +2577,234 @@ app.layout = layout_dashboard
 
 def aplicar_estilos_grafico(fig):
     """ Función auxiliar para aplicar el tema oscuro a un gráfico. """
-    fig.update_layout(
+    estilo = dict(
         plot_bgcolor=COLOR_KPI, paper_bgcolor=COLOR_KPI, font_color=COLOR_TEXTO,
         font_family="Arial", title_font_family="Open Sans", title_font_weight="bold",
         height=400, margin=dict(t=50, b=50, l=10, r=10)
     )
+    # Las figuras vacías ("Sin Datos...") pasan solo el go.Layout (p. ej. un filtro sin conversaciones)
+    if isinstance(fig, go.Layout):
+        return fig.update(**estilo)
+    fig.update_layout(**estilo)
     # Mostramos texto fuera de las barras para contraste en tema oscuro.
     fig.update_traces(textfont_color=COLOR_TEXTO, textposition='outside')
     return fig
 
-# Función auxiliar para parsear el DF desde el Store
+# Función auxiliar para obtener el DF a partir del Store
 def parse_df_from_store(data):
+    """ El Store solo guarda la clave del snapshot: se resuelve al DataFrame en memoria del servidor. """
     if data is None:
         return pd.DataFrame()
-    try:
-        # CORRECCIÓN: Usar io.StringIO para evitar FutureWarning
-        json_str = data if isinstance(data, str) else json.dumps(data)
-        
-        # Intenta leer el DF y convertir las columnas de fecha
-        df = pd.read_json(io.StringIO(json_str), orient='split')
-        
-        # Asegurarse de que las columnas de fecha sean datetime objects
-        df['created'] = pd.to_datetime(df['created'], errors='coerce')
-        if 'assigned_dt' in df.columns:
-            df['assigned_dt'] = pd.to_datetime(df['assigned_dt'], errors='coerce')
-        return df
-    except Exception as e:
-        print(f"Error al parsear DataFrame desde el Store: {e}")
+    snap = resolver_snapshot(str(data))
+    if snap is None:
         return pd.DataFrame()
+    return snap['datos']['df']
+
+def conteo_a_dataframe(conteo, columna):
+    """ Serie de conteos del cubo -> DataFrame ['columna', 'conteo'] como el de groupby().size(): ordenado, sin nulos ni ceros. """
+    if isinstance(conteo.index, pd.CategoricalIndex): # Ordenar por valor, como groupby sobre texto
+        conteo.index = conteo.index.astype(conteo.index.categories.dtype)
+    conteo = conteo[conteo.index.notna() & (conteo > 0)].sort_index()
+    return pd.DataFrame({columna: conteo.index, 'conteo': conteo.to_numpy()})
+
+def parse_cubo_from_store(vista):
+    """ Cubo de agregación de la vista (snapshot + rango) referenciada por el Store (None si no hay datos). """
+    datos = resolver_vista(vista)
+    if datos is None or datos['df'].empty:
+        return None
+    return datos['cubo']
+
+def sufijo_rango(vista, por_defecto):
+    """ Texto para los títulos: el rango elegido o, si no hay, el del mes en curso. """
+    if vista is None or not (vista.get('desde') or vista.get('hasta')):
+        return por_defecto
+    desde, hasta = parsear_rango(vista.get('desde'), vista.get('hasta'))
+    return f"({desde.strftime('%d/%m/%Y')} - {hasta.strftime('%d/%m/%Y')})"
+
+
+# --- CACHÉ DE FIGURAS (Compartida por todas las sesiones del worker) ---
+# Mientras el snapshot no cambie, la figura de un gráfico depende solo de sus
+# controles: el primer viewer la arma y los demás (o el mismo al volver a una
+# opción) la reciben de esta caché LRU acotada por cantidad y por tamaño.
+FIGURAS_CACHE_MAX = int(os.environ.get("DASHBOARD_FIGURAS_CACHE_MAX", 256))
+FIGURAS_CACHE_MAX_BYTES = int(os.environ.get("DASHBOARD_FIGURAS_CACHE_MB", 64)) * 1024 * 1024
+
+_figuras_cache = OrderedDict() # (vista, id del gráfico, controles) -> (figura, bytes)
+_figuras_cache_bytes = 0
+_figuras_lock = threading.Lock()
+# Serializar una figura solo para medirla cuesta casi lo mismo que armarla: el tamaño se mide
+# en uno de cada FIGURAS_MUESTREO_TAMANO fallos por gráfico y los demás usan esa medición.
+FIGURAS_MUESTREO_TAMANO = 16
+_figuras_tamano = {} # id del gráfico -> (bytes de la última medición, fallos desde entonces)
+
+def tamano_figura(id_grafico, fig):
+    """ Tamaño estimado de la figura en JSON (muestreado por gráfico, ver FIGURAS_MUESTREO_TAMANO). """
+    with _figuras_lock:
+        tam, fallos = _figuras_tamano.get(id_grafico, (None, 0))
+        if tam is not None and fallos < FIGURAS_MUESTREO_TAMANO:
+            _figuras_tamano[id_grafico] = (tam, fallos + 1)
+            return tam
+    tam = len(fig.to_json())
+    with _figuras_lock:
+        _figuras_tamano[id_grafico] = (tam, 1)
+    return tam
+
+def clave_vista(vista):
+    """ Parte de la clave de caché que identifica los datos: versión del snapshot, rango (con su generación de histórico) y filtros. """
+    if not isinstance(vista, dict): return vista
+    if not (vista.get('desde') or vista.get('hasta')): clave = (vista.get('clave'),)
+    else: clave = (vista.get('clave'), vista.get('desde'), vista.get('hasta'), generacion_historico())
+    filtros = filtros_de_vista(vista)
+    return clave + (filtros,) if filtros else clave
+
+def cachear_figura(id_grafico):
+    """
+    Decorador para los Callbacks de gráficos: memoiza la figura por
+    (versión del snapshot + rango, id del gráfico, valores de los controles).
+    Las figuras cacheadas se comparten entre sesiones: no deben modificarse.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args):
+            global _figuras_cache_bytes
+            clave = (id_grafico,) + tuple(clave_vista(a) for a in args)
+            with _figuras_lock:
+                cacheada = _figuras_cache.get(clave)
+                if cacheada is not None:
+                    _figuras_cache.move_to_end(clave)
+            contar('dashboard_figuras_cache_total', grafico=id_grafico, resultado='fallo' if cacheada is None else 'acierto')
+            if cacheada is not None:
+                return cacheada[0]
+            fig = funcion(*args)
+            tam = tamano_figura(id_grafico, fig)
+            if tam > FIGURAS_CACHE_MAX_BYTES: return fig
+            with _figuras_lock:
+                if clave not in _figuras_cache:
+                    _figuras_cache[clave] = (fig, tam)
+                    _figuras_cache_bytes += tam
+                while len(_figuras_cache) > FIGURAS_CACHE_MAX or _figuras_cache_bytes > FIGURAS_CACHE_MAX_BYTES:
+                    _, (_, tam_viejo) = _figuras_cache.popitem(last=False)
+                    _figuras_cache_bytes -= tam_viejo
+                entradas, tam_total = len(_figuras_cache), _figuras_cache_bytes
+            fijar('dashboard_figuras_cache_bytes', tam_total)
+            fijar('dashboard_figuras_cache_entradas', entradas)
+            return fig
+        return envoltura
+    return decorador
+
+
+# --- ACTUALIZACIONES PARCIALES (dash.Patch) ---
+# En cada refresco se compara contra lo que el navegador ya tiene (el snapshot o
+# la vista anterior) y se envía solo lo que cambió: los textos KPI distintos y,
+# para las figuras, un Patch con las propiedades de trazas/layout modificadas.
+# Las pantallas que quedan abiertas todo el día reciben unos pocos bytes por tick.
+
+# Nodo de texto KPI (id en el layout) -> texto a partir de los datos del snapshot
+TEXTOS_KPI = {
+    'kpi-conv-hoy': lambda d: str(max(1, d['conv_hoy'])),
+    'kpi-conv-hoy-in': lambda d: texto_detalle_direccion('IN', d['in_hoy'], d['conv_hoy']),
+    'kpi-conv-hoy-out': lambda d: texto_detalle_direccion('OUT', d['out_hoy'], d['conv_hoy']),
+    'kpi-conv-mes': lambda d: str(max(1, d['conv_mes'])),
+    'kpi-conv-mes-in': lambda d: texto_detalle_direccion('IN', d['in_mes'], d['conv_mes']),
+    'kpi-conv-mes-out': lambda d: texto_detalle_direccion('OUT', d['out_mes'], d['conv_mes']),
+    'kpi-contactos-hoy': lambda d: str(d['contactos_hoy']),
+    'kpi-contactos-mes': lambda d: str(d['contactos_mes']),
+    'kpi-venta': lambda d: str(d['venta']),
+    'kpi-venta-conf': lambda d: str(d['venta_conf']),
+    'kpi-venta-perdida': lambda d: str(d['venta_perdida']),
+    'kpi-otro-motivo': lambda d: str(d['otro_motivo']),
+    'kpi-reclamo': lambda d: str(d['reclamo']),
+}
+
+def valores_iguales(a, b):
+    """ Igualdad profunda para el JSON de Plotly (dicts, listas y arrays de numpy). """
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        a, b = np.asarray(a), np.asarray(b)
+        return a.shape == b.shape and a.dtype.kind == b.dtype.kind and bool(np.all(a == b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(valores_iguales(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(valores_iguales(x, y) for x, y in zip(a, b))
+    return type(a) == type(b) and a == b
+
+def parche_figura(fig_previa, fig_nueva):
+    """
+    Patch que lleva fig_previa a fig_nueva tocando solo las propiedades de primer nivel
+    de cada traza y del layout que cambiaron (dash.no_update si son iguales).
+    Si cambia la cantidad de trazas se devuelve la figura completa.
+    """
+    previa, nueva = fig_previa.to_plotly_json(), fig_nueva.to_plotly_json()
+    if len(previa['data']) != len(nueva['data']):
+        return fig_nueva
+    parche = dash.Patch()
+    cambios = 0
+    for i, (traza_previa, traza_nueva) in enumerate(zip(previa['data'], nueva['data'])):
+        for prop in traza_previa.keys() | traza_nueva.keys():
+            if prop not in traza_nueva:
+                del parche['data'][i][prop]
+            elif prop not in traza_previa or not valores_iguales(traza_previa[prop], traza_nueva[prop]):
+                parche['data'][i][prop] = traza_nueva[prop]
+            else:
+                continue
+            cambios += 1
+    for prop in previa['layout'].keys() | nueva['layout'].keys():
+        if prop not in nueva['layout']:
+            del parche['layout'][prop]
+        elif prop not in previa['layout'] or not valores_iguales(previa['layout'][prop], nueva['layout'][prop]):
+            parche['layout'][prop] = nueva['layout'][prop]
+        else:
+            continue
+        cambios += 1
+    return parche if cambios else dash.no_update
+
+def disparado_por(id_componente):
+    """ True si el Callback en curso lo disparó solo id_componente (False fuera de un request de Dash). """
+    try:
+        disparos = {t['prop_id'].split('.')[0] for t in dash.ctx.triggered}
+    except Exception:
+        return False
+    return disparos == {id_componente}
+
+def texto_actualizacion(snap):
+    """ Mensaje de fecha de los datos (mostrando la fecha real o simulada). """
+    fecha_simulada = snap['datos']['fecha_simulada'].strftime('%Y-%m-%d')
+    return f"Datos actualizados al: {datetime.fromtimestamp(snap['creado']).strftime('%d/%m/%Y %H:%M')} (Filtro 'Hoy': {fecha_simulada})"
+
+def parchear_figura(funcion):
+    """
+    Decorador para los Callbacks de gráficos alimentados por 'vista-storage': si la vista cambió
+    solo porque llegó otro snapshot (misma vista sin rango y con los mismos filtros, otra clave)
+    y el snapshot anterior sigue en memoria, devuelve solo el Patch entre ambas figuras (la
+    anterior suele salir de la caché de figuras). En cualquier otro caso (primera vista, filtros
+    o rango cambiados, rango elegido) se manda la figura completa: con un rango el histórico
+    pudo cambiar desde que se armó la figura que muestra el navegador.
+    """
+    def es_vista(valor):
+        return isinstance(valor, dict) and 'clave' in valor
+
+    def sin_rango(vista):
+        return vista is not None and not (vista.get('desde') or vista.get('hasta'))
+
+    def solo_cambio_snapshot(vista):
+        anterior = vista.get('anterior')
+        return (sin_rango(vista) and sin_rango(anterior) and vista['clave'] != anterior['clave']
+                and filtros_de_vista(vista) == filtros_de_vista(anterior))
+
+    @functools.wraps(funcion)
+    def envoltura(*args):
+        # Con una clave vencida se grafica (y se cachea) el snapshot vigente, con su propia clave
+        args = tuple(vista_vigente(a) if es_vista(a) else a for a in args)
+        fig = funcion(*args)
+        vistas = [a for a in args if es_vista(a)]
+        if not vistas or not disparado_por('vista-storage'):
+            return fig
+        if not all(solo_cambio_snapshot(v) for v in vistas):
+            return fig # Primera vista de la sesión, rango elegido o filtros cambiados
+        if any(resolver_snapshot(str(v['anterior']['clave'])) is None for v in vistas):
+            return fig # El snapshot que grafica el navegador ya no está en memoria: no hay base para el Patch
+        anteriores = [a['anterior'] if es_vista(a) else a for a in args]
+        return parche_figura(funcion(*anteriores), fig)
+    return envoltura
 
 
 # CALLBACK DE RECARGA DE DATOS (Dashboard) - Mantiene la lógica de carga y KPI
@@ -602,85 +2812,176 @@ def parse_df_from_store(data):
     [Output('df-storage', 'data'),
      Output('meta-pv-storage', 'data'),
      Output('live-update-time', 'children'),
-     Output('kpi-row-1', 'children'),
-     Output('kpi-row-2', 'children'),
      Output('graph-conversion-wp', 'figure'),
-     Output('simulated-date-storage', 'data')],
-    [Input('interval-component', 'n_intervals')]
+     Output('simulated-date-storage', 'data')] +
+    [Output(id_texto, 'children') for id_texto in TEXTOS_KPI],
+    [Input('interval-component', 'n_intervals'),
+     Input('senal-snapshot', 'data')],
+    [State('df-storage', 'data')]
 )
-def update_data_and_kpis(n):
-    datos_actualizados = cargar_datos_y_calcular_kpis()
+def update_data_and_kpis(n, senal=None, clave_previa=None):
+    # Todas las sesiones leen el mismo snapshot. Con el refresco en segundo plano el Callback
+    # nunca espera a la API: sirve el último snapshot completo (aunque esté vencido).
+    if DASHBOARD_REFRESCO_EN_FONDO:
+        iniciar_refresco_en_fondo()
+        snap = obtener_snapshot()
+    else:
+        # Solo un proceso consulta la API si está vencido.
+        snap = refrescar_snapshot_compartido()
+    if snap is None:
+        # La primera carga todavía está en curso; se mostrará en el próximo tick.
+        return (dash.no_update, dash.no_update, "Cargando datos...", dash.no_update, dash.no_update) + (dash.no_update,) * len(TEXTOS_KPI)
+    datos_actualizados = snap['datos']
     df_mes_en_curso_updated = datos_actualizados['df']
     meta_pv_acumulada_updated = datos_actualizados['meta_pv_acumulada']
     fecha_simulada = datos_actualizados['fecha_simulada'].strftime('%Y-%m-%d') # Formato ISO para guardar
+    clave = clave_snapshot(snap) if not df_mes_en_curso_updated.empty else None
     
-    # Reconstruir las filas KPI con los nuevos valores
-    kpi_row_1 = [
-        # Conversaciones Hoy (DETALLE IN/OUT)
-        tarjeta_conversacion_detalle('Conversaciones Hoy', datos_actualizados['conv_hoy'], 
-                                    datos_actualizados['in_hoy'], datos_actualizados['out_hoy'], 
-                                    '#17a2b8', ancho='20%'),
-        # Conversaciones Acumuladas (DETALLE IN/OUT)
-        tarjeta_conversacion_detalle('Conversaciones Acumuladas', datos_actualizados['conv_mes'], 
-                                    datos_actualizados['in_mes'], datos_actualizados['out_mes'], 
-                                    '#007bff', ancho='20%'),
-        # Contactos Únicos Hoy
-        tarjeta_kpi('Contactos Únicos Hoy', datos_actualizados['contactos_hoy'], '#00C4CC', ancho='20%'),
-        # Contactos Únicos Acumulados
-        tarjeta_kpi('Contactos Únicos Acumulados', datos_actualizados['contactos_mes'], '#8000FF', ancho='20%'),
-    ]
-
-    kpi_row_2 = [
-        tarjeta_kpi('Ventas', datos_actualizados['venta'], '#28a745', ancho='15%'),
-        tarjeta_kpi('Ventas a Confirmar', datos_actualizados['venta_conf'], '#ffc107', ancho='15%'),
-        tarjeta_kpi('Ventas Perdidas', datos_actualizados['venta_perdida'], '#dc3545', ancho='15%'),
-        tarjeta_kpi('Otro Motivo', datos_actualizados['otro_motivo'], '#adb5bd', ancho='15%'),
-        tarjeta_kpi('Reclamos', datos_actualizados['reclamo'], '#fd7e14', ancho='15%'),
-    ]
-    
-    # Actualizar la barra de conversión de WhatsApp
+    # Textos KPI y barra de conversión de WhatsApp con los nuevos valores
+    textos_kpi = [texto(datos_actualizados) for texto in TEXTOS_KPI.values()]
     fig_wp_updated = create_horizontal_bar(datos_actualizados['conv_wp'])
     
     # Mensaje de fecha actualizado (mostrando la fecha real o simulada)
-    time_str = f"Datos actualizados al: {datetime.now().strftime('%d/%m/%Y %H:%M')} (Filtro 'Hoy': {fecha_simulada})"
-    
-    # Devolver el DataFrame serializado y la meta para que otros Callbacks los usen.
-    return (
-        df_mes_en_curso_updated.to_json(date_format='iso', orient='split') if not df_mes_en_curso_updated.empty else None,
-        meta_pv_acumulada_updated,
-        time_str,
-        kpi_row_1,
-        kpi_row_2,
-        fig_wp_updated,
-        fecha_simulada # Guardamos la fecha simulada
-    )
+    time_str = texto_actualizacion(snap)
+    
+    salida = [clave, meta_pv_acumulada_updated, time_str, fig_wp_updated, fecha_simulada] + textos_kpi
+
+    # Si el navegador ya muestra un snapshot que seguimos teniendo, solo viaja lo que cambió.
+    # Si ya no está en memoria (desalojado u otro worker) van todos los valores y la figura completa.
+    snap_previo = resolver_snapshot(str(clave_previa)) if clave_previa is not None else None
+    if snap_previo is not None:
+        datos_previos = snap_previo['datos']
+        previa = [clave_previa, datos_previos['meta_pv_acumulada'], texto_actualizacion(snap_previo), None,
+                  datos_previos['fecha_simulada'].strftime('%Y-%m-%d')] + \
+                 [texto(datos_previos) for texto in TEXTOS_KPI.values()]
+        salida = [dash.no_update if i != 3 and valor == previa[i] else valor
+                  for i, valor in enumerate(salida)]
+        salida[3] = parche_figura(create_horizontal_bar(datos_previos['conv_wp']), fig_wp_updated)
+    
+    # Devolver solo la clave del snapshot: los demás Callbacks resuelven el DataFrame en el servidor.
+    return tuple(salida)
+
+
+# CALLBACK de la vista: combina el snapshot vigente con el rango de fechas elegido
+@app.callback(
+    Output('vista-storage', 'data'),
+    [Input('df-storage', 'data'),
+     Input('rango-fechas', 'start_date'),
+     Input('rango-fechas', 'end_date')] +
+    [Input(f'filtro-{dim}', 'value') for dim in DIMENSIONES_FILTRO],
+    [State('vista-storage', 'data')]
+)
+def update_vista(data, start_date, end_date, *filtros_y_previa):
+    if data is None:
+        return None
+    if resolver_snapshot(str(data)) is None:
+        # Clave vencida (desalojada o de otro worker): la vista pasa al snapshot vigente
+        snap = obtener_snapshot()
+        data = clave_snapshot(snap) if snap is not None else data
+    filtros = dict(zip(DIMENSIONES_FILTRO, filtros_y_previa[:len(DIMENSIONES_FILTRO)]))
+    vista_previa = filtros_y_previa[len(DIMENSIONES_FILTRO)] if len(filtros_y_previa) > len(DIMENSIONES_FILTRO) else None
+    # 'anterior' es lo que el navegador ya tiene graficado: los gráficos mandan solo la diferencia
+    if vista_previa is not None:
+        vista_previa = {k: v for k, v in vista_previa.items() if k != 'anterior'}
+    vista = {'clave': data, 'desde': start_date, 'hasta': end_date, 'anterior': vista_previa}
+    filtros = {dim: valores for dim, valores in filtros.items() if valores}
+    if filtros:
+        vista['filtros'] = filtros
+    if start_date or end_date:
+        # Días que se están descargando en segundo plano: los gráficos salen parciales hasta que lleguen
+        faltante = historico_faltante(*parsear_rango(start_date, end_date))
+        if faltante:
+            vista['historico_faltante'] = faltante
+    return vista
+
+
+# CALLBACK: Aviso de histórico incompleto (y chequeo periódico mientras se descarga)
+@app.callback(
+    [Output('estado-historico', 'children'),
+     Output('interval-historico', 'disabled'),
+     Output('interval-historico', 'n_intervals')],
+    [Input('vista-storage', 'data')]
+)
+def update_estado_historico(vista):
+    faltante = (vista or {}).get('historico_faltante')
+    if not faltante:
+        return "", True, dash.no_update
+    return f"Cargando histórico: faltan {faltante} días del rango, los gráficos se completan al terminar.", False, 0
+
+
+# CALLBACK: Cuando avanza la descarga del histórico, la vista se vuelve a emitir y los gráficos se rehacen
+@app.callback(
+    Output('vista-storage', 'data', allow_duplicate=True),
+    [Input('interval-historico', 'n_intervals')],
+    [State('vista-storage', 'data')],
+    prevent_initial_call=True
+)
+def update_vista_historico(n, vista):
+    if not vista or not vista.get('historico_faltante'):
+        return dash.no_update
+    faltante = historico_faltante(*parsear_rango(vista.get('desde'), vista.get('hasta')))
+    if faltante == vista['historico_faltante']:
+        return dash.no_update
+    # La caché de vistas y de figuras incluye generacion_historico(): las nuevas particiones entran solas
+    nueva = {k: v for k, v in vista.items() if k not in ('anterior', 'historico_faltante')}
+    nueva['anterior'] = {k: v for k, v in vista.items() if k != 'anterior'}
+    if faltante:
+        nueva['historico_faltante'] = faltante
+    return nueva
+
+
+# CALLBACK: Opciones de los filtros globales (valores presentes en la vista: snapshot + rango)
+@app.callback(
+    [Output(f'filtro-{dim}', 'options') for dim in DIMENSIONES_FILTRO],
+    [Input('vista-storage', 'data')]
+)
+def update_opciones_filtros(vista):
+    # Sin los filtros: elegir un canal no debe dejar sin opciones a las demás dimensiones
+    datos = resolver_vista({k: v for k, v in vista.items() if k != 'filtros'}) if vista else None
+    if datos is None:
+        return [[] for _ in DIMENSIONES_FILTRO]
+    elegidos = vista.get('filtros') or {}
+    return [opciones_filtro(datos['cubo'], dim, elegidos.get(dim) or ()) for dim in DIMENSIONES_FILTRO]
+
+
+# CALLBACK: Aviso de que los indicadores no aplican los filtros globales
+@app.callback(
+    Output('nota-kpis-filtros', 'children'),
+    [Input('vista-storage', 'data')]
+)
+def update_nota_kpis_filtros(vista):
+    if not filtros_de_vista(vista):
+        return ""
+    return "Los indicadores y la conversión de WhatsApp son del mes completo: no aplican los filtros."
 
 
 # CALLBACK para Gráfico Diario (Requisito 9)
 @app.callback(
     Output('graph-diaria-mes', 'figure'),
-    [Input('df-storage', 'data')] 
+    [Input('vista-storage', 'data')] 
 )
-def update_graph_diaria(data):
-    df_mes_en_curso_callback = parse_df_from_store(data)
+@parchear_figura
+@cachear_figura('graph-diaria-mes')
+def update_graph_diaria(vista):
+    cubo = parse_cubo_from_store(vista)
     
     # Si no hay datos, devolvemos una figura vacía con el estilo.
-    if df_mes_en_curso_callback.empty: 
+    if cubo is None: 
         return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos para el Mes")))
     
-    # --- 1. Crear el rango completo de días del mes (CORREGIDO: SIEMPRE HASTA HOY) ---
-    hoy_real = datetime.now()
-    inicio_mes = hoy_real.replace(day=1).date()
-
-    
-    # Crear lista de fechas desde el inicio del mes hasta HOY REAL
-    dates = [inicio_mes + timedelta(days=i) for i in range((hoy_real.date() - inicio_mes).days + 1)]
-    dates_str = [d.strftime('%d-%m') for d in dates]
+    # --- 1. Crear el rango completo de días (por defecto: del inicio del mes hasta HOY REAL) ---
+    desde, hasta = parsear_rango(vista.get('desde'), vista.get('hasta'))
+    dates = dias_en_rango(desde, hasta)
+    # Con rangos de más de un año el día-mes se repetiría: se agrega el año
+    formato_dia = '%d-%m' if (hasta - desde).days < 365 else '%d-%m-%Y'
+    dates_str = [d.strftime(formato_dia) for d in dates]
     
     df_full_month = pd.DataFrame({'dia_mes_str': dates_str})
     
-    # 2. Agrupación y cuenta de datos reales
-    d_real = df_mes_en_curso_callback.groupby('dia_mes_str').size().reset_index(name='conteo')
+    # 2. Conteo por día desde el cubo
+    por_dia = cubo_contar(cubo, 'dia')
+    por_dia = por_dia[por_dia.index.notna()]
+    d_real = pd.DataFrame({'dia_mes_str': por_dia.index.strftime(formato_dia), 'conteo': por_dia.to_numpy()})
     
     # 3. Unir los datos reales con el rango completo y rellenar con 0
     d = df_full_month.merge(d_real, on='dia_mes_str', how='left').fillna(0)
@@ -689,7 +2990,7 @@ def update_graph_diaria(data):
     
     # Crear el gráfico
     fig = px.bar(d, x='dia_mes_str', y='conteo', 
-                 title="Conversaciones Diarias (Mes en Curso)",
+                 title=f"Conversaciones Diarias {sufijo_rango(vista, '(Mes en Curso)')}",
                  color_discrete_sequence=[COLOR_BARRA_AZUL],
                  text_auto=True,
                  category_orders={'dia_mes_str': dates_str}) 
@@ -705,178 +3006,190 @@ def update_graph_diaria(data):
     return aplicar_estilos_grafico(fig)
 
 
+# --- ORDEN Y FORMATO EN EL NAVEGADOR (Callbacks clientside) ---
+# Los gráficos con controles de orden (FIJO/DESC) o de formato (COUNT/PERCENT) se
+# arman una sola vez en el servidor en su versión base y se guardan en un Store.
+# El cambio de opción lo resuelve el navegador (assets/graficos_clientside.js)
+# sobre esa figura, leyendo las indicaciones de layout.meta:
+#   titulos:     título por opción
+#   textinfo:    textinfo de la torta por opción
+#   descendente: opción que ordena las barras de mayor a menor (sin líneas guía)
+#   quitar_ceros: en orden descendente se omiten las barras en 0
+for _grafico, _control in [('graph-canal-torta', 'radio-canal-display'),
+                           ('graph-dia-semana', 'radio-dia-semana-order'),
+                           ('graph-hora-creacion', 'radio-hora-creacion-order'),
+                           ('graph-hora-asignacion', 'radio-hora-asignacion-order')]:
+    app.clientside_callback(
+        ClientsideFunction(namespace='graficos', function_name='aplicar_opcion'),
+        Output(_grafico, 'figure'),
+        [Input(_control, 'value'),
+         Input(f'base-{_grafico}', 'data')]
+    )
+
+
 # CALLBACK para Participación por Canal (Torta/Pie) (Requisito 10)
 @app.callback(
-    Output('graph-canal-torta', 'figure'),
-    [Input('radio-canal-display', 'value'),
-     Input('df-storage', 'data')]
+    Output('base-graph-canal-torta', 'data'),
+    [Input('vista-storage', 'data')]
 )
-def update_graph_canal(display_type, data):
-    df_mes_en_curso_callback = parse_df_from_store(data)
-    if df_mes_en_curso_callback.empty: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Canal")))
-
-    d = df_mes_en_curso_callback.groupby('channelType').size().reset_index(name='conteo')
-    
-    if display_type == 'COUNT':
-        fig = px.pie(d, names='channelType', values='conteo', 
-                     title="Cantidad por Canal",
-                     color='channelType',
-                     color_discrete_map=CANAL_COLORS)
-        fig.update_traces(textinfo='value+label')
-    else:
-        fig = px.pie(d, names='channelType', values='conteo', 
-                     title="% por Canal",
-                     color='channelType',
-                     color_discrete_map=CANAL_COLORS)
-        fig.update_traces(textinfo='percent+label')
+@parchear_figura
+@cachear_figura('graph-canal-torta')
+def update_graph_canal(data):
+    cubo = parse_cubo_from_store(data)
+    if cubo is None: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Canal")))
+
+    d = conteo_a_dataframe(cubo_contar(cubo, 'canal'), 'channelType')
+    
+    fig = px.pie(d, names='channelType', values='conteo', 
+                 title="Cantidad por Canal",
+                 color='channelType',
+                 color_discrete_map=CANAL_COLORS)
+    fig.update_traces(textinfo='value+label')
+    fig.update_layout(meta={
+        'titulos': {'COUNT': "Cantidad por Canal", 'PERCENT': "% por Canal"},
+        'textinfo': {'COUNT': 'value+label', 'PERCENT': 'percent+label'},
+    })
         
     return aplicar_estilos_grafico(fig)
 
 
 # CALLBACK para Día de la Semana (Barras) (Requisito 11)
 @app.callback(
-    Output('graph-dia-semana', 'figure'),
-    [Input('radio-dia-semana-order', 'value'),
-     Input('df-storage', 'data')]
+    Output('base-graph-dia-semana', 'data'),
+    [Input('vista-storage', 'data')]
 )
-def update_graph_dia_semana(order_type, data):
-    df_mes_en_curso_callback = parse_df_from_store(data)
+@parchear_figura
+@cachear_figura('graph-dia-semana')
+def update_graph_dia_semana(data):
+    cubo = parse_cubo_from_store(data)
     # Si no hay datos, devolvemos una figura vacía con el estilo.
-    if df_mes_en_curso_callback.empty: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Día de Semana")))
+    if cubo is None: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Día de Semana")))
     
-    d = df_mes_en_curso_callback.groupby('dia_semana').size().reset_index(name='conteo')
+    d = conteo_a_dataframe(cubo_contar(cubo, 'dia_semana'), 'dia_semana')
     shapes = [] # Para las líneas guía
 
-    if order_type == 'FIJO':
-        # Corrección: reindexar y rellenar con 0 para evitar KeyError
-        d = d.set_index('dia_semana')['conteo'].reindex(ORDEN_DIAS).fillna(0).reset_index(name='conteo')
-        d['dia_semana_es'] = d['dia_semana'].map(NOMBRES_DIAS_ES)
-        order_list = [NOMBRES_DIAS_ES[day] for day in ORDEN_DIAS]
-        
-        fig = px.bar(d, x='dia_semana_es', y='conteo', 
-                     title="Conversaciones por Día (Lunes - Domingo)",
-                     color_discrete_sequence=[COLOR_BARRA_AZUL],
-                     text_auto=True, category_orders={'x': order_list})
-        
-        # --- Lógica de la Línea Guía (Objetivo) ---
-        for i, day in enumerate(ORDEN_DIAS):
-            objetivo = OBJETIVO_SEMANAL.get(day, 0) # Obtiene el objetivo o 0 si no existe
-            shapes.append(
-                go.layout.Shape(
-                    type="line",
-                    xref="x", yref="y",
-                    x0=i - 0.4, # Inicio de la barra
-                    y0=objetivo,
-                    x1=i + 0.4, # Fin de la barra
-                    y1=objetivo,
-                    line=dict(color="#fd7e14", width=2, dash="dot")
-                )
+    # Corrección: reindexar y rellenar con 0 para evitar KeyError
+    d = d.set_index('dia_semana')['conteo'].reindex(ORDEN_DIAS).fillna(0).reset_index(name='conteo')
+    d['dia_semana_es'] = d['dia_semana'].map(NOMBRES_DIAS_ES)
+    order_list = [NOMBRES_DIAS_ES[day] for day in ORDEN_DIAS]
+    
+    fig = px.bar(d, x='dia_semana_es', y='conteo', 
+                 title="Conversaciones por Día (Lunes - Domingo)",
+                 color_discrete_sequence=[COLOR_BARRA_AZUL],
+                 text_auto=True, category_orders={'x': order_list})
+    
+    # --- Lógica de la Línea Guía (Objetivo) ---
+    for i, day in enumerate(ORDEN_DIAS):
+        objetivo = OBJETIVO_SEMANAL.get(day, 0) # Obtiene el objetivo o 0 si no existe
+        shapes.append(
+            go.layout.Shape(
+                type="line",
+                xref="x", yref="y",
+                x0=i - 0.4, # Inicio de la barra
+                y0=objetivo,
+                x1=i + 0.4, # Fin de la barra
+                y1=objetivo,
+                line=dict(color="#fd7e14", width=2, dash="dot")
             )
-
-    else:
-        d['dia_semana_es'] = d['dia_semana'].map(NOMBRES_DIAS_ES)
-        d = d.sort_values('conteo', ascending=False)
-        fig = px.bar(d, x='dia_semana_es', y='conteo', 
-                     title="Conversaciones por Día (Mayor a Menor)",
-                     color_discrete_sequence=[COLOR_BARRA_AZUL],
-                     text_auto=True)
+        )
     
     fig.update_xaxes(title_text="Día de la Semana")
     
-    # Añadir las formas (líneas guía) solo en modo fijo
-    if order_type == 'FIJO':
-        fig.update_layout(shapes=shapes)
+    # Las formas (líneas guía) solo van en modo fijo: el navegador las quita al ordenar
+    fig.update_layout(shapes=shapes, meta={
+        'titulos': {'FIJO': "Conversaciones por Día (Lunes - Domingo)", 'DESC': "Conversaciones por Día (Mayor a Menor)"},
+        'descendente': 'DESC',
+        'quitar_ceros': True, # Como el conteo original: en Mayor a Menor solo los días con datos
+    })
         
     return aplicar_estilos_grafico(fig)
 
 
 # CALLBACK para Hora de Creación (Requisito 12)
 @app.callback(
-    Output('graph-hora-creacion', 'figure'),
-    [Input('radio-hora-creacion-order', 'value'),
-     Input('df-storage', 'data')]
+    Output('base-graph-hora-creacion', 'data'),
+    [Input('vista-storage', 'data')]
 )
-def update_graph_hora_creacion(order_type, data):
-    df_mes_en_curso_callback = parse_df_from_store(data)
-    if df_mes_en_curso_callback.empty: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Hora de Creación")))
+@parchear_figura
+@cachear_figura('graph-hora-creacion')
+def update_graph_hora_creacion(data):
+    cubo = parse_cubo_from_store(data)
+    if cubo is None: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Hora de Creación")))
     
     all_hours = pd.DataFrame({'hora_inicio': range(24)})
-    d = df_mes_en_curso_callback.groupby('hora_inicio').size().reset_index(name='conteo')
+    d = conteo_a_dataframe(cubo_contar(cubo, 'hora'), 'hora_inicio')
     d = all_hours.merge(d, on='hora_inicio', how='left').fillna(0) # Rellenar horas sin datos con 0
 
-    if order_type == 'FIJO':
-        fig = px.bar(d, x='hora_inicio', y='conteo', 
-                     title="Caída de conversaciones (00 - 23hs)",
-                     color_discrete_sequence=[COLOR_BARRA_AZUL],
-                     text_auto=True, category_orders={'x': [str(h) for h in range(24)]})
-    else:
-        d = d.sort_values('conteo', ascending=False)
-        fig = px.bar(d, x='hora_inicio', y='conteo', 
-                     title="Caída de conversaciones (+ → -)",
-                     color_discrete_sequence=[COLOR_BARRA_AZUL],
-                     text_auto=True)
+    fig = px.bar(d, x='hora_inicio', y='conteo', 
+                 title="Caída de conversaciones (00 - 23hs)",
+                 color_discrete_sequence=[COLOR_BARRA_AZUL],
+                 text_auto=True, category_orders={'x': [str(h) for h in range(24)]})
     
     fig.update_xaxes(title_text="Hora del Día", type='category')
+    fig.update_layout(meta={
+        'titulos': {'FIJO': "Caída de conversaciones (00 - 23hs)", 'DESC': "Caída de conversaciones (+ → -)"},
+        'descendente': 'DESC',
+    })
     return aplicar_estilos_grafico(fig)
 
 
 # CALLBACK para Hora de Asignación (Requisito 13 - CORREGIDO)
 @app.callback(
-    Output('graph-hora-asignacion', 'figure'),
-    [Input('radio-hora-asignacion-order', 'value'),
-     Input('df-storage', 'data')]
+    Output('base-graph-hora-asignacion', 'data'),
+    [Input('vista-storage', 'data')]
 )
-def update_graph_hora_asignacion(order_type, data):
-    df_mes_en_curso_callback = parse_df_from_store(data)
-    if df_mes_en_curso_callback.empty: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Hora de Asignación")))
+@parchear_figura
+@cachear_figura('graph-hora-asignacion')
+def update_graph_hora_asignacion(data):
+    cubo = parse_cubo_from_store(data)
+    if cubo is None: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Hora de Asignación")))
     
-    # Usamos la columna 'hora_asignacion' (extraída de 'assigned') para el conteo.
+    # Usamos la dimensión 'hora_asignacion' (extraída de 'assigned') para el conteo.
     # Filtramos solo registros donde hubo asignación (no nulos)
-    df_asignados = df_mes_en_curso_callback.dropna(subset=['hora_asignacion']).copy()
+    por_hora = cubo_contar(cubo, 'hora_asignacion')
+    por_hora = por_hora[por_hora.index.notna()]
     
     # Rango 9 a 18 (incluyendo 9 y 18)
-    d_fil = df_asignados[(df_asignados['hora_asignacion'] >= 9) & (df_asignados['hora_asignacion'] <= 18)].copy()
+    por_hora = por_hora[(por_hora.index >= 9) & (por_hora.index <= 18)]
     
     # Contar las asignaciones por hora
     all_hours = pd.DataFrame({'hora_asignacion': range(9, 19)})
-    d = d_fil.groupby('hora_asignacion').size().reset_index(name='conteo')
+    d = conteo_a_dataframe(por_hora, 'hora_asignacion')
     d = all_hours.merge(d, on='hora_asignacion', how='left').fillna(0) # Rellenar horas sin datos con 0
     d['hora_asignacion'] = d['hora_asignacion'].astype(int)
 
-    if order_type == 'FIJO':
-        fig = px.bar(d, x='hora_asignacion', y='conteo', 
-                     title="Asignación por hora (9 - 18hs)",
-                     color_discrete_sequence=[COLOR_BARRA_AZUL],
-                     text_auto=True, category_orders={'x': [str(h) for h in range(9, 19)]})
-    else:
-        d = d.sort_values('conteo', ascending=False)
-        fig = px.bar(d, x='hora_asignacion', y='conteo', 
-                     title="Asignación por hora (+ → -)",
-                     color_discrete_sequence=[COLOR_BARRA_AZUL],
-                     text_auto=True)
+    fig = px.bar(d, x='hora_asignacion', y='conteo', 
+                 title="Asignación por hora (9 - 18hs)",
+                 color_discrete_sequence=[COLOR_BARRA_AZUL],
+                 text_auto=True, category_orders={'x': [str(h) for h in range(9, 19)]})
     
     fig.update_xaxes(title_text="Hora de Asignación", type='category')
+    fig.update_layout(meta={
+        'titulos': {'FIJO': "Asignación por hora (9 - 18hs)", 'DESC': "Asignación por hora (+ → -)"},
+        'descendente': 'DESC',
+    })
     return aplicar_estilos_grafico(fig)
 
 
 # NUEVO CALLBACK: Gráfico de Estatus (Activas vs. Finalizadas) - Punto 2
 @app.callback(
     Output('graph-status', 'figure'),
-    [Input('df-storage', 'data')]
+    [Input('vista-storage', 'data')]
 )
+@parchear_figura
+@cachear_figura('graph-status')
 def update_graph_status(data):
-    df_mes_en_curso_callback = parse_df_from_store(data)
-    if df_mes_en_curso_callback.empty: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Estatus")))
+    cubo = parse_cubo_from_store(data)
+    if cubo is None: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Estatus")))
 
     # Clasificar el status: Activas (OPEN) vs. Finalizadas (CLOSED)
     # Asumo que OPEN es la única activa y CLOSED/RESOLVED son finalizadas.
     
     # Normalizar los estados (ajusta esto si tus estados son diferentes)
-    df_mes_en_curso_callback['status_group'] = df_mes_en_curso_callback['status'].apply(
-        lambda s: 'ACTIVA' if s in ['OPEN', 'PENDING', 'ASSIGNED'] else 'FINALIZADA'
-    )
-    
-    d = df_mes_en_curso_callback.groupby('status_group').size().reset_index(name='conteo')
+    por_status = cubo_contar(cubo, 'status')
+    status_group = ['ACTIVA' if s in ESTADOS_ACTIVOS else 'FINALIZADA' for s in por_status.index]
+    d = por_status.groupby(status_group).sum()
+    d = d[d > 0].rename_axis('status_group').reset_index(name='conteo')
     
     # Definir colores específicos
     status_colors = {'ACTIVA': '#FFC107', 'FINALIZADA': '#28a745'}
@@ -896,29 +3209,31 @@ def update_graph_status(data):
 @app.callback(
     Output('graph-tipificacion-torta', 'figure'),
     [Input('radio-tipificacion-display', 'value'),
-     Input('df-storage', 'data'),
+     Input('vista-storage', 'data'),
      Input('simulated-date-storage', 'data')]
 )
+@parchear_figura
+@cachear_figura('graph-tipificacion-torta')
 def update_graph_tipificacion_torta(display_period, data, simulated_date):
-    df_mes_en_curso_callback = parse_df_from_store(data)
-    if df_mes_en_curso_callback.empty: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Tipificaciones")))
+    cubo = parse_cubo_from_store(data)
+    if cubo is None: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Tipificaciones")))
     
     title_suffix = ""
     
     if display_period == 'HOY':
         # Filtrar por la fecha simulada para HOY
         hoy_fecha = datetime.strptime(simulated_date, '%Y-%m-%d').date()
-        df_filtered = df_mes_en_curso_callback[df_mes_en_curso_callback['created'].dt.date == hoy_fecha]
+        por_typing = cubo_contar(cubo, 'typing', {'dia': pd.Timestamp(hoy_fecha)})
         title_suffix = f" (Hoy: {hoy_fecha.strftime('%d/%m')})"
     else:
-        df_filtered = df_mes_en_curso_callback
-        title_suffix = " (Acumulado Mes)"
+        por_typing = cubo_contar(cubo, 'typing')
+        title_suffix = " " + sufijo_rango(data, "(Acumulado Mes)")
+    por_typing = por_typing[por_typing > 0]
 
     # Excluimos 'N/A' if there are other values, or if N/A is the only value
-    if df_filtered['typing'].nunique() > 1:
-        d = df_filtered[df_filtered['typing'] != 'N/A'].groupby('typing').size().reset_index(name='conteo')
-    else:
-        d = df_filtered.groupby('typing').size().reset_index(name='conteo')
+    if len(por_typing) > 1:
+        por_typing = por_typing[por_typing.index != 'N/A']
+    d = conteo_a_dataframe(por_typing, 'typing')
 
     fig = px.pie(d, names='typing', values='conteo',
                  title="Tipificaciones (Typing)" + title_suffix,
@@ -932,18 +3247,20 @@ def update_graph_tipificacion_torta(display_period, data, simulated_date):
 # NUEVO CALLBACK: Gráfico de Barras Agrupadas de Ventas (Punto 4)
 @app.callback(
     Output('graph-ventas-agrupadas', 'figure'),
-    [Input('df-storage', 'data')]
+    [Input('vista-storage', 'data')]
 )
+@parchear_figura
+@cachear_figura('graph-ventas-agrupadas')
 def update_graph_ventas_agrupadas(data):
-    df_mes_en_curso_callback = parse_df_from_store(data)
-    if df_mes_en_curso_callback.empty: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Ventas Agrupadas")))
+    cubo = parse_cubo_from_store(data)
+    if cubo is None: return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Ventas Agrupadas")))
 
     # Filtrar solo las 3 tipificaciones de interés
     tipificaciones_clave = ['VENTA', 'VENTA A CONFIRMAR', 'VENTA PERDIDA']
-    df_ventas = df_mes_en_curso_callback[df_mes_en_curso_callback['typing'].isin(tipificaciones_clave)].copy()
+    por_typing = cubo_contar(cubo, 'typing')
     
     # Contar la ocurrencia de cada tipificación
-    d = df_ventas.groupby('typing').size().reset_index(name='conteo')
+    d = conteo_a_dataframe(por_typing[por_typing.index.isin(tipificaciones_clave) & (por_typing > 0)], 'typing')
     
     # Asegurar que las 3 tipificaciones estén presentes, incluso con conteo 0
     df_full = pd.DataFrame({'typing': tipificaciones_clave})
@@ -969,7 +3286,192 @@ def update_graph_ventas_agrupadas(data):
 # ... (El resto de las funciones de utilidad y el main se mantienen sin cambios) ...
 
 
+# CALLBACK: Ranking por Punto de Venta (conversaciones vs. objetivo acumulado de un PV)
+@app.callback(
+    Output('graph-ranking-pv', 'figure'),
+    [Input('vista-storage', 'data')]
+)
+@parchear_figura
+@cachear_figura('graph-ranking-pv')
+def update_graph_ranking_pv(data):
+    datos = resolver_vista(data)
+    if datos is None or datos['ranking']['pv'].empty:
+        return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Puntos de Venta")))
+
+    d = datos['ranking']['pv'].copy()
+    objetivo = objetivo_pv_en_rango(datos['desde'], datos['hasta'])
+    d['cumplimiento'] = d['conversaciones'] * 100.0 / objetivo if objetivo else 0.0
+
+    fig = px.bar(d, x='PuntoDeVenta', y='conversaciones',
+                 title=f"Conversaciones por Punto de Venta vs. Objetivo Acumulado {sufijo_rango(data, '(Mes en Curso)')}",
+                 color_discrete_sequence=[COLOR_BARRA_AZUL],
+                 text_auto=True,
+                 hover_data={'ventas': True, 'contactos': True, 'conversion': ':.1f', 'cumplimiento': ':.0f'},
+                 labels={'PuntoDeVenta': 'Punto de Venta', 'conversaciones': 'Conversaciones', 'ventas': 'Ventas',
+                         'contactos': 'Contactos Únicos', 'conversion': 'Conversión (%)', 'cumplimiento': 'Cumplimiento (%)'})
+
+    # Línea guía: objetivo acumulado de un Punto de Venta en el período
+    fig.update_layout(shapes=[
+        go.layout.Shape(type="line", xref="paper", yref="y", x0=0, x1=1, y0=objetivo, y1=objetivo,
+                        line=dict(color="#fd7e14", width=2, dash="dot"))
+    ])
+    fig.update_xaxes(title_text="Punto de Venta", type='category')
+    fig.update_yaxes(title_text="Conversaciones")
+    return aplicar_estilos_grafico(fig)
+
+
+# CALLBACK: Tiempos de asignación / primera respuesta (p50, p90 y p99 desde los sketches diarios)
+@app.callback(
+    Output('graph-latencias', 'figure'),
+    [Input('radio-latencia-metrica', 'value'),
+     Input('radio-latencia-dimension', 'value'),
+     Input('vista-storage', 'data')]
+)
+@parchear_figura
+@cachear_figura('graph-latencias')
+def update_graph_latencias(metrica, dimension, data):
+    nombre_metrica = {v: k for k, v in OPCIONES_METRICA_LATENCIA.items()}.get(metrica, metrica)
+    nombre_dimension = {v: k for k, v in OPCIONES_DIMENSION_LATENCIA.items()}.get(dimension, dimension)
+    datos = resolver_vista(data)
+    if datos is None or not latencias_de_vista(datos):
+        return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title="Sin Datos de Tiempos de Respuesta")))
+
+    etiquetas, conteos = combinar_sketches(datos['latencias'].values(), metrica, dimension)
+    percentiles, total = percentiles_sketch(conteos)
+    d = pd.DataFrame({'valor': etiquetas, 'conversaciones': total, **{p: percentiles[p] / 60 for p in PERCENTILES_LATENCIA}})
+    d = d[d['conversaciones'] > 0]
+    if d.empty:
+        return go.Figure(layout=aplicar_estilos_grafico(go.Layout(title=f"Sin Datos de Tiempo hasta la {nombre_metrica}")))
+
+    if dimension == 'hora':
+        d = d.sort_values('valor')
+        d['valor'] = d['valor'].map(lambda h: f"{int(h):02d}")
+    elif dimension == 'dia_semana':
+        d = d.set_index('valor').reindex([dia for dia in ORDEN_DIAS if dia in set(d['valor'])]).reset_index()
+        d['valor'] = d['valor'].map(NOMBRES_DIAS_ES)
+    else:
+        d = d.sort_values('valor', key=lambda v: v.astype(str))
+
+    fig = go.Figure([go.Bar(name=f"p{p}", x=d['valor'], y=d[p].round(1), marker_color=PERCENTIL_COLORS[p],
+                            customdata=d['conversaciones'],
+                            hovertemplate=f"%{{x}}<br>p{p}: %{{y}} min<br>%{{customdata}} conversaciones<extra></extra>")
+                     for p in PERCENTILES_LATENCIA])
+    fig.update_layout(barmode='group',
+                      title=f"Tiempo hasta la {nombre_metrica} por {nombre_dimension} (p50 / p90 / p99) {sufijo_rango(data, '(Mes en Curso)')}")
+    fig.update_xaxes(title_text=nombre_dimension, type='category')
+    fig.update_yaxes(title_text="Minutos")
+    return aplicar_estilos_grafico(fig)
+
+
+# CALLBACK: Ranking de Agentes (tabla con orden en el navegador: son decenas de filas)
+@app.callback(
+    [Output('tabla-ranking-agentes', 'data'),
+     Output('titulo-ranking-agentes', 'children')],
+    [Input('vista-storage', 'data')]
+)
+def update_tabla_ranking_agentes(data):
+    titulo = f"Ranking de Agentes {sufijo_rango(data, '(Mes en Curso)')}"
+    datos = resolver_vista(data)
+    if datos is None:
+        return [], titulo
+    agentes = datos['ranking']['agentes'].round({'conversion': 1})
+    return agentes[['agente', 'PuntoDeVenta'] + COLUMNAS_RANKING].to_dict('records'), titulo
+
+
+# CALLBACK: Detalle de conversaciones (solo viaja la página visible)
+@app.callback(
+    [Output('tabla-detalle', 'data'),
+     Output('tabla-detalle', 'page_count'),
+     Output('titulo-tabla-detalle', 'children')],
+    [Input('vista-storage', 'data'),
+     Input('tabla-detalle', 'page_current'),
+     Input('tabla-detalle', 'page_size'),
+     Input('tabla-detalle', 'sort_by'),
+     Input('tabla-detalle', 'filter_query')]
+)
+def update_tabla_detalle(data, page_current, page_size, sort_by, filter_query):
+    data = vista_vigente(data) # Las posiciones se cachean por la clave de la vista
+    datos = resolver_vista(data)
+    if datos is None or datos['df'].empty:
+        return [], 1, "Detalle de Conversaciones"
+    df = datos['df']
+    posiciones = posiciones_detalle(data, df, sort_by, filter_query)
+    tam_pagina = page_size or TAMANO_PAGINA_DETALLE
+    paginas = max(1, -(-len(posiciones) // tam_pagina))
+    pagina = min(page_current or 0, paginas - 1)
+    titulo = f"Detalle de Conversaciones {sufijo_rango(data, '(Mes en Curso)')}: {len(posiciones):,} conversaciones"
+    return pagina_detalle(df, posiciones, pagina, tam_pagina), paginas, titulo
+
+
+# CALLBACK: Enlaces de exportación con el rango de fechas y los filtros elegidos
+@app.callback(
+    [Output('enlace-exportar-csv', 'href'),
+     Output('enlace-exportar-parquet', 'href')],
+    [Input('vista-storage', 'data')]
+)
+def update_enlaces_exportar(data):
+    return enlace_exportar(data, 'csv'), enlace_exportar(data, 'parquet')
+
+
+# -------------------------------------------------------------------
+# ARRANQUE (Fábrica de la app para gunicorn --preload)
+# -------------------------------------------------------------------
+# Importar el módulo solo define la app: no lee el snapshot ni arranca hilos.
+# crear_app() deja todo listo para el primer request (snapshot en memoria, figuras
+# de la vista por defecto en la caché y la inicialización de Dash). Con
+# --preload corre una vez en el master y los workers lo heredan por copy-on-write;
+# cada worker arranca después su propio hilo de refresco (tras_fork, ver gunicorn.conf.py).
+
+def precalentar_figuras(snap):
+    """ Deja en la caché las figuras que pide cualquier navegador al abrir el tablero (mes en curso). """
+    vista = update_vista(clave_snapshot(snap), None, None)
+    for grafico in (update_graph_diaria, update_graph_canal, update_graph_dia_semana, update_graph_hora_creacion,
+                    update_graph_hora_asignacion, update_graph_status, update_graph_ventas_agrupadas,
+                    update_graph_ranking_pv):
+        grafico(vista)
+    # 'FIJO' es el valor inicial de control_orden
+    update_graph_tipificacion_torta('FIJO', vista, snap['datos']['fecha_simulada'].strftime('%Y-%m-%d'))
+    update_graph_latencias('asignacion', 'hora', vista)
+
+def crear_app():
+    """
+    Fábrica para gunicorn ('dashboard_v1:crear_app()'). Si no hay snapshot en disco hace
+    la primera carga acá, una sola vez para todos los workers. No arranca hilos: no
+    sobreviven al fork.
+    """
+    t_inicio = time.perf_counter()
+    snap = obtener_snapshot()
+    if snap is None:
+        snap = refrescar_snapshot_compartido()
+    if snap is not None and not snap['datos']['df'].empty:
+        precalentar_figuras(snap)
+    # El primer request de Dash registra los Callbacks y arma el índice: mejor en el master
+    cliente = server.test_client()
+    for ruta in ('/', '/_dash-layout', '/_dash-dependencies'):
+        cliente.get(ruta)
+    duracion = time.perf_counter() - t_inicio
+    fijar('dashboard_arranque_segundos', duracion)
+    print(f"App lista en {duracion:.2f}s (snapshot: {snap['version'] if snap else 'ninguno'}).")
+    return server
+
+def tras_fork():
+    """
+    Llamar en cada worker recién creado (post_fork de gunicorn). Descarta la sesión HTTP del
+    master (sus sockets no se comparten entre procesos), pone en cero los contadores (la
+    carga inicial del master no debe sumarse una vez por worker) y arranca el hilo de refresco.
+    """
+    global _http_session
+    with _http_session_lock:
+        _http_session = None
+    with _metricas_lock:
+        _contadores.clear()
+        _histogramas.clear()
+    iniciar_refresco_en_fondo()
+
+
 if __name__ == '__main__':
     print("Iniciando servidor local...")
     # Asegúrate de haber ejecutado get_yesterday_sample.py antes de este paso para tener datos.
+    crear_app()
+    iniciar_refresco_en_fondo()
     app.run(debug=True, port=8050)
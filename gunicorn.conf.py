@@ -0,0 +1,30 @@
+"""
+Configuración de gunicorn para el tablero (se toma sola al correr gunicorn desde la raíz):
+
+    gunicorn "dashboard_v1:crear_app()"
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+wsgi_app = "dashboard_v1:crear_app()"
+
+# Imports, snapshot y figuras de arranque una sola vez en el master (crear_app);
+# los workers los heredan por copy-on-write en lugar de repetirlos cada uno
+preload_app = True
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+
+# Cada navegador con el tablero abierto mantiene un stream /eventos que ocupa un hilo
+# (como mucho la mitad de los hilos; el resto sondea, ver SSE_MAX_CONEXIONES)
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+timeout = 120
+
+def when_ready(server):
+    # Lo cargado en el master queda fuera del GC: recorrerlo en los workers copiaría sus páginas
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Los hilos del master no pasan al worker: cada uno arranca su refresco en segundo plano
+    import dashboard_v1
+    dashboard_v1.tras_fork()